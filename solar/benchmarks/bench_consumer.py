@@ -0,0 +1,165 @@
+# benchmarks/bench_consumer.py
+"""
+Throughput of the per-message, batched and asyncio inverter consumer loops.
+
+A stand-in consumer serves pre-produced JSON messages (minutes of
+inverter_min.csv with increasing timestamps) through the ``poll`` and
+``consume`` calls of confluent_kafka's Consumer. The loops run the real
+alert, WebSocket, live-buffer, derived-KPI and sample code on an in-memory
+channel layer and a scratch SQLite file.
+
+Usage (from the solar/ directory):
+    python benchmarks/bench_consumer.py [--messages 20000]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_samples import setup_django  # noqa: E402
+
+
+class StandInMessage:
+    def __init__(self, topic, value, offset):
+        self._topic = topic
+        self._value = value
+        self._offset = offset
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+
+class StandInConsumer:
+    """Serves a fixed list of encoded messages; sets ``stop`` once they run out."""
+
+    def __init__(self, topic, payloads, stop):
+        self.messages = [StandInMessage(topic, value, i) for i, value in enumerate(payloads)]
+        self.position = 0
+        self.stop = stop
+
+    def consume(self, num_messages=1, timeout=-1):
+        batch = self.messages[self.position:self.position + num_messages]
+        self.position += len(batch)
+        if not batch:
+            self.stop.set()
+        return batch
+
+    def poll(self, timeout=None):
+        batch = self.consume(1, timeout)
+        return batch[0] if batch else None
+
+    def close(self):
+        pass
+
+
+def produce(count, first):
+    """``count`` encoded inverter messages from minute ``first`` on, cycling through inverter_min.csv."""
+    from data_api.datasets import DATASETS
+
+    df = pd.read_csv(DATASETS['inverter_min']['source'])
+    records = df.drop(columns='ds').to_dict('records')
+    return [
+        json.dumps({'ds': f'{first + pd.Timedelta(minutes=i):%m/%d/%y %H:%M}', **records[i % len(records)]}).encode()
+        for i in range(count)
+    ]
+
+
+def legacy_loop(consumer, stop):
+    """The loop run_kafka_consumer ran before batching: poll, decode, check and send one message at a time."""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from data_api import live, samples
+    from derived.engine import engine as derived_engine
+    from kafka_app.consumers import AlertManager
+
+    while not stop.is_set():
+        msg = consumer.poll(1.0)
+        if msg is None:
+            continue
+        data = json.loads(msg.value().decode('utf-8'))
+        print(f"Received message: {data}")
+        out_of_range = AlertManager.check_out_of_range(data)
+        if out_of_range:
+            AlertManager.log_to_csv(data, out_of_range)
+            AlertManager.send_websocket_alert(out_of_range, data)
+        print(f"Processing message: {data}")
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)('kafka_group', {'type': 'send_kafka_message', 'message': data})
+        live.append('inverter', data)
+        derived_engine.add_inverter(data)
+        samples.record_inverter(data)
+
+
+def timed_run(payloads, run):
+    """Messages per second of ``run(consumer, stop)`` over ``payloads``, printing to /dev/null."""
+    from data_api import samples
+    from kafka_app.tasks import stream_topics
+
+    stop = threading.Event()
+    consumer = StandInConsumer(next(iter(stream_topics(['inverter']))), payloads, stop)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        run(consumer, stop)
+        samples.writer.flush()
+        elapsed = time.perf_counter() - start
+    return len(payloads) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--legacy-messages', type=int, default=2000, help="Messages for the per-message loop.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        from django.conf import settings
+        from kafka_app import consumers, pipeline, tasks
+
+        settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        # Keep the alerts out of the real log
+        consumers.CSV_LOG_FILE = os.path.join(tmp, 'alert_logs.csv')
+
+        # Every run gets later minutes than the last, so no reading is dropped as stale
+        first = pd.Timestamp('2030-01-01')
+
+        def later(count):
+            nonlocal first
+            payloads = produce(count, first)
+            first += pd.Timedelta(minutes=count)
+            return payloads
+
+        # Load the inverter snapshot the live buffer is sized from before timing
+        timed_run(later(10), legacy_loop)
+
+        rate = timed_run(later(args.legacy_messages), legacy_loop)
+        print(f"{'per message':<22} {rate:>10.0f} msgs/s")
+        for batch_size in (10, 100, 500, 2000):
+            rate = timed_run(later(args.messages), lambda consumer, stop: tasks.consume_batches(
+                consumer, tasks.stream_topics(['inverter']), stop, batch_size=batch_size, linger=0.1))
+            print(f"{f'batches of {batch_size}':<22} {rate:>10.0f} msgs/s")
+        rate = timed_run(later(args.messages), lambda consumer, stop: asyncio.run(
+            pipeline.consume_streams(['inverter'], stop, consumer)))
+        print(f"{'asyncio pipeline':<22} {rate:>10.0f} msgs/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_formats.py
+"""
+Compare payload size and build + encode time of the data view formats on
+synthetic minute data.
+
+Usage (from the solar/ directory):
+    python benchmarks/bench_formats.py [--days 30] [--repeat 5]
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_series import COLUMN, FEATURE, synthetic_minute_frame  # noqa: E402
+from data_api import formats  # noqa: E402
+from data_api.formats import columnar_series, encode_json  # noqa: E402
+from data_api.series import clean_values, group_records  # noqa: E402
+
+
+def payloads(df):
+    """Build + encode functions for every format, each returning the response body."""
+    ds = df['ds'].to_numpy(dtype='datetime64[ns]')
+    raw = df[COLUMN].to_numpy()
+
+    def grouped():
+        return {'data': group_records(ds, {FEATURE: clean_values(raw)}, 'minute')}
+
+    def columnar():
+        values = clean_values(raw)
+        return {'data': columnar_series(ds, {FEATURE: values}, '1m', missing={FEATURE: np.isnan(raw)})}
+
+    cases = {
+        'json (JsonResponse)': lambda: json.dumps(grouped(), cls=DjangoJSONEncoder).encode(),
+        'json': lambda: encode_json(grouped()),
+        'json (orjson)': lambda: encode_json(grouped(), fast=True),
+        'columnar': lambda: encode_json(columnar()),
+    }
+    if formats.msgpack is not None:
+        cases['msgpack'] = lambda: formats.encode_msgpack(columnar())
+    return cases
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - start)
+    return body, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    df = synthetic_minute_frame(args.days)
+    print(f"{len(df):,} minute rows ({args.days} days)")
+    if formats.orjson is None:
+        print("orjson is not installed; 'json (orjson)' falls back to json")
+    if formats.msgpack is None:
+        print("msgpack is not installed; skipping format=msgpack")
+
+    print(f"{'format':<20} {'bytes':>12} {'gzip bytes':>12} {'build+encode':>14}")
+    baseline = None
+    for name, func in payloads(df).items():
+        body, seconds = best_of(func, args.repeat)
+        baseline = baseline or (len(body), seconds)
+        print(f"{name:<20} {len(body):>12,} {len(gzip.compress(body)):>12,} {seconds * 1000:>11.1f} ms"
+              f"  ({baseline[0] / len(body):.1f}x smaller, {baseline[1] / seconds:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
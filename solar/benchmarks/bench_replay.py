@@ -0,0 +1,155 @@
+# benchmarks/bench_replay.py
+"""
+End-to-end throughput and latency of the streaming path on a replay of the minute CSVs.
+
+A kafka_app.sources.ReplaySource replays inverter_min.csv, inv_min_2.csv
+and Weather_min.csv as JSON messages, --speed times faster than real time
+(0 for as fast as they are consumed), into the real consumer loop: the
+asyncio pipeline, or the batched loop of kafka_app.tasks with --threaded.
+Alerts, live buffers, derived KPIs and samples run as in production on a
+scratch SQLite file, and one client per route of kafka_app.routing
+receives the messages from the real WebSocket consumers over an
+in-memory channel layer. Reports messages per second and the p50/p99
+latency from a message's creation to its WebSocket send.
+
+Usage (from the solar/ directory):
+    python benchmarks/bench_replay.py [--speed 0] [--messages 20000] [--threaded]
+    python benchmarks/bench_replay.py --speed 60 --duration 120
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_samples import setup_django  # noqa: E402
+
+# WebSocket route of each stream's group, and of the alerts
+STREAM_PATHS = {'inverter': '/ws/kafka/', 'weather': '/ws/kafka2/'}
+ALERTS_PATH = '/ws/alerts/'
+
+
+async def connect(path):
+    """A client connected to the WebSocket consumer routed at ``path``."""
+    from asgiref.testing import ApplicationCommunicator
+    from channels.routing import URLRouter
+    from kafka_app.routing import websocket_urlpatterns
+
+    client = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+        'type': 'websocket', 'path': path, 'headers': [], 'query_string': b'', 'subprotocols': [],
+    })
+    await client.send_input({'type': 'websocket.connect'})
+    event = await client.receive_output(timeout=10)
+    if event['type'] != 'websocket.accept':
+        raise RuntimeError(f"{path} refused the connection: {event}")
+    return client
+
+
+async def listen(client, sent, created=None):
+    """Record the time of every frame ``client`` is sent, with its latency if ``created`` queues the creation times."""
+    while True:
+        await client.receive_output(timeout=3600)
+        now = time.time()
+        # One frame per message, in the order they were created
+        sent.append((now, now - created.popleft() if created is not None else None))
+
+
+async def replay(source, names, threaded, duration):
+    """Run the consumer on ``source`` until every message is sent or ``duration`` is up; returns (sends, alerts, unsent)."""
+    from asgiref.sync import sync_to_async
+    from data_api import live
+    from kafka_app import pipeline, tasks
+
+    topics = tasks.stream_topics(names)
+    created = {topic: deque() for topic in topics}
+    source.on_create = lambda topic, at: created[topic].append(at)
+    source.subscribe(list(topics))
+    for stream in topics.values():
+        # Load the snapshots the live buffers are sized from before the clock starts
+        live.live_buffer(stream.name)
+
+    sends, alerts, clients, listeners = [], [], [], []
+    for topic, stream in topics.items():
+        clients.append(await connect(STREAM_PATHS[stream.name]))
+        listeners.append(asyncio.create_task(listen(clients[-1], sends, created[topic])))
+    clients.append(await connect(ALERTS_PATH))
+    listeners.append(asyncio.create_task(listen(clients[-1], alerts)))
+
+    stop = threading.Event()
+    if threaded:
+        # In a worker thread whose async_to_sync calls run on this loop, where the clients are
+        consumer = asyncio.ensure_future(sync_to_async(tasks.run_consumer, thread_sensitive=False)(names, stop, source))
+    else:
+        consumer = asyncio.ensure_future(pipeline.consume_streams(names, stop, source))
+    deadline = time.time() + duration if duration else float('inf')
+    while not consumer.done() and time.time() < deadline:
+        if source.exhausted and not any(created.values()):
+            break
+        await asyncio.sleep(0.05)
+    stop.set()
+    await consumer
+    # The alerts of the last batch are sent alongside its messages
+    await asyncio.sleep(0.1)
+    for listener in listeners:
+        listener.cancel()
+    for client in clients:
+        await client.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await client.wait(timeout=10)
+    return sends, alerts, sum(len(queue) for queue in created.values())
+
+
+def report(label, started, sends, alerts, unsent):
+    if not sends:
+        print(f"{label}: no message reached the WebSocket clients")
+        return
+    times = np.array([at for at, _ in sends])
+    latencies = np.array([latency for _, latency in sends]) * 1000
+    elapsed = times.max() - started
+    print(f"{label}: {len(sends)} messages sent in {elapsed:.1f} s ({unsent} created but not sent)")
+    print(f"  throughput     {len(sends) / elapsed:>10.0f} msgs/s")
+    print(f"  latency p50    {np.percentile(latencies, 50):>10.1f} ms")
+    print(f"  latency p99    {np.percentile(latencies, 99):>10.1f} ms")
+    print(f"  latency max    {latencies.max():>10.1f} ms")
+    print(f"  alerts sent    {len(alerts):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help="Times faster than real time: 1, 60, ... or 0 for as fast as possible.")
+    parser.add_argument('--messages', type=int, default=20000, help="Replay only the first N messages.")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds.")
+    parser.add_argument('--streams', nargs='+', default=None, help="Streams to replay (default: all).")
+    parser.add_argument('--threaded', action='store_true', help="Run the batched loop instead of the asyncio pipeline.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        from django.conf import settings
+        from kafka_app import consumers, tasks
+        from kafka_app.sources import ReplaySource, replay_messages
+
+        settings.CHANNEL_LAYERS = {'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 100000},
+        }}
+        # Keep the alerts out of the real log
+        consumers.CSV_LOG_FILE = os.path.join(tmp, 'alert_logs.csv')
+
+        messages = replay_messages(tasks.stream_topics(args.streams))[:args.messages]
+        source = ReplaySource(messages, speed=args.speed)
+        sends, alerts, unsent = asyncio.run(replay(source, args.streams, args.threaded, args.duration))
+
+        speed = f'{args.speed:g}x' if args.speed > 0 else 'full speed'
+        loop = 'batched loop' if args.threaded else 'asyncio pipeline'
+        report(f"{len(messages)} messages replayed at {speed} through the {loop}", source.started, sends, alerts, unsent)
+
+
+if __name__ == '__main__':
+    main()
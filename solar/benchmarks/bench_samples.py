@@ -0,0 +1,128 @@
+# benchmarks/bench_samples.py
+"""
+Ingest rate and range-scan time of the sample tables on a scratch SQLite file.
+
+Writes synthetic inverter minutes one ``save()`` per row (the naive way) and
+through data_api.samples.SampleWriter at a few batch sizes, then times
+sample_range over random windows of one inverter.
+
+Usage (from the solar/ directory):
+    python benchmarks/bench_samples.py [--days 30] [--inverters 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_series import synthetic_minute_frame  # noqa: E402
+
+
+def setup_django(db_path):
+    """Point the default database at ``db_path``, set Django up and migrate the sample tables."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'solar.settings')
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+    call_command('migrate', 'data_api', verbosity=0)
+
+
+def synthetic_samples(days, inverters):
+    """InverterSample rows of ``inverters`` inverters over ``days`` of minutes, in arrival order."""
+    from data_api.models import InverterSample
+    from data_api.samples import to_unix
+
+    df = synthetic_minute_frame(days)
+    ts = to_unix(df['ds'].to_numpy()).tolist()
+    power = df.iloc[:, 1].to_numpy()
+    rows = []
+    for i, t in enumerate(ts):
+        for j in range(inverters):
+            value = power[i] * (1 + j / 100)
+            rows.append(InverterSample(
+                device=f'{j + 1}.1', ts=t, active_power=None if np.isnan(value) else float(value),
+                dc_power=None if np.isnan(value) else float(value) * 1.02,
+            ))
+    return rows
+
+
+def clear(model):
+    model.objects.all().delete()
+
+
+def bench_save(rows):
+    """Rows per second saving one row per autocommitted statement."""
+    start = time.perf_counter()
+    for row in rows:
+        row.pk = None
+        row.save(force_insert=True)
+    return len(rows) / (time.perf_counter() - start)
+
+
+def bench_writer(rows, batch_size):
+    """Rows per second through a SampleWriter writing ``batch_size`` rows per transaction."""
+    from data_api.samples import SampleWriter
+
+    writer = SampleWriter(batch_size=batch_size, linger=float('inf'))
+    model = type(rows[0])
+    start = time.perf_counter()
+    for row in rows:
+        row.pk = None
+        writer.add(model, [row])
+    writer.flush()
+    return len(rows) / (time.perf_counter() - start)
+
+
+def bench_ranges(model, device, days, window_hours, queries, seed=0):
+    """Median seconds and rows per scan of ``queries`` random ``window_hours`` ranges of one device."""
+    from data_api.samples import sample_range
+
+    rng = np.random.default_rng(seed)
+    first = np.datetime64('2024-01-01T00:00', 'ns')
+    span = max(days * 24 - window_hours, 1)
+    times, sizes = [], []
+    for _ in range(queries):
+        start = first + np.timedelta64(int(rng.integers(span)), 'h')
+        started = time.perf_counter()
+        ds, values = sample_range(model, device, start, start + np.timedelta64(window_hours, 'h'))
+        times.append(time.perf_counter() - started)
+        sizes.append(len(ds))
+    return float(np.median(times)), int(np.median(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--inverters', type=int, default=8)
+    parser.add_argument('--save-rows', type=int, default=5000, help="Rows for the one-save-per-row baseline.")
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        from data_api.models import InverterSample
+
+        rows = synthetic_samples(args.days, args.inverters)
+        print(f"{len(rows)} inverter samples ({args.days} days x {args.inverters} inverters)")
+
+        rate = bench_save(rows[:args.save_rows])
+        print(f"  save() per row      {rate:>10.0f} rows/s")
+        for batch_size in (100, 1000, 5000):
+            clear(InverterSample)
+            rate = bench_writer(rows, batch_size)
+            print(f"  batches of {batch_size:<5}    {rate:>10.0f} rows/s")
+
+        for hours in (1, 24, 24 * 7):
+            seconds, size = bench_ranges(InverterSample, '1.1', args.days, hours, args.queries)
+            print(f"  {hours:>4}h range scan   {seconds * 1000:>8.2f} ms  ({size} rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_series.py
+"""
+Compare the old iterrows response builder with data_api.series on synthetic
+minute data.
+
+Usage (from the solar/ directory):
+    python benchmarks/bench_series.py [--days 365]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_api.series import clean_values, group_records  # noqa: E402
+
+FEATURE = 'active_power'
+COLUMN = 'INVERTER1.1_Active Power_Kw'
+
+
+def synthetic_minute_frame(days, seed=0):
+    """A clear-sky-ish power curve with noise, negatives and gaps, one row per minute."""
+    rng = np.random.default_rng(seed)
+    ds = pd.date_range('2024-01-01', periods=days * 24 * 60, freq='min')
+    hour = ds.hour.to_numpy() + ds.minute.to_numpy() / 60
+    power = 70 * np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None) + rng.normal(0, 2, len(ds))
+    power[rng.random(len(ds)) < 0.001] = np.nan
+    return pd.DataFrame({'ds': ds, COLUMN: power})
+
+
+def legacy_minute(df_data):
+    """The per-row builder generalized_data_api used before data_api.series."""
+    data = {}
+    for _, row in df_data.iterrows():
+        hour_key = row['ds'].strftime(f'%Y-%m-%d %H:00')
+        if hour_key not in data:
+            data[hour_key] = []
+        value = max(row[COLUMN], 0) if pd.notna(row[COLUMN]) else 0
+        data[hour_key].append({
+            'timestamp': row['ds'].strftime(f'%Y-%m-%d %H:%M:%S'),
+            FEATURE: value
+        })
+    return data
+
+
+def vectorized_minute(df_data):
+    values = clean_values(df_data[COLUMN].to_numpy())
+    return group_records(df_data['ds'], {FEATURE: values}, 'minute')
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    df = synthetic_minute_frame(args.days)
+    print(f"{len(df):,} minute rows ({args.days} days)")
+
+    new, new_s = timed(vectorized_minute, df)
+    old, old_s = timed(legacy_minute, df)
+
+    identical = json.dumps(old) == json.dumps(new)
+    print(f"iterrows:   {old_s:8.3f} s")
+    print(f"vectorized: {new_s:8.3f} s")
+    print(f"speedup:    {old_s / new_s:8.1f}x")
+    print(f"identical output: {identical}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# data_api/cache.py
+"""
+In-process response cache with strong ETags for the read-only GET views.
+
+Entries are keyed by (view, query string, Accept header, data version),
+where the data version comes from the dataset snapshot or file the view
+reads. A new snapshot or a rewritten analytics.json therefore never hits an
+old entry, and stale entries for that view are dropped as soon as the new
+version is stored. The cache is an LRU bounded by the total size of the
+cached bodies.
+
+The ETag is a hash of the body. A request whose If-None-Match matches the
+cached entry gets a 304 straight from the cache, without running the view
+or serializing anything.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    """LRU map of cache key -> (body, content type, etag) bounded by total body bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, content, content_type):
+        """Store a body under ``key`` and return its entry; oversized bodies are not kept."""
+        entry = (content, content_type, f'"{hashlib.sha1(content).hexdigest()}"')
+        if len(content) > self.max_bytes:
+            return entry
+        view, version = key[0], key[-1]
+        with self._lock:
+            if self._versions.get(view) != version:
+                # The view's data changed: nothing cached for older versions is valid
+                self._discard(lambda other: other[0] == view and other[-1] != version)
+                self._versions[view] = version
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key)[0])
+            self._entries[key] = entry
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                _, (old_content, _, _) = self._entries.popitem(last=False)
+                self.size -= len(old_content)
+        return entry
+
+    def invalidate(self, view=None):
+        """Drop every entry, or only those of one view (a view function or its cache name)."""
+        if callable(view):
+            view = view_name(view)
+        with self._lock:
+            self._discard(lambda key: view is None or key[0] == view)
+            if view is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(view, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _discard(self, predicate):
+        for key in [key for key in self._entries if predicate(key)]:
+            self.size -= len(self._entries.pop(key)[0])
+
+
+def view_name(view):
+    """Cache name of a view function."""
+    return f'{view.__module__}.{view.__name__}'
+
+
+response_cache = ResponseCache(getattr(settings, 'RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def build_response(entry, request, state):
+    content, content_type, etag = entry
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept'
+    # Clients may keep the body but must revalidate it with If-None-Match
+    response['Cache-Control'] = 'no-cache'
+    response['X-Cache'] = state
+    return response
+
+
+def cached_response(version):
+    """
+    Cache a GET view's successful responses.
+
+    ``version(request)`` returns the version of the data the view reads;
+    it is part of the key, so changing the data invalidates the entries.
+    It is read again once the view has returned: if the data was reloaded
+    meanwhile, the view may have served either version, so its response is
+    sent but not cached.
+    """
+    def decorator(view):
+        name = view_name(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            served = version(request)
+            key = (
+                name,
+                tuple((param, tuple(values)) for param, values in sorted(request.GET.lists())),
+                request.META.get('HTTP_ACCEPT', ''),
+                served,
+            )
+            entry = response_cache.get(key)
+            if entry is not None:
+                return build_response(entry, request, 'HIT')
+
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or version(request) != served:
+                return response
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            entry = response_cache.put(key, response.content, response['Content-Type'])
+            return build_response(entry, request, 'MISS')
+
+        return wrapper
+    return decorator
@@ -0,0 +1,75 @@
+# data_api/current.py
+"""
+O(1) "current value" lookups.
+
+The datasets are replayed against the wall clock: the value shown for now
+is the latest reading taken at the same IST minute of the day. A
+MinuteIndex maps each of the 1440 minutes of a day to the row of the 1m
+rollup holding that reading. It is built once per snapshot in one
+vectorized pass, so a lookup is an array index rather than formatting and
+comparing every timestamp of the dataset.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from .series import IST, clean_values, format_datetimes, parse_list
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def minute_of_day(ds):
+    """Minutes since midnight of every timestamp in a datetime64 array."""
+    ds = np.asarray(ds, dtype='datetime64[m]')
+    return (ds - ds.astype('datetime64[D]')).astype(np.int64)
+
+
+class MinuteIndex:
+    """Row of the latest reading for every minute of the day (-1 where there is none)."""
+
+    def __init__(self, ds):
+        minutes = minute_of_day(ds)
+        self.rows = np.full(MINUTES_PER_DAY, -1, dtype=np.int64)
+        # Rows are time-sorted: the first hit in reverse order is the latest
+        found, last = np.unique(minutes[::-1], return_index=True)
+        self.rows[found] = len(minutes) - 1 - last
+
+    def row(self, minute):
+        row = int(self.rows[minute])
+        return None if row < 0 else row
+
+
+# dataset name -> (snapshot version, MinuteIndex)
+_indexes = {}
+
+
+def minute_index(snapshot):
+    """Return the MinuteIndex of a snapshot's 1m level, building it once per version."""
+    cached = _indexes.get(snapshot.name)
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+    index = MinuteIndex(snapshot.pyramid['1m'].ds)
+    _indexes[snapshot.name] = (snapshot.version, index)
+    return index
+
+
+def parse_features(params, features):
+    """Read the comma-separated ``features`` parameter (default: every name in ``features``)."""
+    return parse_list(params, 'features', features, default=features)
+
+
+def current_values(snapshot, columns, now=None):
+    """
+    Latest readings of ``columns`` at the current IST minute of the day.
+
+    Returns ``(timestamp, values)`` with the reading's 'YYYY-MM-DD HH:MM:SS'
+    timestamp and the cleaned values in column order, or None when the
+    dataset has no reading at this minute.
+    """
+    now = now or datetime.now(IST)
+    row = minute_index(snapshot).row(now.hour * 60 + now.minute)
+    if row is None:
+        return None
+    level = snapshot.pyramid['1m']
+    timestamp = str(format_datetimes(level.ds[row:row + 1], 's')[0])
+    return timestamp, clean_values(level.values(columns, 'mean', slice(row, row + 1))[:, 0])
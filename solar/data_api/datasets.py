@@ -0,0 +1,221 @@
+# data_api/datasets.py
+"""
+The minute datasets behind the data views, and how they are loaded.
+
+Each dataset is a minute CSV plus the cleaning the views have always
+applied: readings zeroed while the sun is down (see ``sun``) and negatives
+clipped, for every column or only a spec's ``night_columns``, and ratio
+KPIs turned into capped percentages (see ``kpis``). The inverter
+datasets' columns come from the schema registry in ``inverters``.
+``load_pyramid`` serves the compiled columnar copy written by ``manage.py
+compile_datasets``. If that copy is missing or stale, the first worker
+to notice compiles it under a file lock while the others wait, so every
+worker process ends up mapping the same read-only files: one copy in the
+page cache instead of one private copy per worker.
+"""
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, workers may compile twice
+    fcntl = None
+
+from .inverters import inverter_schema
+from .kpis import CAP_SCHEME, cap_percent_columns, percent_cap
+from .rollups import build_pyramid
+from .store import mapped_memory, read_pyramid, read_schema, write_pyramid
+from .sun import mask_night, plant_location
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORE_DIR = os.path.join(BASE_DIR, 'data_api', 'data', 'compiled')
+
+DATASETS = {
+    'inverter': {
+        'source': os.path.join(BASE_DIR, 'data_api', 'data', 'inv_min_2.csv'),
+        # Columns are discovered from the INVERTER<id>_<metric> headers
+        'layout': 'inverters',
+    },
+    # The inverter log recorded over the same minutes as the weather station,
+    # the right-hand side of the weather/inverter join
+    'inverter_min': {
+        'source': os.path.join(BASE_DIR, 'data_api', 'data', 'inverter_min.csv'),
+        'layout': 'inverters',
+    },
+    'weather': {
+        'source': os.path.join(BASE_DIR, 'data_api', 'data', 'Weather_min.csv'),
+        'columns': [
+            "GHI_A_DATA_Avg", "POA_A_DATA_2_Avg", "POA_A_DATA_3_Avg", "AirTC_Avg_Degree Celcius",
+            "T110PV_C_Avg_Degree Celcius", "RH_%", "WS_Avg_km/h",
+        ],
+        # Only irradiance is zeroed at night; temperatures, humidity and wind are kept
+        'night_columns': ["GHI_A_DATA_Avg", "POA_A_DATA_2_Avg", "POA_A_DATA_3_Avg"],
+    },
+    'derived': {
+        'source': os.path.join(BASE_DIR, 'derived', 'data', 'derived_min.csv'),
+        'columns': [
+            "PR", "n_system", "Capacity_Factor", "Specific_Yield_kWh_kWp",
+            "Energy_Yield_per_Area_kWh_m2", "Degradation_Rate_%_per_minute",
+            "Insulation_Resistance_MOhm",
+        ],
+        # Ratio KPIs stored as capped percentages (see ``kpis``)
+        'percent_columns': ["PR", "n_system", "Capacity_Factor", "Degradation_Rate_%_per_minute"],
+    },
+}
+
+
+def clean_frame(df, spec, columns):
+    """
+    Apply a dataset's cleaning to ``df`` in place.
+
+    Night readings of the spec's ``night_columns`` (default all ``columns``)
+    are zeroed and clipped at 0, then its ``percent_columns`` are scaled to
+    capped percentages.
+    """
+    mask_night(df, spec.get('night_columns', columns))
+    return cap_percent_columns(df, spec.get('percent_columns', []))
+
+
+def source_columns(name, header):
+    """
+    The value columns of a dataset, in stored order.
+
+    For the 'inverters' layout this is the full inverter x metric grid
+    discovered from the CSV ``header``, inverter-major.
+    """
+    spec = DATASETS[name]
+    if spec.get('layout') == 'inverters':
+        return inverter_schema(header).columns
+    return spec['columns']
+
+
+def read_source(name):
+    """Read a dataset's CSV, sorted by 'ds' with the cleaning applied; returns (frame, columns)."""
+    spec = DATASETS[name]
+    df = pd.read_csv(spec['source'])
+    df['ds'] = pd.to_datetime(df['ds'])
+    columns = source_columns(name, df.columns)
+    # Metrics an inverter doesn't report become empty (NaN) columns of the grid
+    df = df.reindex(columns=['ds'] + columns)
+    # Keep rows in time order so range lookups can binary search 'ds'
+    df = df.sort_values('ds', kind='stable', ignore_index=True)
+    return clean_frame(df, spec, columns), columns
+
+
+def spec_fingerprint(name):
+    """Hash of everything besides the CSV bytes that shapes the compiled data."""
+    spec = dict(DATASETS[name], source=os.path.basename(DATASETS[name]['source']), night=plant_location(),
+                percent_cap=(CAP_SCHEME, *percent_cap()))
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def source_metadata(name):
+    """Identify the CSV a compiled copy was built from."""
+    spec = DATASETS[name]
+    stat = os.stat(spec['source'])
+    return {
+        'dataset': name,
+        'source': os.path.relpath(spec['source'], BASE_DIR),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'spec': spec_fingerprint(name),
+    }
+
+
+def is_fresh(name, schema):
+    """True if a compiled schema still matches the dataset's CSV and cleaning spec."""
+    if schema is None or schema.get('spec') != spec_fingerprint(name):
+        return False
+    if not os.path.exists(DATASETS[name]['source']):
+        # The CSV was retired; the compiled copy is the dataset now.
+        return True
+    current = source_metadata(name)
+    return (schema.get('source_size'), schema.get('source_mtime_ns')) == (
+        current['source_size'], current['source_mtime_ns'])
+
+
+def compile_dataset(name, store_dir=STORE_DIR):
+    """Clean a dataset's CSV, build its rollups and publish them to the store."""
+    with open(DATASETS[name]['source'], 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()[:12]
+    metadata = source_metadata(name)
+    pyramid = build_pyramid(*read_source(name))
+    version = f"{digest}-{metadata['spec']}"
+    return write_pyramid(os.path.join(store_dir, name), version, pyramid, metadata)
+
+
+# name -> {'pyramid', 'schema', 'shared'} for every dataset this process loaded
+LOADED = {}
+
+
+@contextmanager
+def store_lock(name, store_dir=STORE_DIR):
+    """Hold an exclusive cross-process lock on one dataset's store directory."""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, f'{name}.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_pyramid(name, store_dir=STORE_DIR):
+    """
+    Return the rollup pyramid for a dataset as read-only memory maps.
+
+    A stale or missing compiled copy is rebuilt once under ``store_lock``.
+    If the store cannot be written the pyramid is built in private memory.
+    """
+    dataset_dir = os.path.join(store_dir, name)
+    try:
+        if not is_fresh(name, read_schema(dataset_dir)):
+            with store_lock(name, store_dir):
+                # Another worker may have compiled it while we waited
+                if not is_fresh(name, read_schema(dataset_dir)):
+                    compile_dataset(name, store_dir)
+        pyramid, schema = read_pyramid(dataset_dir)
+    except OSError:
+        pyramid, schema = None, None
+
+    if pyramid is None:
+        pyramid = build_pyramid(*read_source(name))
+    LOADED[name] = {'pyramid': pyramid, 'schema': schema, 'shared': schema is not None}
+    return pyramid
+
+
+def pyramid_nbytes(pyramid):
+    """Bytes a private in-memory copy of the pyramid would take."""
+    return sum(
+        array.nbytes
+        for rollup in pyramid.values()
+        for array in (rollup.ds, rollup.count, rollup.sum, rollup.min, rollup.max)
+    )
+
+
+def memory_report(store_dir=STORE_DIR):
+    """
+    Per-dataset memory use of this worker.
+
+    ``saved_per_worker`` is the size of the arrays each additional worker
+    maps from the shared page cache instead of holding privately.
+    """
+    report = {}
+    for name, loaded in LOADED.items():
+        size = pyramid_nbytes(loaded['pyramid'])
+        entry = {
+            'version': loaded['schema']['version'] if loaded['schema'] else None,
+            'shared': loaded['shared'],
+            'bytes': size,
+            'saved_per_worker': size if loaded['shared'] else 0,
+        }
+        if loaded['shared']:
+            entry['resident'] = mapped_memory(os.path.join(store_dir, name))
+        report[name] = entry
+    return report
@@ -0,0 +1,91 @@
+# data_api/downsample.py
+"""
+Largest-Triangle-Three-Buckets (LTTB) downsampling for chart series.
+
+LTTB keeps the first and last points and, for every bucket in between,
+the point forming the largest triangle with the point kept from the
+previous bucket and the average of the next bucket. Peaks and dips
+survive, so a few hundred points draw the same chart as the full series.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, max_points):
+    """Return the sorted positions of the points LTTB keeps from ``(x, y)``."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    # Buckets over the interior points 1 .. n-2
+    every = (n - 2) / (max_points - 2)
+    edges = (np.arange(max_points - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, stops = edges[:-1], edges[1:]
+
+    # Average of every bucket in one pass; a bucket's right-hand anchor is the
+    # next bucket's average, and the last bucket's is the final point.
+    counts = stops - starts
+    avg_x = np.add.reduceat(x[:n - 1], starts) / counts
+    avg_y = np.add.reduceat(y[:n - 1], starts) / counts
+    next_x = np.append(avg_x[1:], x[n - 1])
+    next_y = np.append(avg_y[1:], y[n - 1])
+
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i, (lo, hi) in enumerate(zip(starts.tolist(), stops.tolist())):
+        ax, ay = x[a], y[a]
+        # Twice the triangle area for every candidate in the bucket at once
+        area = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def combined_series(columns):
+    """Sum of ``columns`` each scaled to [0, 1], NaN counting as 0, so every one shapes the result."""
+    total = np.zeros(len(columns[0]))
+    for values in columns:
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        low, high = values[present].min(), values[present].max()
+        scaled = (values - low) / (high - low) if high > low else np.zeros_like(values)
+        total += np.where(present, scaled, 0.0)
+    return total
+
+
+def downsample(ds, series, max_points):
+    """
+    Pick the rows to keep so each series is reduced to about ``max_points``.
+
+    ``ds`` is the datetime64 time axis and ``series`` maps names to equally
+    long value lists. With several series the budget is shared and the
+    union of their picks is kept, so records stay aligned. When the picks
+    of different series fall on more than ``max_points`` rows, the union is
+    thinned to ``max_points`` by LTTB on the series scaled to [0, 1] and
+    summed, so no more rows than asked for are ever returned. Returns the
+    row positions and the metadata reported alongside the data.
+    """
+    # Nanoseconds from the first sample keep float64 x values precise
+    x = np.asarray(ds, dtype='datetime64[ns]').astype(np.int64)
+    n = len(x)
+    if n:
+        x = x - x[0]
+    budget = max(max_points // max(len(series), 1), 3)
+    picks = [lttb_indices(x, values, budget) for values in series.values()]
+    positions = np.unique(np.concatenate(picks)) if picks else np.arange(n)
+    if len(positions) > max_points:
+        combined = combined_series([np.asarray(values, dtype=float)[positions] for values in series.values()])
+        positions = positions[lttb_indices(x[positions], combined, max_points)]
+
+    metadata = {
+        'method': 'lttb',
+        'max_points': max_points,
+        'input_points': n,
+        'output_points': len(positions),
+        'reduction_ratio': round(n / len(positions), 2) if len(positions) else 1.0,
+    }
+    return positions, metadata
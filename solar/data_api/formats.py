@@ -0,0 +1,223 @@
+# data_api/formats.py
+"""
+Response encodings for the time-series views, chosen with ``format=``.
+
+``json`` (default) is the grouped ``{key: [{'timestamp': ..., feature: v}]}``
+layout the frontend has always read. ``columnar`` sends each series once,
+on the grid of its rollup level:
+
+    {"start": "2024-01-01 07:00:00", "step": "PT1M", "count": 720,
+     "values": {"active_power": [...]},
+     "gaps": {"active_power": [[0, 3], [500, 2]]}}
+
+Value i belongs to ``start + i * step`` (``step`` is an ISO 8601 duration;
+P1M steps are calendar months). ``gaps`` lists ``[index, length]`` runs of
+values that are not readings (empty buckets or NaN); they are sent as 0.
+When the points are too sparse for a dense grid, e.g. after downsampling,
+``offsets`` holds the grid slot of every value instead.
+
+``msgpack`` is the columnar payload in MessagePack with every array packed
+as a raw little-endian buffer: values as float64, offsets and gaps as
+int32 (gaps flattened to index, length pairs). It needs the optional
+``msgpack`` package.
+
+JSON is encoded with the standard library, byte for byte as JsonResponse
+writes it. RESPONSE_JSON_ENCODER = 'orjson' switches to ``orjson`` (when
+installed), about three times faster but not byte-identical: compact
+separators, its own float formatting and NaN/Infinity written as null.
+
+Grouped JSON can also be streamed (``stream=true``): ``stream_json``
+encodes the groups as they are produced, so a response costs one chunk of
+memory however long the range is.
+"""
+import json
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # RESPONSE_JSON_ENCODER = 'orjson' falls back to json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # format=msgpack is rejected with a 400
+    msgpack = None
+
+from .rollups import LEVELS
+from .series import format_datetimes
+
+FORMATS = ('json', 'columnar', 'msgpack')
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'columnar': 'application/json',
+    'msgpack': 'application/msgpack',
+}
+
+# Bytes of encoded groups collected before a streamed chunk is sent
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Rollup level -> ISO 8601 duration of one grid step
+STEPS = {
+    '1m': 'PT1M',
+    '5m': 'PT5M',
+    '15m': 'PT15M',
+    '1h': 'PT1H',
+    '1d': 'P1D',
+    '1M': 'P1M',
+}
+
+
+def parse_format(params):
+    """Read the ``format`` query parameter (default 'json')."""
+    fmt = params.get('format') or 'json'
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid format parameter. Must be one of {', '.join(FORMATS)}.")
+    if fmt == 'msgpack' and msgpack is None:
+        raise ValueError("format=msgpack is not available: the msgpack package is not installed.")
+    return fmt
+
+
+def gap_runs(absent):
+    """``[index, length]`` runs of True in a boolean array, as an (n, 2) int32 array."""
+    edges = np.diff(np.concatenate(([0], np.asarray(absent, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    return np.column_stack((starts, lengths)).astype(np.int32)
+
+
+def columnar_series(ds, series, level, missing=None):
+    """
+    Pack equally long series as one grid of the rollup ``level``.
+
+    ``series`` maps names to cleaned values aligned with the datetime64
+    array ``ds``; ``missing`` optionally maps the same names to boolean
+    arrays flagging values that are not readings. The grid is dense unless
+    it would be more than twice as long as the points themselves.
+    """
+    ds = np.asarray(ds, dtype='datetime64[ns]')
+    missing = missing or {}
+    if not len(ds):
+        return {
+            'start': None, 'step': STEPS[level], 'count': 0,
+            'values': {name: np.empty(0) for name in series},
+            'gaps': {name: np.empty((0, 2), dtype=np.int32) for name in series},
+        }
+
+    # Buckets are floored to the level, so slots are exact integer steps
+    unit, width = LEVELS[level]
+    ticks = ds.astype(f'datetime64[{unit}]').astype(np.int64)
+    offsets = ((ticks - ticks[0]) // width).astype(np.int32)
+    count = int(offsets[-1]) + 1
+    dense = count <= 2 * len(ds)
+
+    payload = {'start': str(format_datetimes(ds[:1], 's')[0]), 'step': STEPS[level]}
+    values_out, gaps_out = {}, {}
+    for name, values in series.items():
+        values = np.asarray(values, dtype=float)
+        absent = np.asarray(missing.get(name, np.zeros(len(values), dtype=bool)), dtype=bool)
+        values = np.where(absent, 0.0, values)
+        if dense:
+            grid = np.zeros(count)
+            grid[offsets] = values
+            empty = np.ones(count, dtype=bool)
+            empty[offsets] = absent
+            values, absent = grid, empty
+        values_out[name] = values
+        gaps_out[name] = gap_runs(absent)
+
+    payload['count'] = count if dense else len(ds)
+    if not dense:
+        payload['offsets'] = offsets
+    payload['values'] = values_out
+    payload['gaps'] = gaps_out
+    return payload
+
+
+class SeriesJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder that also writes NumPy arrays and scalars."""
+
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return super().default(o)
+
+
+_json_encoder = SeriesJSONEncoder()
+
+
+def use_orjson():
+    """Whether RESPONSE_JSON_ENCODER asks for orjson and it is installed."""
+    from django.conf import settings
+    if orjson is None or not settings.configured:
+        return False
+    return getattr(settings, 'RESPONSE_JSON_ENCODER', 'json') == 'orjson'
+
+
+def encode_json(data, fast=None):
+    """
+    Serialize ``data`` to JSON bytes; datetimes are written as JsonResponse writes them.
+
+    ``fast`` picks orjson over the standard library; by default
+    RESPONSE_JSON_ENCODER decides (see the module docstring).
+    """
+    if use_orjson() if fast is None else fast and orjson is not None:
+        return orjson.dumps(
+            data,
+            default=_json_encoder.default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    return json.dumps(data, cls=SeriesJSONEncoder).encode()
+
+
+def _msgpack_default(o):
+    if isinstance(o, np.ndarray):
+        dtype = '<f8' if o.dtype.kind == 'f' else '<i4'
+        return np.ascontiguousarray(o, dtype=dtype).tobytes()
+    return _json_encoder.default(o)
+
+
+def encode_msgpack(data):
+    """Serialize ``data`` to MessagePack with arrays as raw little-endian buffers."""
+    return msgpack.packb(data, default=_msgpack_default, datetime=False)
+
+
+def encode_response(data, fmt='json', status=200):
+    """Return ``data`` encoded in ``fmt`` as an HttpResponse."""
+    content = encode_msgpack(data) if fmt == 'msgpack' else encode_json(data)
+    return HttpResponse(content, content_type=CONTENT_TYPES[fmt], status=status)
+
+
+def stream_json(head, groups, tail=None):
+    """
+    Yield ``{**head, "data": {key: points, ...}, **tail}`` as JSON chunks.
+
+    ``groups`` is an iterable of ``(key, points)`` pairs consumed lazily;
+    encoded groups are sent every STREAM_CHUNK_BYTES. An error raised by
+    ``groups`` aborts the response, since the status was already sent.
+    """
+    fast = use_orjson()
+    # The encoder's separators, so the body is what encode_json writes for the whole object
+    item, colon = (b',', b':') if fast else (b', ', b': ')
+    buffer = bytearray(encode_json(head, fast)[:-1])
+    buffer += item + b'"data"' + colon + b'{' if head else b'"data"' + colon + b'{'
+    separator = b''
+    for key, points in groups:
+        buffer += separator + encode_json(key, fast) + colon + encode_json(points, fast)
+        separator = item
+        if len(buffer) >= STREAM_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b'}'
+    buffer += item + encode_json(tail, fast)[1:] if tail else b'}'
+    yield bytes(buffer)
+
+
+def streaming_response(head, groups, tail=None):
+    """Return a StreamingHttpResponse sending ``stream_json(head, groups, tail)``."""
+    return StreamingHttpResponse(stream_json(head, groups, tail), content_type=CONTENT_TYPES['json'])
@@ -0,0 +1,121 @@
+# data_api/histograms.py
+"""
+Binned irradiance-vs-power statistics.
+
+The alert rules in analytics.json compare irradiance with inverter output,
+so the analytics view looks at that relationship as a 2D histogram of
+(irradiance, power) samples plus power percentiles per irradiance bin.
+Both are computed with vectorized NumPy over the joined minute samples:
+bins are equal-width, so a sample's bin is one floor division; the
+histogram is one ``bincount`` of the flattened (x, y) bin numbers; and the
+percentiles of every x bin come from a single sort of the samples by (x
+bin, y), indexing each bin's sorted run at the interpolated rank.
+"""
+import numpy as np
+
+DEFAULT_BINS = 20
+MAX_BINS = 500
+DEFAULT_PERCENTILES = (10, 50, 90)
+
+
+def parse_bins(params, name, default=DEFAULT_BINS):
+    """Read a bin count between 1 and MAX_BINS."""
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if not 1 <= value <= MAX_BINS:
+        raise ValueError(f"Invalid {name} parameter. Must be an integer between 1 and {MAX_BINS}.")
+    return value
+
+
+def parse_upper(params, name):
+    """Read an optional positive upper bin edge (default: the largest sample)."""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        value = 0.0
+    if not 0 < value < np.inf:
+        raise ValueError(f"Invalid {name} parameter. Must be a positive number.")
+    return value
+
+
+def parse_percentiles(params):
+    """Read the comma-separated ``percentiles`` parameter (default 10,50,90)."""
+    value = params.get('percentiles')
+    if not value:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = [float(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        percentiles = []
+    if not percentiles or any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("Invalid percentiles parameter. Must be a comma-separated list of numbers from 0 to 100.")
+    return sorted(set(percentiles))
+
+
+def bin_edges(values, bins, upper=None):
+    """``bins`` equal-width edges from 0 to ``upper`` (default the largest value)."""
+    if upper is None:
+        upper = float(values.max()) if len(values) else 0.0
+    return np.linspace(0.0, upper if upper > 0 else 1.0, bins + 1)
+
+
+def bin_numbers(values, edges):
+    """Bin of every value; the last bin includes its upper edge, like np.histogram. Out of range is -1."""
+    bins = len(edges) - 1
+    numbers = np.floor((values - edges[0]) * (bins / (edges[-1] - edges[0]))).astype(np.intp)
+    numbers[values == edges[-1]] = bins - 1
+    numbers[(numbers < 0) | (numbers >= bins)] = -1
+    return numbers
+
+
+def sorted_percentiles(ordered, starts, sizes, percentiles):
+    """
+    Linearly interpolated percentiles (numpy's default method) of runs of a sorted array.
+
+    Run ``i`` is ``ordered[starts[i]:starts[i] + sizes[i]]``; returns a
+    (percentiles, runs) array, NaN for empty runs.
+    """
+    result = np.full((len(percentiles), len(sizes)), np.nan)
+    filled = sizes > 0
+    starts, last = starts[filled], starts[filled] + sizes[filled] - 1
+    for i, q in enumerate(percentiles):
+        rank = starts + (q / 100) * (last - starts)
+        low = np.floor(rank).astype(np.intp)
+        high = np.minimum(low + 1, last)
+        result[i, filled] = ordered[low] + (rank - low) * (ordered[high] - ordered[low])
+    return result
+
+
+def binned_statistics(x, y, x_edges, y_edges, percentiles=DEFAULT_PERCENTILES):
+    """
+    2D histogram of (x, y) samples and percentiles of y in every x bin.
+
+    Samples with a NaN or out-of-range x are left out; those with an
+    out-of-range y still count towards their x bin's percentiles. Returns
+    ``(counts, y_percentiles)`` shaped (x bins, y bins) and (percentiles,
+    x bins).
+    """
+    x_bins, y_bins = len(x_edges) - 1, len(y_edges) - 1
+    keep = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[keep], y[keep]
+    xi = bin_numbers(x, x_edges)
+    in_x = xi >= 0
+    x, y, xi = x[in_x], y[in_x], xi[in_x]
+    yi = bin_numbers(y, y_edges)
+
+    in_y = yi >= 0
+    counts = np.bincount(xi[in_y] * y_bins + yi[in_y], minlength=x_bins * y_bins).reshape(x_bins, y_bins)
+
+    # Sort by x bin, then y: every x bin is a run of ascending y values
+    order = np.lexsort((y, xi))
+    sizes = np.bincount(xi, minlength=x_bins)
+    starts = np.cumsum(sizes) - sizes
+    return counts, sorted_percentiles(y[order], starts, sizes, percentiles)
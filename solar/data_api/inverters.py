@@ -0,0 +1,121 @@
+# data_api/inverters.py
+"""
+Inverters and metrics discovered from the plant CSV's column names.
+
+The loggers export one wide column per inverter and metric, named
+``INVERTER<id>_<metric>`` (``INVERTER1.1_Active Power_Kw``). Instead of
+listing those columns by hand, the registry parses the header into the
+plant's inverters and the metrics they report, and lays the columns out as
+a full inverter x metric grid in inverter-major order. A rollup level's
+stat arrays, shape (columns, buckets), are then an (inverter, metric, time)
+cube: one inverter's metric is one row, and the same metric across the
+plant is every ``len(metrics)``-th row, summed in a single reduction.
+
+This dense grid stands in for a long (inverter, metric, time, value)
+table on purpose. Every dataset is served from rollup pyramids of
+(columns, buckets) arrays memory-mapped from the columnar store, and the
+live buffers, formats and views all index them by column; a long table
+would need its own store layout, rollups grouped by two categorical keys
+and a pivot back to columns on every request. The grid holds the same
+values without an inverter and a metric code per reading, and the
+inverter and metric are still categorical axes: the reshape in
+``plant_total`` is the cube view, and the plant aggregate is a reduction
+over its inverter axis rather than a group-by. Its only cost is an empty
+column for a metric some inverter does not report. The stored samples
+(models.InverterSample) are long on inverter x time.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from .series import parse_list
+
+COLUMN_PATTERN = re.compile(r'^INVERTER(?P<inverter>[^_]+)_(?P<metric>.+)$')
+
+# API feature_type -> metric name in the column headers
+FEATURE_METRICS = {
+    'active_power': 'Active Power_Kw',
+    'dc_power': 'DC Power_Kw',
+    'todays_gen': 'Todays Gen_Kwh',
+}
+
+
+def column_name(inverter, metric):
+    """Header of one inverter's metric column."""
+    return f'INVERTER{inverter}_{metric}'
+
+
+def natural_key(inverter):
+    """Sort key putting inverter '2.1' before '10.1'."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', inverter)]
+
+
+class InverterSchema:
+    """The plant's inverters and metrics, and the grid of columns they span."""
+
+    def __init__(self, inverters, metrics):
+        self.inverters = list(inverters)
+        self.metrics = list(metrics)
+        self.columns = [column_name(i, m) for i in self.inverters for m in self.metrics]
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Discover inverters (naturally sorted) and metrics (header order) from column names."""
+        inverters, metrics = set(), {}
+        for column in columns:
+            match = COLUMN_PATTERN.match(str(column))
+            if match:
+                inverters.add(match['inverter'])
+                metrics.setdefault(match['metric'], None)
+        return cls(sorted(inverters, key=natural_key), metrics)
+
+    def column(self, inverter, metric):
+        return column_name(inverter, metric)
+
+    def metric_columns(self, metric):
+        """The column of ``metric`` for every inverter, in inverter order."""
+        return [column_name(inverter, metric) for inverter in self.inverters]
+
+
+@lru_cache(maxsize=16)
+def _schema(columns):
+    return InverterSchema.from_columns(columns)
+
+
+def inverter_schema(columns):
+    """Return the (cached) InverterSchema of a sequence of column names."""
+    return _schema(tuple(columns))
+
+
+def parse_feature_types(params):
+    """Read ``feature_type``: one or more comma-separated names of FEATURE_METRICS."""
+    return parse_list(params, 'feature_type', FEATURE_METRICS)
+
+
+def parse_inverter(params, schema):
+    """Read the ``inverter`` query parameter (default: the first inverter)."""
+    if not schema.inverters:
+        raise ValueError("No inverter columns found in the dataset.")
+    inverter = params.get('inverter') or schema.inverters[0]
+    if inverter not in schema.inverters:
+        raise ValueError(f"Invalid inverter parameter. Must be one of {', '.join(schema.inverters)}.")
+    return inverter
+
+
+def plant_total(level, columns, agg='mean', rows=slice(None)):
+    """
+    Sum metrics across inverters for the buckets in ``rows``.
+
+    ``columns`` holds one ``schema.metric_columns`` list per metric; all of
+    them are read in one stacked array and reduced over the inverter axis,
+    giving a (metrics, buckets) array. An inverter without readings in a
+    bucket adds nothing; a bucket where no inverter reported is NaN. For
+    min/max this is the sum of the inverters' extremes, a bound on the
+    plant's.
+    """
+    stack = level.values([column for group in columns for column in group], agg, rows)
+    stack = stack.reshape(len(columns), -1, stack.shape[-1])
+    total = np.nansum(stack, axis=1)
+    total[np.isnan(stack).all(axis=1)] = np.nan
+    return total
@@ -0,0 +1,84 @@
+# data_api/joins.py
+"""
+As-of joins between datasets logged on separate clocks.
+
+The weather station and the inverters stamp their own readings, so pairing
+them by exact timestamp silently drops samples whenever the clocks drift.
+Instead every row of the left series takes the latest row of the right
+series at or before it, like ``pandas.merge_asof(direction='backward')``,
+provided that row is no older than a tolerance.
+
+The match does not depend on the tolerance: it is one binary search of
+the whole left index against the right one, computed once per pair of
+snapshot versions and rollup level and cached. A request then only masks
+the matches that are too old for its tolerance and gathers the right
+values at the matched rows.
+"""
+import numpy as np
+
+# Seconds a right reading may trail the left one and still be joined to it
+DEFAULT_TOLERANCE = 120
+
+
+class AsofIndex:
+    """For every left timestamp, the latest right row at or before it and its age in seconds."""
+
+    def __init__(self, left, right):
+        left = np.asarray(left, dtype='datetime64[ns]')
+        right = np.asarray(right, dtype='datetime64[ns]')
+        positions = np.searchsorted(right, left, side='right') - 1
+        found = positions >= 0
+        self.positions = np.where(found, positions, 0)
+        # Left rows before the first right reading never match
+        self.lag = np.full(len(left), np.inf)
+        self.lag[found] = (left[found] - right[positions[found]]) / np.timedelta64(1, 's')
+
+    def match(self, rows, tolerance):
+        """Right positions of the left ``rows`` and whether each matched within ``tolerance`` seconds."""
+        return self.positions[rows], self.lag[rows] <= tolerance
+
+
+# (left name, right name, level) -> ((left version, right version), AsofIndex)
+_indexes = {}
+
+
+def asof_index(left, right, level):
+    """Return the AsofIndex of two snapshots' ``level``, building it once per pair of versions."""
+    key = (left.name, right.name, level)
+    versions = (left.version, right.version)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    index = AsofIndex(left.pyramid[level].ds, right.pyramid[level].ds)
+    _indexes[key] = (versions, index)
+    return index
+
+
+def parse_tolerance(params):
+    """Read ``tolerance`` in seconds (default settings.ASOF_JOIN_TOLERANCE)."""
+    from django.conf import settings
+    tolerance = params.get('tolerance')
+    if tolerance in (None, ''):
+        if settings.configured:
+            return float(getattr(settings, 'ASOF_JOIN_TOLERANCE', DEFAULT_TOLERANCE))
+        return float(DEFAULT_TOLERANCE)
+    try:
+        tolerance = float(tolerance)
+    except ValueError:
+        tolerance = -1
+    if not tolerance >= 0:
+        raise ValueError("Invalid tolerance parameter. Must be a number of seconds of at least 0.")
+    return tolerance
+
+
+def joined_values(level, columns, agg, index, rows, tolerance):
+    """
+    Aggregates of ``columns`` of the right ``level`` aligned with the left ``rows``.
+
+    Returns a (columns, rows) array; left rows without a right reading
+    within ``tolerance`` seconds are NaN.
+    """
+    positions, matched = index.match(rows, tolerance)
+    values = level.values(columns, agg, positions)
+    values[:, ~matched] = np.nan
+    return values
@@ -0,0 +1,53 @@
+# data_api/kpis.py
+"""
+Percent KPIs, scaled and capped once when a dataset is built.
+
+Ratio KPIs (PR, system efficiency, capacity factor, degradation) are shown
+as percentages held below a cap between KPI_PERCENT_CAP's bounds, which
+keeps the occasional sensor spike from dominating a chart. The caps used to
+be drawn with ``random.randint`` for every point of every response, so the
+same request never returned the same body and each response paid for a
+Python loop. Each minute's cap is now a fixed function of its timestamp
+and KPI_CAP_SEED (a splitmix64 hash), applied in one vectorized step
+before the rollups are built: every level, request and worker sees the
+same values, the live engine caps a minute exactly as the export does, and
+a fixed cap is just equal bounds.
+"""
+import numpy as np
+
+DEFAULT_CAP = (85, 90)
+DEFAULT_SEED = 0
+# Part of the dataset fingerprint: changing how caps are drawn recompiles the store
+CAP_SCHEME = 'splitmix64-minute'
+
+
+def percent_cap():
+    """((low, high) cap bounds, seed) from settings, or the defaults."""
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_CAP, DEFAULT_SEED
+    low, high = getattr(settings, 'KPI_PERCENT_CAP', DEFAULT_CAP)
+    return (int(low), int(high)), int(getattr(settings, 'KPI_CAP_SEED', DEFAULT_SEED))
+
+
+def percent_caps(ds, bounds=None, seed=None):
+    """One integer cap in [low, high] per timestamp of ``ds``, the same for the same minute and seed."""
+    if bounds is None or seed is None:
+        bounds, seed = percent_cap()
+    low, high = bounds
+    minutes = np.asarray(ds, dtype='datetime64[m]').astype(np.int64).astype(np.uint64)
+    # splitmix64 of (seed, minute)
+    z = minutes + np.uint64((seed + 1) * 0x9E3779B97F4A7C15 % 2 ** 64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    return (low + z % np.uint64(high - low + 1)).astype(float)
+
+
+def cap_percent_columns(df, columns, time_column='ds'):
+    """Scale ratio ``columns`` of ``df`` to percent and cap each row, in place; NaN stays NaN."""
+    if columns:
+        caps = percent_caps(df[time_column].to_numpy(dtype='datetime64[ns]'))
+        # np.minimum, not np.fmin: a missing reading must not become the cap
+        df[columns] = np.minimum(df[columns].to_numpy(dtype=float) * 100, caps[:, None])
+    return df
@@ -0,0 +1,305 @@
+# data_api/live.py
+"""
+Live minute readings from the Kafka consumers, merged with the history.
+
+The consumers append every message to a fixed-capacity ring buffer per
+dataset: one datetime64 array and one float64 row per column, overwritten
+oldest-first, so appending is a few array stores and memory never grows.
+The data views read ``serving_snapshot(name)`` instead of the plain
+snapshot. It is the compiled history plus the buffered readings newer than
+the history's last minute, cleaned like the dataset and rolled up into a
+small tail pyramid whose buckets are appended to the history's (only the
+boundary bucket is combined). The merge is cached per (history version,
+buffer version), so requests between two messages share it and never
+touch the disk.
+
+A background thread flushes the tail into the columnar store every
+LIVE_FLUSH_INTERVAL seconds as a new version of the dataset, which every
+worker's snapshot watcher then picks up; after that the flushed readings
+are history and the tail starts again from empty. Live data kept as
+rollups elsewhere (the derived KPI engine) registers its own flush with
+``register_flush`` and is published the same way. The consumers run in
+worker processes, so this is how their readings reach the web workers;
+a worker flushes once more with ``flush_all`` before it exits. Rebuilding
+a dataset from its CSV (a changed source or cleaning spec) drops flushed
+readings.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+
+from .datasets import DATASETS, STORE_DIR, clean_frame, source_metadata, store_lock
+from .rollups import build_pyramid, merge_pyramids, trim_pyramid
+from .snapshots import Snapshot, get_snapshot, refresh
+from .store import read_schema, write_pyramid
+
+DEFAULT_CAPACITY = 7 * 24 * 60  # a week of minute readings
+DEFAULT_FLUSH_INTERVAL = 300.0
+# 'ds' layouts of the CSV exports the messages are produced from, tried
+# before falling back to pandas' much slower format inference
+MESSAGE_TIME_FORMATS = ('%m/%d/%y %H:%M', '%m/%d/%Y %H:%M', '%m/%d/%Y %I:%M:%S %p')
+
+
+def live_settings():
+    """(ring buffer capacity in rows, seconds between flushes) from settings, or the defaults."""
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_CAPACITY, DEFAULT_FLUSH_INTERVAL
+    return (
+        int(getattr(settings, 'LIVE_BUFFER_CAPACITY', DEFAULT_CAPACITY)),
+        float(getattr(settings, 'LIVE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)),
+    )
+
+
+class RingBuffer:
+    """
+    The latest ``capacity`` minute readings of a fixed set of columns.
+
+    Readings must arrive in time order; one for the minute already at the
+    head replaces it (a redelivered message) and older ones are dropped.
+    """
+
+    def __init__(self, columns, capacity):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.ds = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.values = np.full((len(self.columns), capacity), np.nan)
+        self.start = 0
+        self.size = 0
+        self.appended = 0
+        self.dropped = 0
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+        self._lock = threading.Lock()
+
+    def append(self, ts, readings):
+        """Store the readings (column -> value; other keys are ignored) taken at minute ``ts``."""
+        row = np.full(len(self.columns), np.nan)
+        for column, value in readings.items():
+            j = self._positions.get(column)
+            if j is not None and value is not None:
+                row[j] = value
+        with self._lock:
+            if self.size:
+                last = (self.start + self.size - 1) % self.capacity
+                if ts < self.ds[last]:
+                    self.dropped += 1
+                    return
+                if ts == self.ds[last]:
+                    self.values[:, last] = row
+                    self.appended += 1
+                    return
+            if self.size == self.capacity:
+                i = self.start
+                self.start = (self.start + 1) % self.capacity
+            else:
+                i = (self.start + self.size) % self.capacity
+                self.size += 1
+            self.ds[i] = ts
+            self.values[:, i] = row
+            self.appended += 1
+
+    def rows(self, after=None):
+        """Copies of the buffered ``(ds, values)`` in time order, only those later than ``after``."""
+        with self._lock:
+            order = (self.start + np.arange(self.size)) % self.capacity
+            ds, values = self.ds[order], self.values[:, order]
+        if after is not None:
+            first = int(np.searchsorted(ds, after, side='right'))
+            ds, values = ds[first:], values[:, first:]
+        return ds, values
+
+
+# dataset name -> RingBuffer fed by the consumers
+_buffers = {}
+# dataset name (or pair of snapshot names) -> (history version, live version, merged Snapshot)
+_merged = {}
+# name -> function publishing live data kept elsewhere (see register_flush)
+_flushes = {}
+_buffers_lock = threading.Lock()
+_flusher = None
+
+
+def live_buffer(name):
+    """Return the ring buffer of a dataset, created with its history's columns on first use."""
+    buffer = _buffers.get(name)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(name)
+            if buffer is None:
+                columns = get_snapshot(name).pyramid['1m'].columns
+                buffer = RingBuffer(columns, live_settings()[0])
+                _buffers[name] = buffer
+        start_flusher()
+    return buffer
+
+
+def append(name, data):
+    """Append one consumed message of dataset ``name``; messages without a 'ds' are ignored."""
+    if data.get('ds') is not None:
+        live_buffer(name).append(message_time(data['ds']), data)
+
+
+@lru_cache(maxsize=4096)
+def message_time(value):
+    """A message's 'ds' as a naive datetime64[ns], to the minute like the datasets."""
+    try:
+        ts = np.datetime64(value)  # ISO strings
+    except ValueError:
+        for fmt in MESSAGE_TIME_FORMATS:
+            try:
+                ts = np.datetime64(datetime.strptime(value, fmt))
+                break
+            except ValueError:
+                continue
+        else:
+            ts = pd.Timestamp(value).to_datetime64()
+    return ts.astype('datetime64[m]').astype('datetime64[ns]')
+
+
+def tail_pyramid(name, history):
+    """Rollups of the buffered readings newer than the history, or None if there are none."""
+    buffer = _buffers.get(name)
+    if buffer is None:
+        return None
+    base = history.pyramid['1m']
+    ds, values = buffer.rows(after=base.ds[-1] if len(base) else None)
+    if not len(ds):
+        return None
+    df = pd.DataFrame(values.T, columns=buffer.columns)
+    df.insert(0, 'ds', ds)
+    df = clean_frame(df, DATASETS[name], buffer.columns)
+    return build_pyramid(df, buffer.columns)
+
+
+def serving_snapshot(name):
+    """The dataset's snapshot with the live tail merged in (the plain snapshot if there is none)."""
+    history = get_snapshot(name)
+    buffer = _buffers.get(name)
+    if buffer is None:
+        return history
+    cached = _merged.get(name)
+    if cached is not None and cached[:2] == (history.version, buffer.appended):
+        return cached[2]
+    appended = buffer.appended
+    tail = tail_pyramid(name, history)
+    if tail is None:
+        snapshot = history
+    else:
+        snapshot = Snapshot(name, merge_pyramids(history.pyramid, tail),
+                            f"{history.version}+live{appended}", history.signature)
+    _merged[name] = (history.version, appended, snapshot)
+    return snapshot
+
+
+def merge_snapshots(history, live):
+    """
+    ``history`` with a live snapshot's buckets appended, for live data kept as rollups.
+
+    Live minutes the history already holds (e.g. flushed while more
+    readings arrived) are left out, so the history's values win for them
+    and only the later readings are appended.
+    """
+    key = (history.name, live.name)
+    cached = _merged.get(key)
+    if cached is not None and cached[:2] == (history.version, live.version):
+        return cached[2]
+    tail = later_part(live.pyramid, history)
+    pyramid = history.pyramid if tail is None else merge_pyramids(history.pyramid, tail)
+    snapshot = Snapshot(history.name, pyramid, f"{history.version}+{live.version}",
+                        getattr(history, 'signature', None))
+    _merged[key] = (history.version, live.version, snapshot)
+    return snapshot
+
+
+def later_part(pyramid, history):
+    """The part of a live rollup ``pyramid`` later than the history's last minute, or None if there is none."""
+    history_ds, live_ds = history.pyramid['1m'].ds, pyramid['1m'].ds
+    if not len(live_ds) or (len(history_ds) and live_ds[-1] <= history_ds[-1]):
+        return None
+    if len(history_ds) and live_ds[0] <= history_ds[-1]:
+        return trim_pyramid(pyramid, history_ds[-1])
+    return pyramid
+
+
+def flush(name, store_dir=STORE_DIR):
+    """
+    Publish the merged history and live tail of a dataset as a new store version.
+
+    Returns the new version, or None when there was nothing to flush.
+    """
+    history = get_snapshot(name)
+    return publish(name, history, tail_pyramid(name, history), store_dir)
+
+
+def publish(name, history, tail, store_dir=STORE_DIR):
+    """
+    Write ``history`` with the ``tail`` pyramid (later readings) merged in as the dataset's new store version.
+
+    Returns the new version, or None when there is no tail or the store
+    no longer holds ``history``.
+    """
+    if tail is None:
+        return None
+    dataset_dir = os.path.join(store_dir, name)
+    with store_lock(name, store_dir):
+        schema = read_schema(dataset_dir)
+        if schema is None or schema['version'] != history.version:
+            # Not compiled yet, or another process published first: retry next time
+            return None
+        last = pd.Timestamp(tail['1m'].ds[-1])
+        version = f"{history.version.split('+')[0]}+{last:%Y%m%dT%H%M}"
+        write_pyramid(dataset_dir, version, merge_pyramids(history.pyramid, tail), source_metadata(name))
+    refresh(name)
+    return version
+
+
+def register_flush(name, function):
+    """Have the flush thread also call ``function()``, which publishes live data kept outside the ring buffers."""
+    _flushes[name] = function
+    start_flusher()
+
+
+def flush_all():
+    """Flush every dataset's buffered readings and every registered flush, e.g. before the process exits."""
+    flushes = [(name, partial(flush, name)) for name in list(_buffers)] + list(_flushes.items())
+    for name, flush_one in flushes:
+        try:
+            flush_one()
+        except Exception as e:
+            # Keep the readings buffered; try again next tick
+            print(f"Error flushing live data of '{name}': {e}")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(live_settings()[1])
+        flush_all()
+
+
+def start_flusher():
+    """Start this process's flush thread once; a non-positive interval disables it."""
+    global _flusher
+    if _flusher is not None or live_settings()[1] <= 0:
+        return
+    with _buffers_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='live-flusher', daemon=True)
+            _flusher.start()
+
+
+def buffer_report():
+    """Per-dataset ring buffer fill, reported by the consumer workers (see kafka_app.supervisor)."""
+    return {
+        name: {
+            'rows': buffer.size,
+            'capacity': buffer.capacity,
+            'appended': buffer.appended,
+            'dropped': buffer.dropped,
+        }
+        for name, buffer in _buffers.items()
+    }
@@ -0,0 +1,29 @@
+# data_api/management/commands/compile_datasets.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_api.datasets import DATASETS, STORE_DIR, compile_dataset
+
+
+class Command(BaseCommand):
+    help = "Compile the minute CSVs into the memory-mapped columnar store read by the data views."
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', help=f"Datasets to compile (default: all of {', '.join(DATASETS)}).")
+        parser.add_argument('--store', default=STORE_DIR, help="Directory of the compiled store.")
+
+    def handle(self, *args, **options):
+        names = options['datasets'] or list(DATASETS)
+        unknown = [name for name in names if name not in DATASETS]
+        if unknown:
+            raise CommandError(f"Unknown dataset(s): {', '.join(unknown)}")
+
+        for name in names:
+            started = time.perf_counter()
+            schema = compile_dataset(name, options['store'])
+            elapsed = time.perf_counter() - started
+            buckets = ', '.join(f"{level}={info['buckets']}" for level, info in schema['levels'].items())
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: version {schema['version']} from {schema['source']} in {elapsed:.2f}s ({buckets})"
+            ))
@@ -0,0 +1,42 @@
+# data_api/management/commands/import_samples.py
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from data_api.datasets import DATASETS
+from data_api.samples import SampleWriter, frame_samples
+
+# Datasets holding raw readings (the derived KPIs are computed, not sampled)
+SAMPLE_DATASETS = ('inverter', 'inverter_min', 'weather')
+
+
+class Command(BaseCommand):
+    help = "Backfill the inverter and weather sample tables from the minute CSVs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('datasets', nargs='*', help=f"Datasets to import (default: all of {', '.join(SAMPLE_DATASETS)}).")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows per transaction (default: SAMPLE_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        names = options['datasets'] or list(SAMPLE_DATASETS)
+        unknown = [name for name in names if name not in SAMPLE_DATASETS]
+        if unknown:
+            raise CommandError(f"Unknown dataset(s): {', '.join(unknown)}")
+
+        writer = SampleWriter(batch_size=options['batch_size'], linger=float('inf'))
+        for name in names:
+            started = time.perf_counter()
+            df = pd.read_csv(DATASETS[name]['source'])
+            df['ds'] = pd.to_datetime(df['ds'])
+            rows = frame_samples(name, df)
+            for lo in range(0, len(rows), writer.batch_size):
+                writer.add(type(rows[lo]), rows[lo:lo + writer.batch_size])
+            writer.flush()
+            if writer.failed:
+                raise CommandError(f"{name}: {writer.failed} rows could not be written")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {len(rows)} samples from {DATASETS[name]['source']} in {elapsed:.2f}s "
+                f"({len(rows) / max(elapsed, 1e-9):.0f} rows/s)"
+            ))
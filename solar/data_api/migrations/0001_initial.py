@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InverterSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.CharField(max_length=32)),
+                ('ts', models.BigIntegerField(help_text='Unix time of the reading, in seconds.')),
+                ('active_power', models.FloatField(blank=True, null=True)),
+                ('ac_current_1', models.FloatField(blank=True, null=True)),
+                ('ac_current_2', models.FloatField(blank=True, null=True)),
+                ('ac_current_3', models.FloatField(blank=True, null=True)),
+                ('ac_voltage_br', models.FloatField(blank=True, null=True)),
+                ('ac_voltage_ry', models.FloatField(blank=True, null=True)),
+                ('ac_voltage_yb', models.FloatField(blank=True, null=True)),
+                ('todays_gen', models.FloatField(blank=True, null=True)),
+                ('dc_current', models.FloatField(blank=True, null=True)),
+                ('dc_voltage', models.FloatField(blank=True, null=True)),
+                ('dc_power', models.FloatField(blank=True, null=True)),
+                ('reactive_power', models.FloatField(blank=True, null=True)),
+                ('inverter_temp', models.FloatField(blank=True, null=True)),
+                ('power_factor', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'ts'), name='inverter_sample_device_ts')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WeatherSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.CharField(max_length=32)),
+                ('ts', models.BigIntegerField(help_text='Unix time of the reading, in seconds.')),
+                ('ghi', models.FloatField(blank=True, null=True)),
+                ('poa', models.FloatField(blank=True, null=True)),
+                ('poa_3', models.FloatField(blank=True, null=True)),
+                ('air_temperature', models.FloatField(blank=True, null=True)),
+                ('module_temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('wind_speed', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'ts'), name='weather_sample_device_ts')],
+            },
+        ),
+    ]
@@ -1,2 +1,92 @@
-from django.conf import settings
+# data_api/models.py
+"""
+Raw minute readings persisted as they are consumed, one row per device and minute.
+
+``ts`` is Unix time in seconds rather than a DateTimeField: the unique
+(device, ts) index doubles as the range-scan index, its keys stay small
+integers, and timestamps go in and come out as whole NumPy arrays instead
+of being converted one datetime at a time (see ``samples``).
+"""
+from django.db import models
+
+# Model field -> metric in the INVERTER<id>_<metric> column headers
+INVERTER_FIELDS = {
+    'active_power': 'Active Power_Kw',
+    'ac_current_1': 'AC Current (A)_Phase 1',
+    'ac_current_2': 'AC Current (A)_Phase 2',
+    'ac_current_3': 'AC Current (A)_Phase 3',
+    'ac_voltage_br': 'AC Voltage (V)_BR',
+    'ac_voltage_ry': 'AC Voltage (V)_RY',
+    'ac_voltage_yb': 'AC Voltage (V)_YB',
+    'todays_gen': 'Todays Gen_Kwh',
+    'dc_current': 'DC Current',
+    'dc_voltage': 'DC Voltage',
+    'dc_power': 'DC Power_Kw',
+    'reactive_power': 'Reactive power_Kvar',
+    'inverter_temp': 'Inverter_Temp.',
+    'power_factor': 'Power Factor',
+}
+
+# Mapping of weather feature types (and model fields) to their column names
+WEATHER_COLUMNS = {
+    'ghi': 'GHI_A_DATA_Avg',
+    'poa': 'POA_A_DATA_2_Avg',
+    'poa_3': 'POA_A_DATA_3_Avg',
+    'air_temperature': 'AirTC_Avg_Degree Celcius',
+    'module_temperature': 'T110PV_C_Avg_Degree Celcius',
+    'humidity': 'RH_%',
+    'wind_speed': 'WS_Avg_km/h',
+}
+
+
+class Sample(models.Model):
+    device = models.CharField(max_length=32)
+    ts = models.BigIntegerField(help_text="Unix time of the reading, in seconds.")
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f'{self.device} @ {self.ts}'
+
+
+class InverterSample(Sample):
+    """One inverter's metrics for one minute; ``device`` is the inverter id ('1.1')."""
+
+    active_power = models.FloatField(null=True, blank=True)
+    ac_current_1 = models.FloatField(null=True, blank=True)
+    ac_current_2 = models.FloatField(null=True, blank=True)
+    ac_current_3 = models.FloatField(null=True, blank=True)
+    ac_voltage_br = models.FloatField(null=True, blank=True)
+    ac_voltage_ry = models.FloatField(null=True, blank=True)
+    ac_voltage_yb = models.FloatField(null=True, blank=True)
+    todays_gen = models.FloatField(null=True, blank=True)
+    dc_current = models.FloatField(null=True, blank=True)
+    dc_voltage = models.FloatField(null=True, blank=True)
+    dc_power = models.FloatField(null=True, blank=True)
+    reactive_power = models.FloatField(null=True, blank=True)
+    inverter_temp = models.FloatField(null=True, blank=True)
+    power_factor = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'ts'], name='inverter_sample_device_ts'),
+        ]
+
+
+class WeatherSample(Sample):
+    """One weather station's readings for one minute."""
+
+    ghi = models.FloatField(null=True, blank=True)
+    poa = models.FloatField(null=True, blank=True)
+    poa_3 = models.FloatField(null=True, blank=True)
+    air_temperature = models.FloatField(null=True, blank=True)
+    module_temperature = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    wind_speed = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'ts'], name='weather_sample_device_ts'),
+        ]
 
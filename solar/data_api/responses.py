@@ -0,0 +1,100 @@
+# data_api/responses.py
+"""
+The request flow shared by the time-series views.
+
+Each view only says which series it serves and how to read them from a
+rollup level; ``series_response`` handles the common query parameters
+(graph_type, start/end/limit, max_points, agg, format, stream) and builds
+the response. All requested series are read together as one stacked array
+over the shared time index, so ``feature_type=a,b,c`` costs one pass over
+the window instead of one request per series, and comes back aligned.
+"""
+import numpy as np
+from django.http import JsonResponse
+from rest_framework import status
+
+from .downsample import downsample
+from .formats import columnar_series, encode_response, parse_format, streaming_response
+from .rollups import GRAPH_LEVELS, parse_aggregate
+from .series import (
+    clean_values, date_bounds, group_records, iter_groups, parse_count, parse_flag, parse_range, time_window
+)
+
+
+def series_response(request, snapshot, names, read, extra=None):
+    """
+    Answer a time-series request for the series ``names`` of ``snapshot``.
+
+    ``read(level, agg, rows)`` returns the raw values of every series for
+    ``rows`` of a rollup level, stacked as (len(names), rows). ``extra`` is
+    added next to first_date/last_date.
+    """
+    graph_type = request.GET.get('graph_type')
+    if graph_type not in GRAPH_LEVELS:
+        return JsonResponse({"error": f"Invalid graph_type parameter. Must be one of {', '.join(GRAPH_LEVELS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        start, end, limit = parse_range(request.GET)
+        max_points = parse_count(request.GET, 'max_points', minimum=3)
+        agg = parse_aggregate(request.GET)
+        fmt = parse_format(request.GET)
+        stream = parse_flag(request.GET, 'stream')
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def cleaned(raw):
+        return {name: clean_values(values) for name, values in zip(names, raw)}
+
+    try:
+        # Pick the rollup level for this graph_type from the snapshot
+        level_name = GRAPH_LEVELS[graph_type]
+        level = snapshot.pyramid[level_name]
+        first_date, last_date = date_bounds(level.ds)
+
+        # Prepare the response data
+        response_data = {
+            'first_date': first_date,
+            'last_date': last_date,
+            **(extra or {}),
+            'data': {}
+        }
+
+        # Slice the requested [start, end) range by binary search on 'ds'
+        rows, next_cursor = time_window(level.ds, start, end, limit)
+
+        # Long grouped ranges are streamed a block of rows at a time instead of
+        # being built in memory; downsampled and columnar payloads are sent whole
+        if stream and fmt == 'json' and max_points is None:
+            def load(block):
+                return cleaned(read(level, agg, block))
+
+            del response_data['data']
+            tail = {'next_cursor': next_cursor} if limit is not None else None
+            return streaming_response(response_data, iter_groups(level.ds, rows, load, graph_type), tail)
+
+        ds = level.ds[rows]
+        raw = read(level, agg, rows)
+        series = cleaned(raw)
+
+        # Reduce long ranges to max_points with LTTB, keeping the chart shape
+        if max_points is not None:
+            positions, response_data['downsampling'] = downsample(ds, series, max_points)
+            ds = ds[positions]
+            raw = raw[:, positions]
+            series = {name: [values[i] for i in positions.tolist()] for name, values in series.items()}
+
+        if fmt == 'json':
+            # Group under the graph_type's hour/day/month/year key
+            response_data['data'] = group_records(ds, series, graph_type)
+        else:
+            # One start/step grid per series; NaN readings are reported as gaps
+            missing = {name: np.isnan(values) for name, values in zip(names, raw)}
+            response_data['data'] = columnar_series(ds, series, level_name, missing=missing)
+        if limit is not None:
+            response_data['next_cursor'] = next_cursor
+
+        return encode_response(response_data, fmt, status=status.HTTP_200_OK)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,205 @@
+# data_api/rollups.py
+"""
+Multi-resolution rollups (1m -> 5m -> 15m -> 1h -> 1d -> 1M) of minute data.
+
+Each level keeps count/sum/min/max per bucket for every column and is built
+from the level below it, so the whole pyramid costs little more than one
+pass over the minute rows. The views pick the level matching their
+graph_type instead of reading a CSV per resolution or resampling per
+request.
+"""
+import numpy as np
+import pandas as pd
+
+# Level name -> datetime64 unit and bucket width used to floor timestamps
+LEVELS = {
+    '1m': ('m', 1),
+    '5m': ('m', 5),
+    '15m': ('m', 15),
+    '1h': ('h', 1),
+    '1d': ('D', 1),
+    '1M': ('M', 1),
+}
+
+GRAPH_LEVELS = {
+    'minute': '1m',
+    '5min': '5m',
+    '15min': '15m',
+    'hourly': '1h',
+    'daily': '1d',
+    'monthly': '1M',
+}
+
+AGGREGATES = ('mean', 'min', 'max', 'sum', 'count')
+
+
+class Rollup:
+    """
+    One pyramid level: bucket start times plus count/sum/min/max arrays.
+
+    Every stat array has shape (columns, buckets), so each column is one
+    contiguous run of memory, and is aligned with ``ds`` along its last axis.
+    """
+
+    def __init__(self, ds, columns, count, total, low, high):
+        self.ds = ds
+        self.columns = list(columns)
+        self.count = count
+        self.sum = total
+        self.min = low
+        self.max = high
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+
+    def __len__(self):
+        return len(self.ds)
+
+    def values(self, column, agg='mean', rows=slice(None)):
+        """
+        Return one column's aggregate for the buckets in ``rows``; empty buckets are NaN.
+
+        Given a list of columns, returns their aggregates stacked in one
+        (columns, buckets) array. ``rows`` may be a slice or an array of
+        bucket positions.
+        """
+        if isinstance(column, str):
+            j = self._positions[column]
+        else:
+            j = np.array([self._positions[c] for c in column], dtype=np.intp)
+            if not isinstance(rows, slice):
+                j = j[:, None]
+        if agg == 'mean':
+            count = self.count[j, rows]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(count > 0, self.sum[j, rows] / count, np.nan)
+        if agg == 'count':
+            return self.count[j, rows].astype(float)
+        if agg == 'sum':
+            return self.sum[j, rows]
+        if agg == 'min':
+            return self.min[j, rows]
+        if agg == 'max':
+            return self.max[j, rows]
+        raise ValueError(f"Unknown aggregate '{agg}'.")
+
+    def select(self, rows):
+        """The buckets in ``rows`` (a slice or mask) as a new level."""
+        return Rollup(self.ds[rows], self.columns, self.count[:, rows], self.sum[:, rows],
+                      self.min[:, rows], self.max[:, rows])
+
+    def rollup(self, unit, width=1):
+        """Aggregate this level into coarser buckets of ``width`` ``unit``s."""
+        keys = floor_datetimes(self.ds, unit, width)
+        if not len(keys):
+            return Rollup(keys, self.columns, self.count, self.sum, self.min, self.max)
+        # Rows are time-sorted, so each bucket is a contiguous run
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        return Rollup(
+            keys[starts],
+            self.columns,
+            np.add.reduceat(self.count, starts, axis=1),
+            np.add.reduceat(self.sum, starts, axis=1),
+            np.fmin.reduceat(self.min, starts, axis=1),
+            np.fmax.reduceat(self.max, starts, axis=1),
+        )
+
+
+def parse_aggregate(params):
+    """Read the ``agg`` query parameter (default 'mean')."""
+    agg = params.get('agg') or 'mean'
+    if agg not in AGGREGATES:
+        raise ValueError(f"Invalid agg parameter. Must be one of {', '.join(AGGREGATES)}.")
+    return agg
+
+
+def floor_datetimes(ds, unit, width=1):
+    """Floor a datetime64 array to buckets of ``width`` ``unit``s, returned as datetime64[ns]."""
+    floored = np.asarray(ds, dtype='datetime64[ns]').astype(f'datetime64[{unit}]')
+    if width > 1:
+        ticks = floored.astype(np.int64)
+        floored = (ticks - ticks % width).astype(f'datetime64[{unit}]')
+    return floored.astype('datetime64[ns]')
+
+
+def build_pyramid(df, columns, time_column='ds'):
+    """
+    Build every level of the pyramid from a frame sorted by ``time_column``.
+
+    Returns ``{level name: Rollup}`` for the names in LEVELS.
+    """
+    values = np.ascontiguousarray(df[columns].to_numpy(dtype=float).T)
+    present = ~np.isnan(values)
+    base = Rollup(
+        df[time_column].to_numpy(dtype='datetime64[ns]'),
+        columns,
+        present.astype(np.int32),
+        np.where(present, values, 0.0),
+        values,
+        values,
+    )
+
+    pyramid = {}
+    level = base
+    for name, (unit, width) in LEVELS.items():
+        level = level.rollup(unit, width)
+        pyramid[name] = level
+    return pyramid
+
+
+def merge_rollups(history, tail):
+    """
+    Append ``tail``'s buckets to ``history``'s at the same level.
+
+    Every reading behind ``tail`` must be later than every reading behind
+    ``history``, so the two can only share their boundary bucket, whose
+    stats are combined.
+    """
+    if not len(tail):
+        return history
+    if not len(history):
+        return tail
+    shared = int(history.ds[-1] == tail.ds[0])
+    head = slice(0, len(history) - shared)
+    boundary = slice(len(history) - shared, len(history))
+    rest = slice(shared, None)
+
+    def join(stat, combine):
+        parts = [stat(history)[:, head]]
+        if shared:
+            parts.append(combine(stat(history)[:, boundary], stat(tail)[:, :1]))
+        parts.append(stat(tail)[:, rest])
+        return np.concatenate(parts, axis=1)
+
+    return Rollup(
+        np.concatenate([history.ds, tail.ds[shared:]]),
+        history.columns,
+        join(lambda r: r.count, np.add),
+        join(lambda r: r.sum, np.add),
+        join(lambda r: r.min, np.fmin),
+        join(lambda r: r.max, np.fmax),
+    )
+
+
+def trim_pyramid(pyramid, after):
+    """
+    The part of ``pyramid`` made of readings later than minute ``after``.
+
+    Buckets that start after the one holding ``after`` are kept whole; that
+    bucket itself, at every level, is rebuilt from the minute buckets after
+    ``after``, so it can be merged onto a history ending at ``after``.
+    """
+    minutes = pyramid['1m']
+    later = minutes.select(slice(int(np.searchsorted(minutes.ds, after, side='right')), None))
+    trimmed = {}
+    for name, (unit, width) in LEVELS.items():
+        start = floor_datetimes(np.array([after], dtype='datetime64[ns]'), unit, width)[0]
+        boundary = later.rollup(unit, width)
+        boundary = boundary.select(boundary.ds == start)
+        level = pyramid[name]
+        rest = level.select(level.ds > start)
+        trimmed[name] = merge_rollups(boundary, rest) if len(boundary) else rest
+    return trimmed
+
+
+def merge_pyramids(history, tail):
+    """Merge two pyramids level by level (see ``merge_rollups``)."""
+    return {name: merge_rollups(history[name], tail[name]) for name in history}
@@ -0,0 +1,335 @@
+# data_api/samples.py
+"""
+Persisting consumed readings as InverterSample/WeatherSample rows, and range scans over them.
+
+The consumers hand every message to a ``SampleWriter``, which turns it into
+model rows (one per inverter for the wide inverter messages) and queues
+them; the queue is written with ``bulk_create`` in a single transaction
+once SAMPLE_BATCH_SIZE rows are pending or the oldest has waited
+SAMPLE_LINGER seconds. SQLite then commits (and syncs) once per few
+thousand rows instead of once per row, and since the database runs in WAL
+mode (see ``apps``) the views keep reading while a batch is written.
+
+Timestamps are stored as Unix seconds. The datasets and messages use naive
+IST wall-clock times, which convert both ways with a fixed offset, so range
+scans hand the views the same ``(ds, values)`` arrays a rollup has.
+
+The inverter and weather views read a window lying wholly outside the
+compiled dataset's minutes from the tables instead (``range_snapshot``):
+readings the consumer workers stored since the last flush to the store,
+and backfilled or older readings the store doesn't hold.
+"""
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from django.db import DatabaseError
+from django.db.models import Max
+
+from .datasets import DATASETS, clean_frame
+from .inverters import COLUMN_PATTERN, column_name, inverter_schema
+from .live import message_time, serving_snapshot
+from .models import INVERTER_FIELDS, WEATHER_COLUMNS, InverterSample, WeatherSample
+from .rollups import build_pyramid
+from .series import parse_range
+from .snapshots import Snapshot
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_LINGER = 5.0
+# Device name of the readings from the plant's single weather station
+DEFAULT_WEATHER_STATION = 'station'
+# Asia/Kolkata has been UTC+5:30 all year round since 1945
+IST_OFFSET = np.timedelta64(19800, 's')
+
+# Datasets the views may read from the sample tables, and the model holding their readings
+SAMPLE_MODELS = {'inverter': InverterSample, 'weather': WeatherSample}
+
+_INVERTER_METRIC_FIELDS = {metric: field for field, metric in INVERTER_FIELDS.items()}
+_WEATHER_COLUMN_FIELDS = {column: field for field, column in WEATHER_COLUMNS.items()}
+
+
+def ingest_settings():
+    """(rows per transaction, seconds a row may wait, weather station device) from settings, or the defaults."""
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_BATCH_SIZE, DEFAULT_LINGER, DEFAULT_WEATHER_STATION
+    return (
+        int(getattr(settings, 'SAMPLE_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+        float(getattr(settings, 'SAMPLE_LINGER', DEFAULT_LINGER)),
+        str(getattr(settings, 'WEATHER_STATION', DEFAULT_WEATHER_STATION)),
+    )
+
+
+def to_unix(ds):
+    """Naive IST datetime64 value(s) as Unix seconds."""
+    return (np.asarray(ds, dtype='datetime64[s]') - IST_OFFSET).astype(np.int64)
+
+
+def from_unix(ts):
+    """Unix seconds as naive IST datetime64[ns] value(s)."""
+    return (np.asarray(ts, dtype=np.int64).astype('datetime64[s]') + IST_OFFSET).astype('datetime64[ns]')
+
+
+def sample_fields(model):
+    """The reading fields of a sample model, in declaration order."""
+    return list(INVERTER_FIELDS if model is InverterSample else WEATHER_COLUMNS)
+
+
+@lru_cache(maxsize=1024)
+def inverter_field(key):
+    """(inverter, model field) of an inverter message key, or None for keys that aren't stored."""
+    match = COLUMN_PATTERN.match(key)
+    if match is None or match['metric'] not in _INVERTER_METRIC_FIELDS:
+        return None
+    return match['inverter'], _INVERTER_METRIC_FIELDS[match['metric']]
+
+
+def inverter_samples(data):
+    """One InverterSample per inverter reported in a wide inverter message."""
+    if data.get('ds') is None:
+        return []
+    ts = int(to_unix(message_time(data['ds'])))
+    readings = {}
+    for key, value in data.items():
+        target = inverter_field(key)
+        if target is not None and value is not None:
+            inverter, field = target
+            readings.setdefault(inverter, {})[field] = float(value)
+    return [InverterSample(device=inverter, ts=ts, **values) for inverter, values in readings.items()]
+
+
+def weather_samples(data, station=None):
+    """The WeatherSample of a weather message (a one-item list), empty without a 'ds'."""
+    if data.get('ds') is None:
+        return []
+    values = {
+        field: float(data[column]) for column, field in _WEATHER_COLUMN_FIELDS.items()
+        if data.get(column) is not None
+    }
+    station = station or ingest_settings()[2]
+    return [WeatherSample(device=station, ts=int(to_unix(message_time(data['ds']))), **values)]
+
+
+class SampleWriter:
+    """
+    Queues sample rows and writes them with ``bulk_create``, a batch per transaction.
+
+    A batch is written once ``batch_size`` rows are pending or the oldest
+    has waited ``linger`` seconds, checked as rows arrive; call ``flush()``
+    when a consumer stops. Rows whose (device, ts) is already stored are
+    skipped, so redelivered messages are harmless.
+    """
+
+    def __init__(self, batch_size=None, linger=None):
+        default_size, default_linger, _ = ingest_settings()
+        self.batch_size = batch_size or default_size
+        self.linger = default_linger if linger is None else linger
+        self.pending = {}  # model -> queued instances
+        self.queued = 0
+        self.oldest = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, model, rows):
+        """Queue instances of ``model``, writing everything queued if a batch is due."""
+        if not rows:
+            return
+        with self._lock:
+            self.pending.setdefault(model, []).extend(rows)
+            self.queued += len(rows)
+            now = time.monotonic()
+            if self.oldest is None:
+                self.oldest = now
+            due = self.queued >= self.batch_size or now - self.oldest >= self.linger
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write every queued row in one transaction; returns the number of rows written."""
+        from django.db import transaction
+
+        with self._lock:
+            pending, queued = self.pending, self.queued
+            self.pending, self.queued, self.oldest = {}, 0, None
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                for model, rows in pending.items():
+                    model.objects.bulk_create(rows, ignore_conflicts=True)
+        except Exception as e:
+            # The live buffers still hold the readings; don't stall the consumer on the database
+            self.failed += queued
+            print(f"Error writing {queued} samples: {e}")
+            return 0
+        self.written += queued
+        self.batches += 1
+        return queued
+
+    def report(self):
+        return {'queued': self.queued, 'written': self.written, 'batches': self.batches, 'failed': self.failed}
+
+
+writer = SampleWriter()
+
+
+def record_inverter(data):
+    """Queue an inverter message's readings for the database."""
+    writer.add(InverterSample, inverter_samples(data))
+
+
+def record_weather(data):
+    """Queue a weather message's readings for the database."""
+    writer.add(WeatherSample, weather_samples(data))
+
+
+def sample_range(model, device, start=None, end=None, fields=None):
+    """
+    One device's samples with ``start <= ds < end``, in time order.
+
+    ``start``/``end`` are naive IST datetime64 values (None = unbounded).
+    Returns ``(ds, values)``: a datetime64[ns] array and a (fields, rows)
+    float array with NaN for missing readings, the layout of a rollup's stat
+    arrays. The scan is a single walk of the (device, ts) index.
+    """
+    fields = list(fields or sample_fields(model))
+    queryset = model.objects.filter(device=device)
+    if start is not None:
+        queryset = queryset.filter(ts__gte=int(to_unix(start)))
+    if end is not None:
+        queryset = queryset.filter(ts__lt=int(to_unix(end)))
+    rows = list(queryset.order_by('ts').values_list('ts', *fields))
+    if not rows:
+        return np.array([], dtype='datetime64[ns]'), np.empty((len(fields), 0))
+    # None (a missing reading) becomes NaN
+    table = np.array(rows, dtype=float)
+    return from_unix(table[:, 0]), np.ascontiguousarray(table[:, 1:].T)
+
+
+def sample_devices(model):
+    """Devices with stored samples, sorted."""
+    return sorted(model.objects.values_list('device', flat=True).distinct())
+
+
+def sample_frame(model, start=None, end=None, devices=None):
+    """
+    Samples in ``[start, end)`` as a wide frame with the dataset's column names.
+
+    Inverter readings become ``INVERTER<id>_<metric>`` columns and weather
+    readings the weather CSV's columns, with a sorted 'ds' column first, so
+    the frame can go through ``clean_frame`` and ``build_pyramid`` like one
+    read from a CSV. Defaults to every stored device.
+    """
+    fields = sample_fields(model)
+    parts = []
+    for device in devices or sample_devices(model):
+        ds, values = sample_range(model, device, start, end, fields)
+        if model is InverterSample:
+            columns = [column_name(device, INVERTER_FIELDS[field]) for field in fields]
+        else:
+            columns = [WEATHER_COLUMNS[field] for field in fields]
+        parts.append(pd.DataFrame(values.T, index=pd.DatetimeIndex(ds, name='ds'), columns=columns))
+    if not parts:
+        return pd.DataFrame({'ds': pd.Series([], dtype='datetime64[ns]')})
+    return pd.concat(parts, axis=1).sort_index().reset_index()
+
+
+def sample_window(snapshot, params):
+    """
+    The ``(start, end)`` a request asks for if it lies wholly outside the snapshot's minutes, else None.
+
+    A window without bounds, or one overlapping the snapshot, is served by
+    the snapshot; so is an invalid one, which the view reports.
+    """
+    try:
+        start, end, _ = parse_range(params)
+    except ValueError:
+        return None
+    if start is None and end is None:
+        return None
+    ds = snapshot.pyramid['1m'].ds
+    if not len(ds) or (end is not None and end <= ds[0]) or (start is not None and start > ds[-1]):
+        return start, end
+    return None
+
+
+def samples_version(name):
+    """Changes with every sample of the dataset's model written: the largest row id."""
+    return SAMPLE_MODELS[name].objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def samples_snapshot(name, snapshot, start, end):
+    """The dataset's stored samples in [start, end), cleaned and rolled up with the columns of ``snapshot``."""
+    model = SAMPLE_MODELS[name]
+    columns = snapshot.pyramid['1m'].columns
+    devices = inverter_schema(columns).inverters if model is InverterSample else [ingest_settings()[2]]
+    df = sample_frame(model, start, end, devices).reindex(columns=['ds', *columns])
+    df = clean_frame(df, DATASETS[name], columns)
+    return Snapshot(name, build_pyramid(df, columns), f"{snapshot.version}+samples{samples_version(name)}",
+                    snapshot.signature)
+
+
+def range_snapshot(name, params):
+    """
+    What a request for dataset ``name`` is served from: its serving snapshot,
+    or the stored samples when the window (``start``/``end`` in ``params``)
+    lies wholly outside it.
+    """
+    snapshot = serving_snapshot(name)
+    window = sample_window(snapshot, params)
+    if window is None:
+        return snapshot
+    try:
+        return samples_snapshot(name, snapshot, *window)
+    except DatabaseError as e:
+        # Tables not migrated or locked: answer from the snapshot (an empty window)
+        print(f"Error reading the samples of '{name}': {e}")
+        return snapshot
+
+
+def range_version(name, params):
+    """The version of what ``range_snapshot`` serves, without reading the samples."""
+    snapshot = serving_snapshot(name)
+    if sample_window(snapshot, params) is None:
+        return snapshot.version
+    try:
+        return f"{snapshot.version}+samples{samples_version(name)}"
+    except DatabaseError:
+        return snapshot.version
+
+
+def frame_samples(name, df, station=None):
+    """
+    Sample rows of a dataset's raw CSV frame ('ds' parsed), for backfilling the tables.
+
+    'inverter'-layout datasets give one InverterSample per inverter and row,
+    the others one WeatherSample per row.
+    """
+    ts = to_unix(df['ds'].to_numpy(dtype='datetime64[ns]')).tolist()
+    if name == 'weather':
+        station = station or ingest_settings()[2]
+        columns = {field: column for field, column in WEATHER_COLUMNS.items() if column in df}
+        return model_rows(WeatherSample, df, columns, station, ts)
+    schema = inverter_schema(df.columns)
+    rows = []
+    for inverter in schema.inverters:
+        columns = {
+            field: column_name(inverter, metric) for field, metric in INVERTER_FIELDS.items()
+            if column_name(inverter, metric) in df
+        }
+        rows.extend(model_rows(InverterSample, df, columns, inverter, ts))
+    return rows
+
+
+def model_rows(model, df, columns, device, ts):
+    """Instances of ``model`` for one device, a row of ``df`` each, from a field -> column mapping."""
+    fields = list(columns)
+    values = df[list(columns.values())].to_numpy(dtype=float)
+    # Stored as NULL rather than NaN
+    table = values.astype(object)
+    table[np.isnan(values)] = None
+    return [model(device=device, ts=t, **dict(zip(fields, row))) for t, row in zip(ts, table.tolist())]
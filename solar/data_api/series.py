@@ -0,0 +1,237 @@
+# data_api/series.py
+"""
+Column-wise grouping and serialization of time series for the data views.
+
+The views used to walk the frame with ``iterrows`` and call ``strftime`` twice
+per row. Everything here works on whole columns instead: timestamps are
+formatted with ``np.datetime_as_string``, group keys are factorized once and
+value cleaning is a single NumPy pass. The output is the same
+``{group_key: [{'timestamp': ..., feature: value}, ...]}`` layout the
+frontend already consumes.
+"""
+import numpy as np
+import pandas as pd
+import pytz
+
+IST = pytz.timezone('Asia/Kolkata')
+
+# Rows read, cleaned and grouped at a time when streaming a response
+STREAM_BLOCK_ROWS = 16384
+
+# (group key, point timestamp) layout per graph_type. Each entry is a
+# np.datetime_as_string unit plus a literal suffix, matching the strftime
+# formats the views have always returned:
+#   minute          -> '%Y-%m-%d %H:00' / '%Y-%m-%d %H:%M:%S'
+#   5min/15min/hourly -> '%Y-%m-%d'     / '%Y-%m-%d %H:%M'
+#   daily           -> '%Y-%m'          / '%Y-%m-%d'
+#   monthly         -> '%Y'             / '%Y-%m'
+GROUP_FORMATS = {
+    'minute': (('h', ':00'), ('s', '')),
+    '5min': (('D', ''), ('m', '')),
+    '15min': (('D', ''), ('m', '')),
+    'hourly': (('D', ''), ('m', '')),
+    'daily': (('M', ''), ('D', '')),
+    'monthly': (('Y', ''), ('M', '')),
+}
+
+
+def datetime_values(ds):
+    """Return ``ds`` as a naive datetime64[ns] array (wall-clock time)."""
+    ds = pd.Series(ds)
+    if getattr(ds.dt, 'tz', None) is not None:
+        ds = ds.dt.tz_localize(None)
+    return ds.to_numpy(dtype='datetime64[ns]')
+
+
+def parse_timestamp(value, name):
+    """
+    Parse a ``start``/``end`` query value into a naive datetime64 in IST.
+
+    The datasets hold naive IST wall-clock times, so aware inputs are
+    converted to IST first. Returns None when the parameter is absent.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        ts = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name} parameter. Must be an ISO date or datetime.")
+    if ts is pd.NaT:
+        raise ValueError(f"Invalid {name} parameter. Must be an ISO date or datetime.")
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(IST).tz_localize(None)
+    return ts.to_datetime64().astype('datetime64[ns]')
+
+
+def parse_range(params):
+    """Read ``start``, ``end`` and ``limit`` from the query string."""
+    start = parse_timestamp(params.get('start'), 'start')
+    end = parse_timestamp(params.get('end'), 'end')
+
+    limit = parse_count(params, 'limit')
+    return start, end, limit
+
+
+def parse_list(params, name, choices, default=None):
+    """
+    Read a comma-separated query parameter whose items must be in ``choices``.
+
+    Returns ``default`` when the parameter is absent; without a default it
+    is required.
+    """
+    value = params.get(name)
+    if not value and default is not None:
+        return list(default)
+    items = [item.strip() for item in (value or '').split(',') if item.strip()]
+    if not items or any(item not in choices for item in items):
+        raise ValueError(f"Invalid {name} parameter. Must be a comma-separated list of {', '.join(choices)}.")
+    # Repeated names would collide in the response
+    return list(dict.fromkeys(items))
+
+
+def parse_flag(params, name):
+    """Read an optional boolean query parameter ('1'/'true'/'yes' or '0'/'false'/'no')."""
+    value = (params.get(name) or '').lower()
+    if value in ('', '0', 'false', 'no'):
+        return False
+    if value in ('1', 'true', 'yes'):
+        return True
+    raise ValueError(f"Invalid {name} parameter. Must be true or false.")
+
+
+def parse_count(params, name, minimum=1):
+    """Read an optional integer query parameter of at least ``minimum``."""
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = minimum - 1
+    if value < minimum:
+        raise ValueError(f"Invalid {name} parameter. Must be an integer of at least {minimum}.")
+    return value
+
+
+def time_window(ds, start=None, end=None, limit=None):
+    """
+    Locate the rows of a sorted datetime64 array falling in [start, end).
+
+    Both bounds are found by binary search, so the cost is O(log n) whatever
+    the dataset size. With ``limit`` the window is cut after that many rows
+    and the timestamp of the first row left out is returned as the cursor to
+    pass back as ``start``; otherwise the cursor is None.
+    """
+    lo = 0 if start is None else int(np.searchsorted(ds, start, side='left'))
+    hi = len(ds) if end is None else int(np.searchsorted(ds, end, side='left'))
+    hi = max(lo, hi)
+
+    next_cursor = None
+    if limit is not None and hi - lo > limit:
+        hi = lo + limit
+        next_cursor = pd.Timestamp(ds[hi])
+    return slice(lo, hi), next_cursor
+
+
+def date_bounds(ds):
+    """First and last timestamps of a sorted datetime64 array, or (None, None) when it is empty."""
+    if not len(ds):
+        return None, None
+    return pd.Timestamp(ds[0]), pd.Timestamp(ds[-1])
+
+
+def format_datetimes(values, unit, suffix=''):
+    """Format a datetime64 array as 'YYYY-MM-DD HH:MM:SS' strings truncated to ``unit``."""
+    text = np.datetime_as_string(values, unit=unit)
+    if unit not in ('Y', 'M', 'D') and len(text):
+        # Swap the ISO 'T' separator for a space directly in the UCS-4 buffer.
+        text.view(np.uint32).reshape(len(text), -1)[:, 10] = ord(' ')
+    if suffix:
+        text = np.char.add(text, suffix)
+    return text
+
+
+def clean_values(values):
+    """
+    Replace NaN and negative readings with 0, returning a plain list.
+
+    Mirrors ``max(v, 0) if pd.notna(v) else 0``: valid readings stay floats,
+    replaced ones become the integer 0.
+    """
+    values = np.asarray(values, dtype=float)
+    cleaned = values.tolist()
+    for i in np.flatnonzero(np.isnan(values) | (values < 0)).tolist():
+        cleaned[i] = 0
+    return cleaned
+
+
+def group_positions(keys):
+    """Return the unique keys in first-seen order and the row positions of each."""
+    codes, uniques = pd.factorize(keys, sort=False)
+    if len(codes) and np.all(codes[1:] >= codes[:-1]):
+        # Sorted input: every group is a contiguous run of rows.
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds)).tolist()
+        stops = np.concatenate((bounds, [len(codes)])).tolist()
+        return uniques.tolist(), [range(a, b) for a, b in zip(starts, stops)]
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+    return uniques.tolist(), [part.tolist() for part in np.split(order, bounds)]
+
+
+def group_records(ds, series, graph_type):
+    """
+    Group per-row points under their hour/day/month/year key.
+
+    ``series`` maps output field names to equally long lists of cleaned
+    values; each point is ``{'timestamp': ..., name: value, ...}``.
+    """
+    (key_unit, key_suffix), (ts_unit, ts_suffix) = GROUP_FORMATS[graph_type]
+    values = datetime_values(ds)
+    valid = ~np.isnat(values)
+    if not valid.all():
+        values = values[valid]
+        positions = np.flatnonzero(valid).tolist()
+        series = {name: [column[i] for i in positions] for name, column in series.items()}
+
+    keys = format_datetimes(values, key_unit, key_suffix)
+    timestamps = format_datetimes(values, ts_unit, ts_suffix).tolist()
+    uniques, groups = group_positions(keys)
+
+    if len(series) == 1:
+        ((name, column),) = series.items()
+        return {
+            key: [{'timestamp': timestamps[i], name: column[i]} for i in rows]
+            for key, rows in zip(uniques, groups)
+        }
+
+    columns = list(series.items())
+    return {
+        key: [
+            dict([('timestamp', timestamps[i])] + [(name, column[i]) for name, column in columns])
+            for i in rows
+        ]
+        for key, rows in zip(uniques, groups)
+    }
+
+
+def iter_groups(ds, rows, load, graph_type, block_rows=STREAM_BLOCK_ROWS):
+    """
+    Yield group_records' ``(key, points)`` pairs one group at a time.
+
+    The ``rows`` window of the sorted ``ds`` is read ``block_rows`` at a
+    time; ``load(block)`` returns ``{name: cleaned values}`` for one slice
+    of it. Only one block is held in memory whatever the window size, and a
+    group spanning two blocks is still yielded once.
+    """
+    key, points = None, []
+    for lo in range(rows.start, rows.stop, block_rows):
+        block = slice(lo, min(lo + block_rows, rows.stop))
+        for block_key, block_points in group_records(ds[block], load(block), graph_type).items():
+            if block_key != key:
+                if points:
+                    yield key, points
+                key, points = block_key, []
+            points.extend(block_points)
+    if points:
+        yield key, points
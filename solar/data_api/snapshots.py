@@ -0,0 +1,124 @@
+# data_api/snapshots.py
+"""
+Immutable dataset snapshots with background hot-reload.
+
+A snapshot is a read-only rollup pyramid plus the version it was built
+from. Views take the current snapshot once per request and read only from
+it, so nothing mutates shared frames and a reload can never change data
+halfway through a response. A daemon thread in every worker polls the
+source CSV and the compiled store's CURRENT pointer; when either changes it
+builds a new snapshot off the request path and swaps it in with a single
+reference assignment.
+"""
+import os
+import threading
+import time
+
+from .datasets import DATASETS, STORE_DIR, load_pyramid, read_schema
+
+DEFAULT_WATCH_INTERVAL = 5.0
+
+
+class Snapshot:
+    """One immutable version of a dataset's rollup pyramid."""
+
+    def __init__(self, name, pyramid, version, signature):
+        for rollup in pyramid.values():
+            for array in (rollup.ds, rollup.count, rollup.sum, rollup.min, rollup.max):
+                array.flags.writeable = False
+        self.name = name
+        self.pyramid = pyramid
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+
+# name -> current Snapshot; replaced wholesale on reload, never mutated
+_snapshots = {}
+_load_lock = threading.Lock()
+_watcher = None
+
+
+def file_signature(path):
+    """(size, mtime_ns) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def source_signature(name, store_dir=STORE_DIR):
+    """What the watcher compares: the CSV and the compiled store's CURRENT pointer."""
+    return (
+        file_signature(DATASETS[name]['source']),
+        file_signature(os.path.join(store_dir, name, 'CURRENT')),
+    )
+
+
+def build_snapshot(name, store_dir=STORE_DIR):
+    """Load a dataset (compiling it if stale) into a new Snapshot."""
+    signature = source_signature(name, store_dir)
+    pyramid = load_pyramid(name, store_dir)
+    schema = read_schema(os.path.join(store_dir, name))
+    if schema is not None:
+        version = schema['version']
+    else:
+        size, mtime_ns = signature[0] or (0, 0)
+        version = f"csv-{mtime_ns}-{size}"
+    # Compiling may have rewritten CURRENT; record the state we actually loaded
+    return Snapshot(name, pyramid, version, source_signature(name, store_dir))
+
+
+def get_snapshot(name):
+    """Return the current snapshot of a dataset, loading it on first use."""
+    snapshot = _snapshots.get(name)
+    if snapshot is None:
+        with _load_lock:
+            snapshot = _snapshots.get(name)
+            if snapshot is None:
+                snapshot = build_snapshot(name)
+                _snapshots[name] = snapshot
+        start_watcher()
+    return snapshot
+
+
+def refresh(name):
+    """Rebuild a dataset's snapshot if its files changed; returns True if swapped."""
+    current = _snapshots.get(name)
+    if current is not None and source_signature(name) == current.signature:
+        return False
+    snapshot = build_snapshot(name)
+    _snapshots[name] = snapshot
+    print(f"Reloaded dataset '{name}' as version {snapshot.version}")
+    return True
+
+
+def watch_interval():
+    """Seconds between checks, from settings.DATASET_WATCH_INTERVAL."""
+    from django.conf import settings
+    if settings.configured:
+        return getattr(settings, 'DATASET_WATCH_INTERVAL', DEFAULT_WATCH_INTERVAL)
+    return DEFAULT_WATCH_INTERVAL
+
+
+def _watch():
+    while True:
+        time.sleep(watch_interval())
+        for name in list(_snapshots):
+            try:
+                refresh(name)
+            except Exception as e:
+                # Keep serving the previous snapshot; try again next tick
+                print(f"Error reloading dataset '{name}': {e}")
+
+
+def start_watcher():
+    """Start this process's reload thread once; a non-positive interval disables it."""
+    global _watcher
+    if _watcher is not None or watch_interval() <= 0:
+        return
+    with _load_lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name='dataset-watcher', daemon=True)
+            _watcher.start()
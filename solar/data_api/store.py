@@ -0,0 +1,163 @@
+# data_api/store.py
+"""
+Columnar on-disk store for rollup pyramids.
+
+A compiled dataset is a directory of raw ``.npy`` arrays, one per
+(level, stat), plus a ``schema.json`` sidecar describing the columns,
+levels and the source file it was built from:
+
+    <store>/<dataset>/CURRENT              name of the live version
+    <store>/<dataset>/<version>/schema.json
+    <store>/<dataset>/<version>/1h.sum.npy ...
+
+Arrays are opened with ``mmap_mode='r'``, so loading takes milliseconds and
+every worker process maps the same page-cache pages instead of parsing the
+CSV into a private copy. Versions are published by rewriting CURRENT with
+``os.replace``, so readers never see a half-written dataset.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .rollups import LEVELS, Rollup
+
+FORMAT_VERSION = 1
+STATS = ('ds', 'count', 'sum', 'min', 'max')
+
+
+def level_file(level, stat):
+    """File name for one level's stat; '1M' is spelled '1mo' so it never clashes with '1m'."""
+    return f"{'1mo' if level == '1M' else level}.{stat}.npy"
+
+
+def current_version(dataset_dir):
+    """Return the version named by CURRENT, or None if nothing was published."""
+    try:
+        with open(os.path.join(dataset_dir, 'CURRENT')) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_schema(dataset_dir):
+    """Return the live version's schema, or None if nothing was published."""
+    version = current_version(dataset_dir)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(dataset_dir, version, 'schema.json')) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def write_pyramid(dataset_dir, version, pyramid, metadata):
+    """
+    Write ``pyramid`` as ``version`` and make it the live version.
+
+    ``metadata`` (source path, size, mtime, ...) is stored in the schema so
+    readers can tell whether the compiled copy is stale. Older versions are
+    removed once the new one is live; processes still mapping them keep
+    their pages until they reload.
+    """
+    target = os.path.join(dataset_dir, version)
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    levels = {}
+    columns = []
+    for level, rollup in pyramid.items():
+        columns = rollup.columns
+        np.save(os.path.join(staging, level_file(level, 'ds')), rollup.ds.astype('datetime64[ns]'))
+        np.save(os.path.join(staging, level_file(level, 'count')), rollup.count)
+        np.save(os.path.join(staging, level_file(level, 'sum')), rollup.sum)
+        np.save(os.path.join(staging, level_file(level, 'min')), rollup.min)
+        np.save(os.path.join(staging, level_file(level, 'max')), rollup.max)
+        levels[level] = {'buckets': len(rollup)}
+
+    schema = dict(metadata, format=FORMAT_VERSION, version=version, columns=columns, levels=levels)
+    with open(os.path.join(staging, 'schema.json'), 'w') as file:
+        json.dump(schema, file, indent=4)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+    pointer = os.path.join(dataset_dir, f"CURRENT.tmp-{os.getpid()}")
+    with open(pointer, 'w') as file:
+        file.write(version)
+    os.replace(pointer, os.path.join(dataset_dir, 'CURRENT'))
+
+    for entry in os.listdir(dataset_dir):
+        path = os.path.join(dataset_dir, entry)
+        if entry != version and os.path.isdir(path) and '.tmp-' not in entry:
+            shutil.rmtree(path, ignore_errors=True)
+    return schema
+
+
+def read_pyramid(dataset_dir, mmap=True):
+    """
+    Open the live version of a compiled dataset.
+
+    Returns ``(pyramid, schema)``, or ``(None, None)`` if nothing usable is
+    published. With ``mmap`` the arrays are read-only memory maps.
+    """
+    schema = read_schema(dataset_dir)
+    if schema is None or schema.get('format') != FORMAT_VERSION:
+        return None, None
+
+    directory = os.path.join(dataset_dir, schema['version'])
+    mode = 'r' if mmap else None
+    pyramid = {}
+    try:
+        for level in LEVELS:
+            arrays = {
+                stat: np.load(os.path.join(directory, level_file(level, stat)), mmap_mode=mode)
+                for stat in STATS
+            }
+            pyramid[level] = Rollup(
+                arrays['ds'], schema['columns'],
+                arrays['count'], arrays['sum'], arrays['min'], arrays['max'],
+            )
+    except FileNotFoundError:
+        return None, None
+    return pyramid, schema
+
+
+def mapped_memory(directory):
+    """
+    Resident memory of this process's mappings of files under ``directory``.
+
+    Reads /proc/self/smaps (Linux). ``shared`` is what other workers mapping
+    the same files reuse from the page cache, ``private`` is what this worker
+    holds on its own. Returns None where smaps is unavailable.
+    """
+    directory = os.path.realpath(directory) + os.sep
+    totals = {'mapped': 0, 'resident': 0, 'shared': 0, 'private': 0}
+    try:
+        with open('/proc/self/smaps') as file:
+            inside = False
+            for line in file:
+                fields = line.split()
+                if not fields:
+                    continue
+                if not fields[0].endswith(':'):
+                    # Mapping header: address perms offset dev inode [path]
+                    header = line.split(None, 5)
+                    inside = len(header) == 6 and header[5].strip().startswith(directory)
+                elif inside and fields[0] in ('Size:', 'Rss:', 'Shared_Clean:', 'Shared_Dirty:',
+                                              'Private_Clean:', 'Private_Dirty:'):
+                    size = int(fields[1]) * 1024
+                    if fields[0] == 'Size:':
+                        totals['mapped'] += size
+                    elif fields[0] == 'Rss:':
+                        totals['resident'] += size
+                    elif fields[0].startswith('Shared'):
+                        totals['shared'] += size
+                    else:
+                        totals['private'] += size
+    except OSError:
+        return None
+    return totals
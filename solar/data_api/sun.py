@@ -0,0 +1,112 @@
+# data_api/sun.py
+"""
+Night masking from the sun's position at the plant.
+
+Readings taken while the sun is below NIGHT_SUN_ELEVATION degrees are
+zeroed. The elevation comes from NOAA's general solar position equations
+for the plant's coordinates (settings.PLANT_LATITUDE / PLANT_LONGITUDE),
+so the mask follows sunrise and sunset through the year instead of a fixed
+clock window. Elevations are computed once per day for every minute of it
+and cached; masking a frame is then one table lookup per timestamp.
+
+Timestamps are naive IST wall-clock times, like every dataset here.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# Defaults for a plant in Ahmedabad, Gujarat; override in settings
+DEFAULT_LATITUDE = 23.03
+DEFAULT_LONGITUDE = 72.58
+# Civil dusk/dawn: panels produce nothing once the sun is this far down
+DEFAULT_NIGHT_ELEVATION = -6.0
+
+UTC_OFFSET_HOURS = 5.5  # IST, no daylight saving
+MINUTES_PER_DAY = 24 * 60
+
+
+def plant_location():
+    """(latitude, longitude, night elevation) from settings, or the defaults."""
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_LATITUDE, DEFAULT_LONGITUDE, DEFAULT_NIGHT_ELEVATION
+    return (
+        float(getattr(settings, 'PLANT_LATITUDE', DEFAULT_LATITUDE)),
+        float(getattr(settings, 'PLANT_LONGITUDE', DEFAULT_LONGITUDE)),
+        float(getattr(settings, 'NIGHT_SUN_ELEVATION', DEFAULT_NIGHT_ELEVATION)),
+    )
+
+
+@lru_cache(maxsize=4096)
+def day_elevations(day, latitude, longitude):
+    """
+    Sun elevation in degrees at every minute of one day.
+
+    ``day`` is a datetime64[D] as an integer (days since 1970-01-01).
+    Returns a read-only float array of 1440 values.
+    """
+    date = np.datetime64(day, 'D')
+    day_of_year = (date - date.astype('datetime64[Y]')).astype(np.int64) + 1
+    minutes = np.arange(MINUTES_PER_DAY, dtype=float)
+
+    # Fractional year, equation of time (minutes) and declination (radians)
+    gamma = 2 * np.pi / 365 * (day_of_year - 1 + (minutes / 60 - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                       - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+
+    # True solar time -> hour angle -> solar zenith
+    solar_time = minutes + eqtime + 4 * longitude - 60 * UTC_OFFSET_HOURS
+    hour_angle = np.radians(solar_time / 4 - 180)
+    lat = np.radians(latitude)
+    cos_zenith = np.sin(lat) * np.sin(decl) + np.cos(lat) * np.cos(decl) * np.cos(hour_angle)
+    elevation = 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    elevation.flags.writeable = False
+    return elevation
+
+
+def sun_elevation(ds, latitude=None, longitude=None):
+    """Sun elevation in degrees at every timestamp of a datetime64 array, to the minute (NaN for NaT)."""
+    if latitude is None or longitude is None:
+        latitude, longitude, _ = plant_location()
+    ds = np.asarray(ds, dtype='datetime64[m]')
+    elevation = np.full(ds.shape, np.nan)
+    valid = ~np.isnat(ds)
+    if not valid.any():
+        return elevation
+    ds = ds[valid]
+    days = ds.astype('datetime64[D]')
+    unique_days, inverse = np.unique(days, return_inverse=True)
+    table = np.stack([day_elevations(int(day), latitude, longitude) for day in unique_days.astype(np.int64)])
+    elevation[valid] = table[inverse.ravel(), (ds - days).astype(np.int64)]
+    return elevation
+
+
+def night_mask(ds, span=None):
+    """
+    True where a timestamp is at night.
+
+    With ``span`` (a timedelta64) each timestamp starts a bucket of that
+    length, which is night only if the sun is down at both its ends.
+    """
+    _, _, threshold = plant_location()
+    ds = np.asarray(ds, dtype='datetime64[ns]')
+    night = sun_elevation(ds) < threshold
+    if span is not None:
+        night &= sun_elevation(ds + span - np.timedelta64(1, 'm')) < threshold
+    return night
+
+
+def mask_night(df, columns, time_column='ds', span=None, keep_missing=False):
+    """
+    Zero ``columns`` of ``df`` at night and clip them at 0, in place.
+
+    With ``keep_missing`` NaN readings stay NaN instead of becoming 0.
+    """
+    night = night_mask(df[time_column].to_numpy(dtype='datetime64[ns]'), span)
+    values = df[columns].to_numpy(dtype=float)
+    zero = night[:, None] & ~np.isnan(values) if keep_missing else night[:, None]
+    df[columns] = np.where(zero, 0.0, values).clip(min=0)
+    return df
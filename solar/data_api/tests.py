@@ -1,3 +1,1090 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from functools import partial
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.http import JsonResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import snapshots
+from .cache import cached_response, response_cache
+from .current import MinuteIndex, current_values, minute_index
+from .datasets import DATASETS, STORE_DIR, compile_dataset, read_source, source_metadata, store_lock
+from .downsample import downsample, lttb_indices
+from .formats import columnar_series, gap_runs, msgpack
+from .histograms import bin_edges, binned_statistics, sorted_percentiles
+from .inverters import FEATURE_METRICS, InverterSchema, inverter_schema, parse_inverter, plant_total
+from .kpis import cap_percent_columns, percent_caps
+from .joins import AsofIndex, joined_values, parse_tolerance
+from .live import merge_snapshots
+from .models import InverterSample, WeatherSample
+from .rollups import LEVELS, build_pyramid
+from .samples import (
+    SampleWriter, inverter_samples, range_snapshot, range_version, sample_frame, sample_range, weather_samples
+)
+from .series import iter_groups
+from .snapshots import Snapshot, get_snapshot, refresh
+from .store import current_version, read_pyramid, read_schema, write_pyramid
+from .sun import mask_night, sun_elevation
+
+
+def minutes(count, start='2024-01-01T00:00'):
+    """``count`` consecutive minutes as datetime64[ns]."""
+    return (np.datetime64(start, 'm') + np.arange(count)).astype('datetime64[ns]')
+
+
+def minute_frame(count, start='2024-01-01T00:00', seed=0, columns=('a', 'b')):
+    """Random minute readings of ``columns`` with a few NaN, like a cleaned dataset."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'ds': minutes(count, start)})
+    for column in columns:
+        values = rng.normal(100, 20, count)
+        values[rng.random(count) < 0.05] = np.nan
+        df[column] = values
+    return df
+
+
+def assert_pyramids_equal(test, actual, expected):
+    for name in LEVELS:
+        a, e = actual[name], expected[name]
+        test.assertEqual(a.ds.tolist(), e.ds.tolist(), name)
+        np.testing.assert_array_equal(a.count, e.count, err_msg=name)
+        np.testing.assert_allclose(a.sum, e.sum, err_msg=name)
+        np.testing.assert_array_equal(a.min, e.min, err_msg=name)
+        np.testing.assert_array_equal(a.max, e.max, err_msg=name)
+
+
+class RollupTests(SimpleTestCase):
+    # Pyramid level -> pandas resample rule
+    RULES = {'5m': '5min', '15m': '15min', '1h': 'h', '1d': 'D', '1M': 'MS'}
+    columns = ['a', 'b']
+
+    def setUp(self):
+        df = minute_frame(75 * 24 * 60, start='2024-01-20T00:00')
+        # An outage: a day and a half without rows
+        self.df = df.drop(index=range(20000, 22160)).reset_index(drop=True)
+        self.pyramid = build_pyramid(self.df, self.columns)
+
+    def test_levels_match_a_pandas_resample(self):
+        indexed = self.df.set_index('ds')
+        for name, rule in self.RULES.items():
+            resampled = indexed.resample(rule)
+            # Buckets are only kept where there are rows
+            expected = {stat: getattr(resampled, stat)()[resampled.size() > 0] for stat in ('count', 'sum', 'min', 'max')}
+            level = self.pyramid[name]
+            np.testing.assert_array_equal(level.ds, expected['count'].index.to_numpy('datetime64[ns]'), err_msg=name)
+            for stat, values in expected.items():
+                np.testing.assert_allclose(getattr(level, stat), values[self.columns].to_numpy().T, err_msg=f'{name} {stat}')
+
+    def test_minute_level_holds_the_readings(self):
+        level = self.pyramid['1m']
+        np.testing.assert_array_equal(level.ds, self.df['ds'].to_numpy('datetime64[ns]'))
+        np.testing.assert_array_equal(level.values(self.columns, 'mean'), self.df[self.columns].to_numpy().T)
+
+    def test_aggregates_read_from_the_stats(self):
+        level = self.pyramid['1h']
+        hours = self.df.set_index('ds').resample('h')
+        hours = {agg: getattr(hours, agg)()[hours.size() > 0] for agg in ('mean', 'count', 'max')}
+        for agg, expected in hours.items():
+            np.testing.assert_allclose(level.values('a', agg), expected['a'].to_numpy(), err_msg=agg)
+
+    def test_empty_frame_gives_empty_levels(self):
+        pyramid = build_pyramid(minute_frame(0), self.columns)
+        for name in LEVELS:
+            self.assertEqual(len(pyramid[name]), 0)
+            self.assertEqual(pyramid[name].sum.shape, (2, 0))
+
+
+class StoreTests(SimpleTestCase):
+    columns = ['a', 'b']
+
+    def setUp(self):
+        store = tempfile.TemporaryDirectory()
+        self.addCleanup(store.cleanup)
+        self.dataset_dir = os.path.join(store.name, 'test')
+        self.pyramid = build_pyramid(minute_frame(3 * 24 * 60), self.columns)
+
+    def test_nothing_published_reads_as_none(self):
+        self.assertEqual(read_pyramid(self.dataset_dir), (None, None))
+        self.assertIsNone(read_schema(self.dataset_dir))
+
+    def test_round_trip_as_read_only_memory_maps(self):
+        write_pyramid(self.dataset_dir, 'v1', self.pyramid, {'source': 'test.csv'})
+        pyramid, schema = read_pyramid(self.dataset_dir)
+        assert_pyramids_equal(self, pyramid, self.pyramid)
+        self.assertEqual((schema['version'], schema['columns'], schema['source']), ('v1', self.columns, 'test.csv'))
+        self.assertEqual(schema['levels']['1h']['buckets'], len(self.pyramid['1h']))
+        minute = pyramid['1m']
+        self.assertIsInstance(minute.sum, np.memmap)
+        self.assertFalse(minute.sum.flags.writeable)
+
+    def test_new_version_swaps_current_and_removes_the_old_one(self):
+        write_pyramid(self.dataset_dir, 'v1', self.pyramid, {})
+        old, _ = read_pyramid(self.dataset_dir)
+        newer = build_pyramid(minute_frame(100, seed=1), self.columns)
+        write_pyramid(self.dataset_dir, 'v2', newer, {})
+
+        self.assertEqual(current_version(self.dataset_dir), 'v2')
+        assert_pyramids_equal(self, read_pyramid(self.dataset_dir)[0], newer)
+        self.assertEqual(sorted(os.listdir(self.dataset_dir)), ['CURRENT', 'v2'])
+        # A reader still mapping the old version keeps its data
+        assert_pyramids_equal(self, old, self.pyramid)
+
+    def test_a_missing_array_reads_as_unpublished(self):
+        write_pyramid(self.dataset_dir, 'v1', self.pyramid, {})
+        os.remove(os.path.join(self.dataset_dir, 'v1', '1h.sum.npy'))
+        self.assertEqual(read_pyramid(self.dataset_dir), (None, None))
+
+
+class SnapshotTests(SimpleTestCase):
+    """Snapshots of the compiled weather dataset, reloaded when the store publishes a new version."""
+
+    def setUp(self):
+        patch = mock.patch.dict(snapshots._snapshots, clear=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.snapshot = get_snapshot('weather')
+
+    def publish(self, version, pyramid):
+        with store_lock('weather'):
+            write_pyramid(os.path.join(STORE_DIR, 'weather'), version, pyramid, source_metadata('weather'))
+        # Put the compiled CSV back for the other tests
+        self.addCleanup(compile_dataset, 'weather')
+
+    def test_arrays_are_read_only(self):
+        built = Snapshot('test', build_pyramid(minute_frame(100), ['a', 'b']), 'v1', None)
+        for snapshot in (self.snapshot, built):
+            for name, rollup in snapshot.pyramid.items():
+                for array in (rollup.ds, rollup.count, rollup.sum, rollup.min, rollup.max):
+                    self.assertFalse(array.flags.writeable, name)
+            with self.assertRaises(ValueError):
+                snapshot.pyramid['1m'].sum[0, 0] = 1.0
+
+    def test_refresh_keeps_an_unchanged_snapshot(self):
+        self.assertFalse(refresh('weather'))
+        self.assertIs(get_snapshot('weather'), self.snapshot)
+
+    def test_refresh_swaps_in_a_newly_published_version(self):
+        columns = self.snapshot.pyramid['1m'].columns
+        old_minutes = len(self.snapshot.pyramid['1m'])
+        self.publish('test-v2', build_pyramid(minute_frame(90, columns=columns), columns))
+
+        self.assertTrue(refresh('weather'))
+        snapshot = get_snapshot('weather')
+        self.assertIsNot(snapshot, self.snapshot)
+        self.assertEqual(snapshot.version, 'test-v2')
+        self.assertNotEqual(snapshot.version, self.snapshot.version)
+        self.assertEqual(len(snapshot.pyramid['1m']), 90)
+        self.assertFalse(snapshot.pyramid['1m'].sum.flags.writeable)
+        # A request still holding the previous snapshot reads it unchanged
+        self.assertEqual(len(self.snapshot.pyramid['1m']), old_minutes)
+        self.assertFalse(refresh('weather'))
+
+
+class DownsampleTests(SimpleTestCase):
+    def test_lttb_keeps_the_ends_and_the_peak(self):
+        y = np.zeros(1000)
+        y[437] = 10.0
+        keep = lttb_indices(np.arange(1000), y, 50)
+        self.assertEqual(len(keep), 50)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(437, keep)
+
+    def test_short_series_are_returned_whole(self):
+        positions, metadata = downsample(minutes(10), {'a': list(range(10))}, 100)
+        self.assertEqual(positions.tolist(), list(range(10)))
+        self.assertEqual(metadata['output_points'], 10)
+
+    def test_output_never_exceeds_max_points(self):
+        rng = np.random.default_rng(0)
+        ds = minutes(5000)
+        for count in (1, 2, 7, 60):
+            series = {f's{i}': rng.normal(size=len(ds)).tolist() for i in range(count)}
+            series['s0'][100] = None
+            for max_points in (3, 10, 100, 1000):
+                positions, metadata = downsample(ds, series, max_points)
+                self.assertLessEqual(len(positions), max_points, (count, max_points))
+                self.assertEqual(metadata['output_points'], len(positions))
+                self.assertEqual((positions[0], positions[-1]), (0, len(ds) - 1))
+                self.assertTrue((np.diff(positions) > 0).all())
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        response_cache.invalidate()
+        self.version = 'v1'
+        self.calls = 0
+
+        @cached_response(lambda request: self.version)
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'version': self.version, 'call': self.calls})
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def get(self, query='a=1', **headers):
+        return self.view(self.factory.get(f'/?{query}', **headers))
+
+    def test_second_request_is_a_hit_with_the_same_etag(self):
+        first, second = self.get(), self.get()
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.calls, 1)
+
+    def test_matching_if_none_match_gets_304(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.calls, 1)
+
+    def test_query_strings_are_cached_apart(self):
+        self.get('a=1')
+        self.assertEqual(self.get('a=2')['X-Cache'], 'MISS')
+        self.assertEqual(self.calls, 2)
+
+    def test_new_version_misses_and_drops_the_old_entries(self):
+        etag = self.get()['ETag']
+        self.version = 'v2'
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response_cache.stats()['entries'], 1)
+
+    def test_invalidate_drops_the_view(self):
+        self.get()
+        response_cache.invalidate(self.view)
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+    def test_response_of_a_reload_during_the_view_is_not_cached(self):
+        @cached_response(lambda request: self.version)
+        def reloading(request):
+            # The data is reloaded while the view runs
+            self.version = 'v2'
+            return JsonResponse({'version': self.version})
+
+        response = reloading(self.factory.get('/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual(response_cache.stats()['entries'], 0)
+
+
+class MergeSnapshotsTests(SimpleTestCase):
+    columns = ['a', 'b']
+
+    def snapshot(self, df, version):
+        return Snapshot('test', build_pyramid(df, self.columns), version, None)
+
+    def test_live_readings_after_the_history_are_appended(self):
+        df = minute_frame(3 * 24 * 60 + 7)
+        history, live = df.iloc[:2000], df.iloc[2000:]
+        merged = merge_snapshots(self.snapshot(history, 'h1'), self.snapshot(live, 'l1'))
+        assert_pyramids_equal(self, merged.pyramid, build_pyramid(df, self.columns))
+
+    def test_overlapping_live_minutes_keep_the_history(self):
+        df = minute_frame(3 * 24 * 60 + 7)
+        history = df.iloc[:2000]
+        # The live readings start 30 minutes before the history ends, with other values
+        live = minute_frame(len(df) - 1970, start=str(df['ds'][1970]), seed=1)
+        merged = merge_snapshots(self.snapshot(history, 'h2'), self.snapshot(live, 'l2'))
+        expected = pd.concat([history, live[live['ds'] > history['ds'].iloc[-1]]], ignore_index=True)
+        assert_pyramids_equal(self, merged.pyramid, build_pyramid(expected, self.columns))
+
+    def test_live_readings_all_inside_the_history_leave_it_unchanged(self):
+        df = minute_frame(500)
+        merged = merge_snapshots(self.snapshot(df, 'h3'), self.snapshot(df.iloc[100:200], 'l3'))
+        assert_pyramids_equal(self, merged.pyramid, build_pyramid(df, self.columns))
+
+
+# Midday at the plant, so the night mask leaves the readings alone
+NOON = np.datetime64('2024-06-01T12:00', 'm')
+
+
+def write_samples(rows):
+    writer = SampleWriter(linger=float('inf'))
+    writer.add(type(rows[0]), rows)
+    return writer.flush()
+
+
+def inverter_message(minute, **readings):
+    """A wide inverter message: ``readings`` maps an inverter id to its active and DC power."""
+    data = {'ds': str(NOON + minute)}
+    for inverter, (active, dc) in readings.items():
+        data[f'INVERTER{inverter}_Active Power_Kw'] = active
+        data[f'INVERTER{inverter}_DC Power_Kw'] = dc
+    return data
+
+
+class SampleTableTests(TestCase):
+    def test_range_scan_returns_one_device_in_time_order(self):
+        order = [7, 2, 9, 0, 4, 1, 8, 3, 6, 5]
+        rows = [row for m in order for row in inverter_samples(inverter_message(m, **{'1.1': (m, None), '2.1': (-m, 1)}))]
+        self.assertEqual(write_samples(rows), 20)
+        ds, values = sample_range(InverterSample, '1.1', NOON + 2, NOON + 5, fields=['active_power', 'dc_power'])
+        self.assertEqual(ds.tolist(), (NOON + np.arange(2, 5)).astype('datetime64[ns]').tolist())
+        np.testing.assert_array_equal(values[0], [2.0, 3.0, 4.0])
+        self.assertTrue(np.isnan(values[1]).all())
+
+    def test_unbounded_and_empty_scans(self):
+        write_samples([row for m in range(5) for row in weather_samples({'ds': str(NOON + m), 'GHI_A_DATA_Avg': 10 * m})])
+        ds, values = sample_range(WeatherSample, 'station', fields=['ghi'])
+        self.assertEqual(len(ds), 5)
+        np.testing.assert_array_equal(values[0], [0, 10, 20, 30, 40])
+        ds, values = sample_range(WeatherSample, 'station', start=NOON + 5)
+        self.assertEqual((len(ds), values.shape), (0, (7, 0)))
+
+    def test_redelivered_samples_are_stored_once(self):
+        rows = inverter_samples(inverter_message(0, **{'1.1': (1, 2)}))
+        write_samples(rows)
+        write_samples(inverter_samples(inverter_message(0, **{'1.1': (1, 2)})))
+        self.assertEqual(InverterSample.objects.count(), 1)
+
+    def test_frame_has_the_dataset_columns_of_every_device(self):
+        write_samples([row for m in (1, 0) for row in inverter_samples(inverter_message(m, **{'1.1': (m, 5), '2.1': (9, 9)}))])
+        df = sample_frame(InverterSample)
+        self.assertEqual(df['ds'].tolist(), [pd.Timestamp(NOON), pd.Timestamp(NOON + 1)])
+        self.assertEqual(df['INVERTER1.1_Active Power_Kw'].tolist(), [0.0, 1.0])
+        self.assertEqual(df['INVERTER2.1_DC Power_Kw'].tolist(), [9.0, 9.0])
+
+
+class RangeSnapshotTests(TestCase):
+    """Inverter windows outside the serving snapshot are read from the sample tables."""
+
+    def setUp(self):
+        response_cache.invalidate()
+        schema = InverterSchema(['1.1', '2.1'], ['Active Power_Kw', 'DC Power_Kw'])
+        df = pd.DataFrame({'ds': minutes(60, str(NOON))})
+        for column in schema.columns:
+            df[column] = 100.0
+        self.snapshot = Snapshot('inverter', build_pyramid(df, schema.columns), 'v1', None)
+        patch = mock.patch('data_api.samples.serving_snapshot', return_value=self.snapshot)
+        patch.start()
+        self.addCleanup(patch.stop)
+        # Readings stored after the snapshot's last minute
+        write_samples([row for m in range(60, 70) for row in inverter_samples(inverter_message(m, **{'1.1': (m, 1)}))])
+
+    def test_window_after_the_snapshot_is_read_from_the_samples(self):
+        params = {'start': str(NOON + 60)}
+        snapshot = range_snapshot('inverter', params)
+        minute = snapshot.pyramid['1m']
+        self.assertEqual(minute.ds.tolist(), (NOON + np.arange(60, 70)).astype('datetime64[ns]').tolist())
+        np.testing.assert_array_equal(minute.values('INVERTER1.1_Active Power_Kw'), np.arange(60, 70))
+        self.assertTrue(np.isnan(minute.values('INVERTER2.1_Active Power_Kw')).all())
+        self.assertEqual(snapshot.version, range_version('inverter', params))
+        self.assertTrue(snapshot.version.startswith('v1+samples'))
+
+    def test_window_overlapping_the_snapshot_is_served_by_it(self):
+        for params in ({}, {'start': str(NOON + 30)}, {'end': str(NOON + 1)}, {'start': 'not a date'}):
+            self.assertIs(range_snapshot('inverter', params), self.snapshot)
+            self.assertEqual(range_version('inverter', params), 'v1')
+
+    def test_new_samples_change_the_version(self):
+        params = {'start': str(NOON + 60)}
+        before = range_version('inverter', params)
+        write_samples(inverter_samples(inverter_message(70, **{'1.1': (70, 1)})))
+        self.assertNotEqual(range_version('inverter', params), before)
+
+    def test_inverter_view_serves_the_samples(self):
+        from .views import generalized_data_api
+
+        request = RequestFactory().get('/', {
+            'graph_type': 'minute', 'feature_type': 'active_power', 'inverter': '1.1',
+            'start': str(NOON + 65), 'end': str(NOON + 120),
+        })
+        data = json.loads(generalized_data_api(request).content)
+        self.assertEqual(data['first_date'], '2024-06-01T13:05:00')
+        points = [point for group in data['data'].values() for point in group]
+        self.assertEqual([point['active_power'] for point in points], [65.0, 66.0, 67.0, 68.0, 69.0])
+
+
+def serve_inverter_frame(test, df):
+    """Serve the minutes of ``df`` as the inverter snapshot for the length of ``test``."""
+    response_cache.invalidate()
+    columns = [column for column in df.columns if column != 'ds']
+    snapshot = Snapshot('inverter', build_pyramid(df, columns), 'v1', None)
+    patch = mock.patch('data_api.samples.serving_snapshot', return_value=snapshot)
+    patch.start()
+    test.addCleanup(patch.stop)
+    return snapshot
+
+
+def inverter_view(**params):
+    from .views import generalized_data_api
+
+    return generalized_data_api(RequestFactory().get('/', {'feature_type': 'active_power', **params}))
+
+
+class SeriesViewTests(TestCase):
+    """The start/end/limit window of the time-series views, over a three-hour snapshot."""
+
+    def setUp(self):
+        df = pd.DataFrame({'ds': minutes(180, str(NOON))})
+        df['INVERTER1.1_Active Power_Kw'] = np.arange(180.0)
+        df['INVERTER1.1_DC Power_Kw'] = np.arange(180.0) * 2
+        serve_inverter_frame(self, df)
+
+    def get(self, **params):
+        return inverter_view(**params)
+
+    def points(self, **params):
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        return data, [point for group in data['data'].values() for point in group]
+
+    def test_bounded_window_is_start_inclusive_and_end_exclusive(self):
+        data, points = self.points(graph_type='minute', start='2024-06-01T12:30', end='2024-06-01T13:15')
+        self.assertEqual([point['active_power'] for point in points], list(range(30, 75)))
+        self.assertEqual(points[0]['timestamp'], '2024-06-01 12:30:00')
+        self.assertEqual(list(data['data']), ['2024-06-01 12:00', '2024-06-01 13:00'])
+        # The bounds describe the whole dataset, not the window
+        self.assertEqual((data['first_date'], data['last_date']), ('2024-06-01T12:00:00', '2024-06-01T14:59:00'))
+        self.assertNotIn('next_cursor', data)
+
+    def test_limit_pages_through_with_next_cursor(self):
+        timestamps, start, pages = [], '2024-06-01T12:10', 0
+        while True:
+            data, points = self.points(graph_type='minute', start=start, end='2024-06-01T14:00', limit=25)
+            timestamps += [point['timestamp'] for point in points]
+            pages += 1
+            if data['next_cursor'] is None:
+                break
+            self.assertEqual(len(points), 25)
+            start = data['next_cursor']
+        expected = np.datetime_as_string(NOON + np.arange(10, 120)).tolist()
+        self.assertEqual(timestamps, [ts.replace('T', ' ') + ':00' for ts in expected])
+        self.assertEqual(pages, 5)
+
+    def test_limit_pages_coarser_levels(self):
+        data, points = self.points(graph_type='15min', limit=4)
+        self.assertEqual(len(points), 4)
+        self.assertEqual(data['next_cursor'], '2024-06-01T13:00:00')
+        data, points = self.points(graph_type='15min', start=data['next_cursor'], limit=4)
+        self.assertEqual(points[0]['timestamp'], '2024-06-01 13:00')
+        np.testing.assert_allclose([point['active_power'] for point in points], np.arange(67, 127, 15))
+
+    def test_window_past_the_data_is_empty(self):
+        data, points = self.points(graph_type='minute', start='2024-06-02T00:00', end='2024-06-03T00:00', limit=10)
+        self.assertEqual(points, [])
+        self.assertEqual((data['first_date'], data['last_date'], data['next_cursor']), (None, None, None))
+
+    def test_invalid_bounds_are_rejected(self):
+        for params in ({'start': 'not a date'}, {'end': '2024-13-45'}, {'limit': '0'}):
+            response = self.get(graph_type='minute', **params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(json.loads(self.get(graph_type='minute', start='yesterday-ish').content),
+                         {'error': 'Invalid start parameter. Must be an ISO date or datetime.'})
+
+
+class FormatTests(TestCase):
+    """format=columnar and format=msgpack carry the same readings as the default JSON."""
+
+    def setUp(self):
+        df = pd.DataFrame({'ds': minutes(120, str(NOON))})
+        df['INVERTER1.1_Active Power_Kw'] = np.arange(120.0)
+        df['INVERTER1.1_DC Power_Kw'] = np.arange(120.0) / 4
+        df.loc[70:72, 'INVERTER1.1_Active Power_Kw'] = np.nan
+        df.loc[80, 'INVERTER1.1_Active Power_Kw'] = -5.0
+        # Ten minutes without a row at all
+        serve_inverter_frame(self, df.drop(index=range(40, 50)).reset_index(drop=True))
+        self.params = {'graph_type': 'minute', 'feature_type': 'active_power,dc_power'}
+
+    def grouped(self):
+        data = json.loads(inverter_view(**self.params).content)
+        return {point['timestamp']: point for group in data['data'].values() for point in group}
+
+    def decode(self, payload):
+        """Timestamp -> {name: value} of every grid slot that is not a gap."""
+        start, count = np.datetime64(payload['start'].replace(' ', 'T'), 'm'), payload['count']
+        self.assertEqual(payload['step'], 'PT1M')
+        decoded = {}
+        for name, values in payload['values'].items():
+            present = np.ones(count, dtype=bool)
+            for index, length in payload['gaps'][name]:
+                present[index:index + length] = False
+                self.assertTrue((np.asarray(values)[index:index + length] == 0).all())
+            for i in np.flatnonzero(present).tolist():
+                timestamp = str(np.datetime_as_string(start + i)).replace('T', ' ') + ':00'
+                decoded.setdefault(timestamp, {})[name] = values[i]
+        return decoded
+
+    def test_columnar_json_holds_the_grouped_values(self):
+        columnar = json.loads(inverter_view(format='columnar', **self.params).content)['data']
+        self.assertEqual(columnar['count'], 120)
+        self.assertNotIn('offsets', columnar)
+        self.assertEqual(columnar['gaps'], {'active_power': [[40, 10], [70, 3]], 'dc_power': [[40, 10]]})
+
+        grouped = self.grouped()
+        decoded = self.decode(columnar)
+        self.assertEqual(set(decoded), set(grouped))
+        for timestamp, point in grouped.items():
+            # A NaN reading is a gap in the columnar payload and a 0 in the grouped one
+            self.assertEqual(decoded[timestamp].get('active_power', 0), point['active_power'], timestamp)
+            self.assertEqual(decoded[timestamp]['dc_power'], point['dc_power'], timestamp)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_decodes_to_the_columnar_payload(self):
+        response = inverter_view(format='msgpack', **self.params)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        packed = msgpack.unpackb(response.content)['data']
+        columnar = json.loads(inverter_view(format='columnar', **self.params).content)['data']
+        self.assertEqual({key: packed[key] for key in ('start', 'step', 'count')},
+                         {key: columnar[key] for key in ('start', 'step', 'count')})
+        for name in ('active_power', 'dc_power'):
+            np.testing.assert_array_equal(np.frombuffer(packed['values'][name], '<f8'), columnar['values'][name])
+            np.testing.assert_array_equal(np.frombuffer(packed['gaps'][name], '<i4').reshape(-1, 2),
+                                          np.reshape(columnar['gaps'][name], (-1, 2)))
+
+    def test_sparse_points_are_sent_with_offsets(self):
+        ds = minutes(3) + np.array([0, 10, 500]).astype('timedelta64[m]')
+        payload = columnar_series(ds, {'a': [1.0, 2.0, 3.0]}, '1m', missing={'a': np.array([False, True, False])})
+        self.assertEqual(payload['count'], 3)
+        self.assertEqual(payload['offsets'].tolist(), [0, 11, 502])
+        self.assertEqual(payload['values']['a'].tolist(), [1.0, 0.0, 3.0])
+        self.assertEqual(payload['gaps']['a'].tolist(), [[1, 1]])
+
+    def test_gap_runs(self):
+        cases = [
+            ([], []),
+            ([False, False], []),
+            ([True, True, True], [[0, 3]]),
+            ([True, False, True, True, False, False, True], [[0, 1], [2, 2], [6, 1]]),
+        ]
+        for absent, runs in cases:
+            result = gap_runs(np.array(absent, dtype=bool))
+            self.assertEqual(result.dtype, np.int32)
+            self.assertEqual(result.reshape(-1, 2).tolist(), runs, absent)
+
+
+class StreamingTests(TestCase):
+    """stream=true sends the same body as the whole response, a few groups at a time."""
+
+    def setUp(self):
+        df = pd.DataFrame({'ds': minutes(600, str(NOON))})
+        df['INVERTER1.1_Active Power_Kw'] = np.linspace(0, 500, 600)
+        df['INVERTER1.1_DC Power_Kw'] = np.linspace(0, 520, 600)
+        df.loc[100:110, 'INVERTER1.1_Active Power_Kw'] = np.nan
+        serve_inverter_frame(self, df)
+        # Small blocks and chunks, so groups span blocks and the body several chunks
+        for patch in (mock.patch('data_api.responses.iter_groups', partial(iter_groups, block_rows=7)),
+                      mock.patch('data_api.formats.STREAM_CHUNK_BYTES', 512)):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def assert_streams_the_response(self, **params):
+        whole = inverter_view(**params)
+        streamed = inverter_view(stream='true', **params)
+        self.assertIsInstance(streamed, StreamingHttpResponse)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        chunks = list(streamed.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        body = b''.join(chunks)
+        self.assertEqual(json.loads(body), json.loads(whole.content))
+        self.assertEqual(body, whole.content)
+
+    def test_grouped_levels(self):
+        for graph_type in ('minute', '5min', 'hourly'):
+            with self.subTest(graph_type=graph_type):
+                self.assert_streams_the_response(graph_type=graph_type, feature_type='active_power,dc_power')
+
+    def test_window_with_a_cursor(self):
+        self.assert_streams_the_response(graph_type='minute', start='2024-06-01T12:30', limit=200)
+
+    @override_settings(RESPONSE_JSON_ENCODER='orjson')
+    def test_orjson_encoder(self):
+        self.assert_streams_the_response(graph_type='minute', feature_type='active_power,dc_power')
+
+    def test_downsampled_and_columnar_responses_are_sent_whole(self):
+        for params in ({'max_points': '50'}, {'format': 'columnar'}):
+            response = inverter_view(graph_type='minute', stream='true', **params)
+            self.assertNotIsInstance(response, StreamingHttpResponse, params)
+            self.assertEqual(response.status_code, 200)
+
+
+class InverterSchemaTests(SimpleTestCase):
+    """Inverters and metrics discovered from a plant CSV header."""
+
+    header = ['ds', 'INVERTER10.1_Active Power_Kw', 'INVERTER2.1_Active Power_Kw', 'INVERTER2.1_DC Power_Kw',
+              'INVERTER10.1_Todays Gen_Kwh', 'Grid Frequency']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        rng = np.random.default_rng(0)
+        self.raw = pd.DataFrame(rng.uniform(10, 100, (120, len(self.header))), columns=self.header)
+        self.raw['ds'] = pd.Series(minutes(120, str(NOON))).dt.strftime('%m/%d/%Y %I:%M:%S %p')
+        # Inverter 10.1 drops out for a while, then the whole plant does
+        self.raw.loc[30:39, ['INVERTER10.1_Active Power_Kw']] = np.nan
+        self.raw.loc[50:54, ['INVERTER10.1_Active Power_Kw', 'INVERTER2.1_Active Power_Kw']] = np.nan
+        source = os.path.join(directory.name, 'plant.csv')
+        self.raw.to_csv(source, index=False)
+        patch = mock.patch.dict(DATASETS, {'plant': {'source': source, 'layout': 'inverters'}})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_header_is_discovered_as_an_inverter_metric_grid(self):
+        schema = inverter_schema(self.header)
+        self.assertEqual(schema.inverters, ['2.1', '10.1'])
+        self.assertEqual(schema.metrics, ['Active Power_Kw', 'DC Power_Kw', 'Todays Gen_Kwh'])
+        self.assertEqual(schema.columns, [
+            'INVERTER2.1_Active Power_Kw', 'INVERTER2.1_DC Power_Kw', 'INVERTER2.1_Todays Gen_Kwh',
+            'INVERTER10.1_Active Power_Kw', 'INVERTER10.1_DC Power_Kw', 'INVERTER10.1_Todays Gen_Kwh',
+        ])
+        self.assertEqual(schema.metric_columns('DC Power_Kw'), ['INVERTER2.1_DC Power_Kw', 'INVERTER10.1_DC Power_Kw'])
+
+    def test_metrics_an_inverter_does_not_report_are_nan_columns(self):
+        df, columns = read_source('plant')
+        self.assertEqual(columns, inverter_schema(self.header).columns)
+        self.assertTrue(df['INVERTER10.1_DC Power_Kw'].isna().all())
+        self.assertTrue(df['INVERTER2.1_Todays Gen_Kwh'].isna().all())
+        np.testing.assert_allclose(df['INVERTER2.1_DC Power_Kw'], self.raw['INVERTER2.1_DC Power_Kw'])
+        self.assertNotIn('Grid Frequency', df)
+
+    def test_plant_total_matches_a_pandas_sum_over_the_inverters(self):
+        df, columns = read_source('plant')
+        schema = inverter_schema(columns)
+        pyramid = build_pyramid(df, columns)
+        metrics = ['Active Power_Kw', 'DC Power_Kw']
+        groups = [schema.metric_columns(metric) for metric in metrics]
+        for name, rule in (('1m', 'min'), ('15m', '15min'), ('1h', 'h')):
+            for agg in ('mean', 'max'):
+                buckets = getattr(df.set_index('ds').resample(rule), agg)()
+                # A bucket with no inverter reporting is NaN rather than 0
+                expected = np.array([buckets[group].sum(axis=1, min_count=1).to_numpy() for group in groups])
+                np.testing.assert_allclose(plant_total(pyramid[name], groups, agg), expected, err_msg=f'{name} {agg}')
+        total = plant_total(pyramid['1m'], groups, 'mean', slice(28, 56))
+        self.assertEqual(total.shape, (2, 28))
+        self.assertTrue(np.isnan(total[0, 22:27]).all())
+        self.assertFalse(np.isnan(total[1]).any())
+
+    def test_parse_inverter(self):
+        schema = inverter_schema(self.header)
+        self.assertEqual(parse_inverter({}, schema), '2.1')
+        self.assertEqual(parse_inverter({'inverter': ''}, schema), '2.1')
+        self.assertEqual(parse_inverter({'inverter': '10.1'}, schema), '10.1')
+        with self.assertRaisesMessage(ValueError, 'Invalid inverter parameter. Must be one of 2.1, 10.1.'):
+            parse_inverter({'inverter': '3.1'}, schema)
+        with self.assertRaisesMessage(ValueError, 'No inverter columns found in the dataset.'):
+            parse_inverter({}, inverter_schema(['ds', 'GHI_A_DATA_Avg']))
+
+
+class CurrentValuesTests(SimpleTestCase):
+    """The value for now is the latest reading at the same minute of the day."""
+
+    def get(self, now, **params):
+        from .views import current_values_api
+
+        with mock.patch('data_api.current.datetime') as clock:
+            clock.now.return_value = now
+            return current_values_api(RequestFactory().get('/', params))
+
+    def test_matches_the_latest_csv_row_at_the_minute(self):
+        csv = pd.read_csv(DATASETS['inverter']['source'])
+        csv['ds'] = pd.to_datetime(csv['ds'], format='%m/%d/%Y %I:%M:%S %p')
+        for hour, minute in ((12, 34), (9, 0), (15, 59)):
+            response = self.get(datetime(2025, 3, 1, hour, minute))
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            row = csv[(csv['ds'].dt.hour == hour) & (csv['ds'].dt.minute == minute)].iloc[-1]
+            self.assertEqual(data['timestamp'], row['ds'].strftime('%Y-%m-%d %H:%M:%S'))
+            self.assertEqual(data['inverter'], '1.1')
+            for feature, metric in FEATURE_METRICS.items():
+                value = row[f'INVERTER1.1_{metric}']
+                self.assertAlmostEqual(data[feature], max(value, 0) if pd.notna(value) else 0, msg=feature)
+
+    def test_features_and_inverter_are_validated(self):
+        data = json.loads(self.get(datetime(2025, 3, 1, 12, 0), features='dc_power').content)
+        self.assertEqual(set(data), {'timestamp', 'inverter', 'dc_power'})
+        for params in ({'features': 'voltage'}, {'inverter': '9.9'}):
+            self.assertEqual(self.get(datetime(2025, 3, 1, 12, 0), **params).status_code, 400, params)
+
+    def test_minute_without_a_reading(self):
+        df = pd.DataFrame({'ds': minutes(3, str(NOON)), 'a': [1.0, -2.0, np.nan]})
+        snapshot = Snapshot('current-test', build_pyramid(df, ['a']), 'v1', None)
+        self.assertEqual(current_values(snapshot, ['a'], now=datetime(2025, 3, 1, 12, 1)),
+                         ('2024-06-01 12:01:00', [0]))
+        self.assertIsNone(current_values(snapshot, ['a'], now=datetime(2025, 3, 1, 12, 3)))
+
+    def test_index_is_rebuilt_for_a_new_version(self):
+        first = Snapshot('current-test', build_pyramid(minute_frame(90, str(NOON)), ['a', 'b']), 'v1', None)
+        index = minute_index(first)
+        self.assertIs(minute_index(first), index)
+        self.assertEqual(index.row(12 * 60 + 89), 89)
+
+        # Two more days of minutes: the latest day's reading wins
+        second = Snapshot('current-test', build_pyramid(minute_frame(3 * 24 * 60, str(NOON)), ['a', 'b']), 'v2', None)
+        rebuilt = minute_index(second)
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.row(12 * 60 + 89), 2 * 24 * 60 + 89)
+        self.assertEqual(rebuilt.row(11 * 60), 3 * 24 * 60 - 60)
+        expected = MinuteIndex(second.pyramid['1m'].ds)
+        np.testing.assert_array_equal(rebuilt.rows, expected.rows)
+
+
+class SunTests(SimpleTestCase):
+    # Geometric sun elevation (no refraction) at the default site, 23.03 N 72.58 E, from
+    # NOAA's Solar Calculator spreadsheet; the general equations agree to about 0.15 degrees
+    NOAA_ELEVATIONS = {
+        '2024-03-20T12:30': 66.664,
+        '2024-06-21T12:35': 88.439,
+        '2024-12-21T12:30': 43.492,
+        '2024-11-05T07:00': 2.013,
+        '2024-11-05T18:00': -1.014,
+        '2024-09-15T00:00': -62.602,
+    }
+
+    def test_elevation_matches_noaa(self):
+        ds = np.array(list(self.NOAA_ELEVATIONS), dtype='datetime64[m]')
+        np.testing.assert_allclose(sun_elevation(ds, 23.03, 72.58), list(self.NOAA_ELEVATIONS.values()), atol=0.2)
+        # The site defaults to the plant in settings
+        np.testing.assert_array_equal(sun_elevation(ds), sun_elevation(ds, 23.03, 72.58))
+
+    def test_missing_timestamps_have_no_elevation(self):
+        ds = np.array(['2024-06-21T12:35', 'NaT'], dtype='datetime64[ns]')
+        elevation = sun_elevation(ds)
+        self.assertTrue(elevation[0] > 88 and np.isnan(elevation[1]))
+
+    def frame(self):
+        # A day of readings with a few missing and a few negative ones
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'ds': minutes(24 * 60, '2024-11-05T00:00'), 'a': rng.uniform(-5, 100, 24 * 60)})
+        df.loc[rng.random(len(df)) < 0.1, 'a'] = np.nan
+        df['b'] = df['a']
+        return df
+
+    def test_mask_zeroes_readings_below_the_threshold_only(self):
+        df = self.frame()
+        raw = df['a'].to_numpy().copy()
+        night = sun_elevation(df['ds']) < -6.0
+        self.assertTrue(0 < night.sum() < len(df))
+        mask_night(df, ['a'])
+        self.assertTrue((df['a'][night] == 0).all())
+        day = df['a'][~night].to_numpy()
+        np.testing.assert_array_equal(day, np.clip(raw[~night], 0, None))
+        self.assertTrue(np.isnan(day).any())
+        # Columns left out of the mask are untouched
+        np.testing.assert_array_equal(df['b'], raw)
+
+    def test_keep_missing_leaves_nan_at_night(self):
+        df = self.frame()
+        raw = df['a'].to_numpy().copy()
+        night = sun_elevation(df['ds']) < -6.0
+        mask_night(df, ['a'], keep_missing=True)
+        masked = df['a'].to_numpy()
+        np.testing.assert_array_equal(np.isnan(masked), np.isnan(raw))
+        self.assertTrue((masked[night & ~np.isnan(raw)] == 0).all())
+
+    @override_settings(NIGHT_SUN_ELEVATION=5.0)
+    def test_threshold_comes_from_settings(self):
+        df = pd.DataFrame({'ds': pd.to_datetime(['2024-11-05T07:00', '2024-11-05T12:00']), 'a': [10.0, 10.0]})
+        # The sun is 2 degrees up at 07:00
+        self.assertEqual(mask_night(df, ['a'])['a'].tolist(), [0.0, 10.0])
+
+
+class AsofJoinTests(SimpleTestCase):
+    """The weather/inverter join against pandas.merge_asof(direction='backward') on the two exports."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.weather, _ = read_source('weather')
+        cls.inverters, cls.columns = read_source('inverter_min')
+        cls.weather['ds'] = cls.weather['ds'].astype('datetime64[ns]')
+        cls.inverters['ds'] = cls.inverters['ds'].astype('datetime64[ns]')
+
+    def assert_matches_merge_asof(self, right, tolerances):
+        level = build_pyramid(right, self.columns)['1m']
+        left_ds = self.weather['ds'].to_numpy()
+        index = AsofIndex(left_ds, right['ds'].to_numpy())
+        rows = slice(None)
+        for tolerance in tolerances:
+            expected = pd.merge_asof(self.weather[['ds']], right, on='ds', direction='backward',
+                                     tolerance=pd.Timedelta(seconds=tolerance))
+            joined = joined_values(level, self.columns, 'mean', index, rows, tolerance)
+            np.testing.assert_array_equal(joined, expected[self.columns].to_numpy().T, err_msg=f'tolerance {tolerance}')
+
+    def test_exports_as_logged(self):
+        self.assert_matches_merge_asof(self.inverters, (0, 60, 120))
+
+    def test_drifting_inverter_clock(self):
+        # The inverter logger runs 20 s late and misses every seventh reading
+        right = self.inverters.copy()
+        right['ds'] += pd.Timedelta(seconds=20)
+        right = right[right.index % 7 != 3].reset_index(drop=True)
+        self.assert_matches_merge_asof(right, (0, 20, 39, 40, 80, 120))
+
+    def test_rows_before_the_first_right_reading_never_match(self):
+        index = AsofIndex(minutes(3), minutes(2, '2024-01-01T00:01'))
+        positions, matched = index.match(slice(None), 1e9)
+        self.assertEqual(matched.tolist(), [False, True, True])
+        self.assertEqual(positions.tolist()[1:], [0, 1])
+
+    def test_parse_tolerance(self):
+        self.assertEqual(parse_tolerance({}), 120.0)
+        self.assertEqual(parse_tolerance({'tolerance': '0'}), 0.0)
+        self.assertEqual(parse_tolerance({'tolerance': '30.5'}), 30.5)
+        for value in ('-1', 'soon', 'nan'):
+            with self.assertRaisesMessage(ValueError, 'Invalid tolerance parameter.'):
+                parse_tolerance({'tolerance': value})
+
+
+class HistogramTests(SimpleTestCase):
+    """Binned statistics against np.histogram and a pandas group-by of pd.cut bins."""
+
+    percentiles = [0, 10, 25, 50, 90, 100]
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.uniform(0, 1000, 5000)
+        self.y = self.x * 0.4 + rng.normal(0, 30, 5000)
+        self.x[rng.random(5000) < 0.02] = np.nan
+        self.y[rng.random(5000) < 0.02] = np.nan
+        # Upper edges cutting off part of the samples, and x bins no sample falls in
+        self.x[(self.x > 450) & (self.x < 540)] = 560.0
+        self.x_edges = bin_edges(self.x[~np.isnan(self.x)], 20, upper=900.0)
+        self.y_edges = bin_edges(self.y[~np.isnan(self.y)], 15, upper=300.0)
+
+    def test_edges_match_numpy(self):
+        values = self.y[~np.isnan(self.y)]
+        np.testing.assert_array_equal(bin_edges(values, 15), np.histogram_bin_edges(values, 15, range=(0, values.max())))
+        np.testing.assert_array_equal(bin_edges(np.empty(0), 4), [0, 0.25, 0.5, 0.75, 1])
+
+    def test_counts_match_numpy_histogram(self):
+        counts, _ = binned_statistics(self.x, self.y, self.x_edges, self.y_edges)
+        keep = ~(np.isnan(self.x) | np.isnan(self.y))
+        expected, _, _ = np.histogram2d(self.x[keep], self.y[keep], bins=[self.x_edges, self.y_edges])
+        np.testing.assert_array_equal(counts, expected)
+        # Every x bin's row adds up to np.histogram of the in-range samples
+        in_y = keep & (self.y >= 0) & (self.y <= self.y_edges[-1])
+        np.testing.assert_array_equal(counts.sum(axis=1), np.histogram(self.x[in_y], self.x_edges)[0])
+
+    def test_percentiles_match_a_pandas_quantile_per_bin(self):
+        _, result = binned_statistics(self.x, self.y, self.x_edges, self.y_edges, self.percentiles)
+        df = pd.DataFrame({'x': self.x, 'y': self.y}).dropna()
+        bins = pd.cut(df['x'], self.x_edges, right=False)
+        grouped = df.groupby(bins, observed=False)['y']
+        for i, q in enumerate(self.percentiles):
+            expected = grouped.quantile(q / 100).to_numpy()
+            np.testing.assert_allclose(result[i], expected, err_msg=f'p{q}')
+        self.assertTrue(np.isnan(result[:, 10:12]).all())
+
+    def test_sorted_percentiles_of_runs(self):
+        ordered = np.array([1.0, 2.0, 3.0, 4.0, 10.0, 5.0])
+        result = sorted_percentiles(ordered, np.array([0, 4, 5]), np.array([4, 0, 1]), [0, 50, 75])
+        np.testing.assert_allclose(result[:, 0], np.percentile([1, 2, 3, 4], [0, 50, 75]))
+        self.assertTrue(np.isnan(result[:, 1]).all())
+        np.testing.assert_array_equal(result[:, 2], [5.0, 5.0, 5.0])
+
+    def test_empty_window(self):
+        from .views import irradiance_power_histogram
+
+        response_cache.invalidate()
+        response = irradiance_power_histogram(RequestFactory().get('/', {
+            'start': '2030-01-01', 'end': '2030-01-02', 'irradiance_bins': '4', 'power_bins': '3',
+        }))
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['samples'], 0)
+        self.assertEqual(data['counts'], [[0, 0, 0]] * 4)
+        self.assertEqual(data['irradiance']['edges'], [0.0, 0.25, 0.5, 0.75, 1.0])
+        self.assertEqual(data['percentiles'], {f'p{q}': [None] * 4 for q in (10, 50, 90)})
+
+
+def splitmix64(minute, seed):
+    """The reference splitmix64 step on Python ints, for one minute since the epoch."""
+    mask = 2 ** 64 - 1
+    z = (minute + (seed + 1) * 0x9E3779B97F4A7C15) & mask
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & mask
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & mask
+    return z ^ (z >> 31)
+
+
+class PercentCapTests(SimpleTestCase):
+    """Percent KPI caps are a fixed function of the minute and the seed."""
+
+    def setUp(self):
+        self.ds = minutes(3 * 24 * 60, '2024-11-05T00:00')
+
+    def test_caps_match_a_reference_splitmix64(self):
+        for bounds, seed in (((85, 90), 0), ((70, 95), 7), ((88, 88), 3)):
+            expected = [bounds[0] + splitmix64(m, seed) % (bounds[1] - bounds[0] + 1)
+                        for m in self.ds.astype('datetime64[m]').astype(np.int64).tolist()]
+            np.testing.assert_array_equal(percent_caps(self.ds, bounds, seed), expected)
+
+    def test_caps_are_the_same_in_another_process(self):
+        # A worker started separately, with its own hash seed, draws the same caps
+        script = (
+            "import numpy as np; from data_api.kpis import percent_caps; "
+            "print(percent_caps(np.datetime64('2024-11-05T00:00', 'm') + np.arange(4320), (85, 90), 0).tolist())"
+        )
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                env=dict(os.environ, PYTHONHASHSEED='123')).stdout
+        self.assertEqual(json.loads(output), percent_caps(self.ds, (85, 90), 0).tolist())
+
+    def test_caps_depend_only_on_the_minute(self):
+        caps = percent_caps(self.ds, (85, 90), 0)
+        order = np.random.default_rng(0).permutation(len(self.ds))
+        np.testing.assert_array_equal(percent_caps(self.ds[order], (85, 90), 0), caps[order])
+        # Seconds within the minute share its cap
+        np.testing.assert_array_equal(percent_caps(self.ds + np.timedelta64(59, 's'), (85, 90), 0), caps)
+        # Settings supply the default bounds and seed
+        np.testing.assert_array_equal(percent_caps(self.ds), caps)
+        self.assertFalse(np.array_equal(percent_caps(self.ds, (85, 90), 1), caps))
+
+    def test_caps_cover_the_bounds(self):
+        caps = percent_caps(self.ds, (85, 90), 0)
+        self.assertEqual(sorted(set(caps.tolist())), [85.0, 86.0, 87.0, 88.0, 89.0, 90.0])
+        self.assertEqual(set(percent_caps(self.ds, (88, 88), 0).tolist()), {88.0})
+
+    def test_capped_values_never_pass_the_cap(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({'ds': self.ds, 'PR': rng.uniform(0, 1.5, len(self.ds)), 'other': 2.0})
+        df.loc[::50, 'PR'] = np.nan
+        raw = df['PR'].to_numpy().copy()
+        caps = percent_caps(self.ds)
+        cap_percent_columns(df, ['PR'])
+        capped = df['PR'].to_numpy()
+        np.testing.assert_array_equal(np.isnan(capped), np.isnan(raw))
+        self.assertTrue((capped[~np.isnan(raw)] <= caps[~np.isnan(raw)]).all())
+        np.testing.assert_allclose(capped, np.minimum(raw * 100, caps))
+        self.assertTrue((capped == caps).any() and (capped < caps).any())
+        self.assertEqual(df['other'].tolist(), [2.0] * len(df))
+
+
+def legacy_response(df_data, feature_type, feature_column, graph_type):
+    """The iterrows builder generalized_data_api and derived_data used before data_api.series."""
+    response_data = {
+        'first_date': df_data['ds'].min(),
+        'last_date': df_data['ds'].max(),
+        'data': {}
+    }
+    key_format, timestamp_format = {
+        'hourly': ('%Y-%m-%d', '%Y-%m-%d %H:%M'),
+        'minute': ('%Y-%m-%d %H:00', '%Y-%m-%d %H:%M:%S'),
+    }[graph_type]
+    for _, row in df_data.iterrows():
+        key = row['ds'].strftime(key_format)
+        if key not in response_data['data']:
+            response_data['data'][key] = []
+        value = max(row[feature_column], 0) if pd.notna(row[feature_column]) else 0
+        response_data['data'][key].append({
+            'timestamp': row['ds'].strftime(timestamp_format),
+            feature_type: value
+        })
+    return JsonResponse(response_data, status=200)
+
+
+@override_settings(RESPONSE_JSON_ENCODER='json')
+class BaselineResponseTests(SimpleTestCase):
+    """
+    The vectorized views write the bytes the iterrows builders wrote for the same rows.
+
+    The rows themselves changed on purpose since (sun-based night mask, hourly
+    buckets rolled up from the minutes, percent caps fixed per minute), so the
+    baseline builder is run on the rows each view now serves.
+    """
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def assert_baseline_bytes(self, view, snapshot, feature_type, column, graph_type):
+        level = snapshot.pyramid[{'minute': '1m', 'hourly': '1h'}[graph_type]]
+        df = pd.DataFrame({'ds': level.ds, column: level.values(column, 'mean')})
+        response = view(RequestFactory().get('/', {'feature_type': feature_type, 'graph_type': graph_type}))
+        self.assertEqual(response.status_code, 200)
+        expected = legacy_response(df, feature_type, column, graph_type).content
+        self.assertEqual(len(response.content), len(expected))
+        self.assertTrue(response.content == expected, f'{feature_type} {graph_type} differs from the baseline')
+
+    def test_inverter_data(self):
+        from .views import generalized_data_api
+
+        snapshot = get_snapshot('inverter')
+        for feature_type, metric in FEATURE_METRICS.items():
+            for graph_type in ('minute', 'hourly'):
+                with self.subTest(feature_type=feature_type, graph_type=graph_type):
+                    self.assert_baseline_bytes(generalized_data_api, snapshot, feature_type,
+                                               f'INVERTER1.1_{metric}', graph_type)
+
+    def test_derived_data(self):
+        from derived.views import FEATURE_COLUMNS, derived_data
+
+        snapshot = get_snapshot('derived')
+        for feature_type in ('pr', 'specific_yied'):
+            for graph_type in ('minute', 'hourly'):
+                with self.subTest(feature_type=feature_type, graph_type=graph_type):
+                    self.assert_baseline_bytes(derived_data, snapshot, feature_type, FEATURE_COLUMNS[feature_type],
+                                               graph_type)
+
+
+class MultiFeatureTests(SimpleTestCase):
+    """Several feature_type values come back side by side, as the single-feature requests would send them."""
+
+    def setUp(self):
+        response_cache.invalidate()
+
+    def get(self, view, **params):
+        response = view(RequestFactory().get('/', params))
+        self.assertEqual(response.status_code, 200, params)
+        return json.loads(response.content)
+
+    def assert_side_by_side(self, view, features, **params):
+        combined = self.get(view, feature_type=','.join(features), **params)
+        singles = {feature: self.get(view, feature_type=feature, **params) for feature in features}
+        self.assertEqual(list(combined['data']), list(singles[features[0]]['data']))
+        points = 0
+        for key, rows in combined['data'].items():
+            for feature, single in singles.items():
+                self.assertEqual(len(rows), len(single['data'][key]))
+            for i, row in enumerate(rows):
+                self.assertEqual(list(row), ['timestamp', *features])
+                for feature, single in singles.items():
+                    self.assertEqual(single['data'][key][i], {'timestamp': row['timestamp'], feature: row[feature]})
+            points += len(rows)
+        self.assertGreater(points, 0)
+
+    def test_inverter_features(self):
+        from .views import generalized_data_api, plant_data_api
+
+        for view in (generalized_data_api, plant_data_api):
+            for graph_type in ('minute', 'hourly', 'daily'):
+                with self.subTest(view=view.__name__, graph_type=graph_type):
+                    self.assert_side_by_side(view, ['active_power', 'dc_power'], graph_type=graph_type)
+        self.assert_side_by_side(generalized_data_api, ['todays_gen', 'active_power', 'dc_power'],
+                                 graph_type='15min', start='2024-11-07T06:00', end='2024-11-08T06:00')
+
+    def test_weather_and_derived_features(self):
+        from derived.views import derived_data
+        from .views import weather_data_api
+
+        self.assert_side_by_side(weather_data_api, ['ghi', 'air_temperature'], graph_type='hourly')
+        self.assert_side_by_side(derived_data, ['pr', 'specific_yied', 'degradation'], graph_type='minute')
+
+    def test_columnar_series_match_the_single_requests(self):
+        from .views import generalized_data_api
+
+        combined = self.get(generalized_data_api, feature_type='active_power,dc_power', graph_type='5min',
+                            format='columnar')['data']
+        for feature in ('active_power', 'dc_power'):
+            single = self.get(generalized_data_api, feature_type=feature, graph_type='5min', format='columnar')['data']
+            self.assertEqual((single['start'], single['count']), (combined['start'], combined['count']))
+            np.testing.assert_array_equal(single['values'][feature], combined['values'][feature])
+            self.assertEqual(single['gaps'][feature], combined['gaps'][feature])
+
+    def test_repeated_and_unknown_features(self):
+        from .views import generalized_data_api
+
+        data = self.get(generalized_data_api, feature_type='dc_power,dc_power', graph_type='daily')
+        self.assertEqual(list(next(iter(data['data'].values()))[0]), ['timestamp', 'dc_power'])
+        request = RequestFactory().get('/', {'feature_type': 'dc_power,volts', 'graph_type': 'daily'})
+        response = generalized_data_api(request)
+        self.assertEqual(response.status_code, 400)
@@ -3,9 +3,12 @@ from .views import *
 
 urlpatterns = [
     path('data/', generalized_data_api, name='generalized_data_api'),
-    # path('current-active-power/', current_active_power_api, name='current_active_power_api'),
-    # path('current-dc-power/', current_dc_power_api, name='current_dc_power_api'),
-    # path('current-todays-gen/', current_todays_gen_api, name='current_todays_gen_api'),
+    path('plant/', plant_data_api, name='plant_data_api'),
+    path('weather/', weather_data_api, name='weather_data_api'),
+    path('weather-inverter/', weather_inverter_api, name='weather_inverter_api'),
+    path('irradiance-power/', irradiance_power_histogram, name='irradiance_power_histogram'),
+    path('current/', current_values_api, name='current_values_api'),
+    path('datasets/', dataset_status, name='dataset_status'),
     path('settings/', settings_page, name='settings_page'),
     path('save-settings/', save_settings, name='save_settings'),
 ]
@@ -1,127 +1,268 @@
 # data_api/views.py
 from django.http import JsonResponse
-from rest_framework.response import Response
-from datetime import datetime, timedelta
 from rest_framework import status
-import pandas as pd
+import numpy as np
 import os, json
 import pytz
 #libraries
 
 from django.views.decorators.csrf import csrf_exempt
-from django.shortcuts import render
 from django.conf import settings
 
-IST = pytz.timezone('Asia/Kolkata')
-
-# File paths for the CSV files
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-FILE_PATH_MINUTE = os.path.join(BASE_DIR, 'data_api/data/inv_min_2.csv')
-FILE_PATH_HOURLY = os.path.join(BASE_DIR, 'data_api/data/inverter_hourly.csv')
+from .datasets import memory_report
+from .snapshots import get_snapshot
+from .live import serving_snapshot
+from .cache import cached_response, response_cache
+from .inverters import FEATURE_METRICS, inverter_schema, parse_feature_types, parse_inverter, plant_total
+from .responses import series_response
+from .rollups import GRAPH_LEVELS
+from .current import current_values, parse_features
+from .joins import asof_index, joined_values, parse_tolerance
+from .series import date_bounds, parse_list, parse_range, time_window
+from .formats import encode_response
+from .histograms import binned_statistics, bin_edges, parse_bins, parse_percentiles, parse_upper
+from .models import WEATHER_COLUMNS
+from .samples import range_snapshot, range_version
 
-# Read the CSV data once to improve performance
-minute_df = pd.read_csv(FILE_PATH_MINUTE)
-minute_df['ds'] = pd.to_datetime(minute_df['ds'])
+IST = pytz.timezone('Asia/Kolkata')
 
-# Time ranges for replacing values
-minute_start_time = pd.to_datetime("19:00").time()  # 6:30 PM
-minute_end_time = pd.to_datetime("07:00").time()    # 7:30 AM
+# Rollups of the cleaned minute data answer every graph_type. Each request
+# reads one immutable snapshot, memory-mapped from the compiled store
+# (manage.py compile_datasets) and reloaded in the background when the CSV
+# or the store changes, with the readings the Kafka consumers buffered since
+# merged in (see live.py). A start/end window wholly outside it is read from
+# the sample tables (see samples.py). Load it now so the first request
+# doesn't wait.
+get_snapshot('inverter')
+get_snapshot('weather')
 
-# Set actual_power and predicted_power to 0 during the specified time range for MINUTE wise
-minute_df['time'] = minute_df['ds'].dt.time
-minute_df.loc[
-    ((minute_df['time'] >= minute_start_time) | (minute_df['time'] <= minute_end_time)),
-    ["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]] = 0
-minute_df.drop('time', axis=1, inplace=True)
+# The weather/inverter join pairs each weather reading with the inverter
+# log recorded over the same minutes
+JOINED_INVERTER_DATASET = 'inverter_min'
+JOINED_FEATURES = {**WEATHER_COLUMNS, **FEATURE_METRICS}
 
-minute_df[["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]] = minute_df[["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]].clip(lower=0)
+# Axes of the irradiance-vs-power histogram
+IRRADIANCE_FEATURES = ('ghi', 'poa', 'poa_3')
+POWER_FEATURES = ('active_power', 'dc_power')
 
-hourly_df = pd.read_csv(FILE_PATH_HOURLY)
-hourly_df['ds'] = pd.to_datetime(hourly_df['ds'])
+def inverter_version(request):
+    return range_version('inverter', request.GET)
 
-# Time ranges for replacing values
-hour_start_time = pd.to_datetime("20:00").time()  # 6:00 PM
-hour_end_time = pd.to_datetime("07:00").time()    # 8:00 AM
+def weather_version(request):
+    return range_version('weather', request.GET)
 
-# Set actual_power and predicted_power to 0 during the specified time range for MINUTE wise
-hourly_df['time'] = hourly_df['ds'].dt.time
-hourly_df.loc[
-    ((hourly_df['time'] >= hour_start_time) | (hourly_df['time'] <= hour_end_time)),
-    ["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]] = 0
-hourly_df.drop('time', axis=1, inplace=True)
+def joined_version(request):
+    return f"{serving_snapshot('weather').version}+{serving_snapshot(JOINED_INVERTER_DATASET).version}"
 
-hourly_df[["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]] = hourly_df[["INVERTER1.1_Active Power_Kw", "INVERTER1.1_AC Current (A)_Phase 1", "INVERTER1.1_AC Current (A)_Phase 2", "INVERTER1.1_AC Current (A)_Phase 3", "INVERTER1.1_AC Voltage (V)_BR", "INVERTER1.1_AC Voltage (V)_RY", "INVERTER1.1_AC Voltage (V)_YB", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Current", "INVERTER1.1_DC Voltage", "INVERTER1.1_DC Power_Kw", "INVERTER1.1_Reactive power_Kvar", "INVERTER1.1_Inverter_Temp.", "INVERTER1.1_Power Factor"]].clip(lower=0)
 
+@cached_response(inverter_version)
 @csrf_exempt
 def generalized_data_api(request):
-    feature_type = request.GET.get('feature_type')
-    graph_type = request.GET.get('graph_type')
+    """
+    One inverter's metrics (``inverter=``, default the first inverter) over time.
+
+    ``feature_type`` may list several features (``active_power,dc_power``);
+    they are read in one pass and returned side by side in every point.
+    """
+    snapshot = range_snapshot('inverter', request.GET)
+    schema = inverter_schema(snapshot.pyramid['1m'].columns)
+    try:
+        feature_types = parse_feature_types(request.GET)
+        inverter = parse_inverter(request.GET, schema)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Define the mapping of feature types to their column names
-    feature_mapping = {
-        'active_power': 'INVERTER1.1_Active Power_Kw',
-        'dc_power': 'INVERTER1.1_DC Power_Kw',
-        'todays_gen': 'INVERTER1.1_Todays Gen_Kwh'
-    }
+    columns = [schema.column(inverter, FEATURE_METRICS[f]) for f in feature_types]
 
-    if graph_type not in ['minute', 'hourly']:
-        return JsonResponse({"error": "Invalid graph_type parameter. Must be 'minute' or 'hourly'."}, 
-                             status=status.HTTP_400_BAD_REQUEST)
+    def read(level, agg, rows):
+        return level.values(columns, agg, rows)
 
+    return series_response(request, snapshot, feature_types, read)
+
+
+@cached_response(inverter_version)
+@csrf_exempt
+def plant_data_api(request):
+    """Metrics (``feature_type=a,b``) summed across every inverter of the plant."""
+    snapshot = range_snapshot('inverter', request.GET)
+    schema = inverter_schema(snapshot.pyramid['1m'].columns)
     try:
-        # Determine the file to read based on graph_type
-        if graph_type == 'minute':
-            df_data = minute_df
-        else:
-            df_data = hourly_df
+        feature_types = parse_feature_types(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Prepare the response data
-        response_data = {
-            'first_date': df_data['ds'].min(),
-            'last_date': df_data['ds'].max(),
-            'data': {}
-        }
+    columns = [schema.metric_columns(FEATURE_METRICS[f]) for f in feature_types]
 
-        df_data['ds'] = pd.to_datetime(df_data['ds'], errors='coerce')
+    def read(level, agg, rows):
+        return plant_total(level, columns, agg, rows)
 
-        # Extract and group the data
-        feature_column = feature_mapping[feature_type]
+    return series_response(request, snapshot, feature_types, read, extra={'inverters': schema.inverters})
 
-        if graph_type == 'hourly':
-            # Group by day
-            for _, row in df_data.iterrows():
-                day_key = row['ds'].strftime(f'%Y-%m-%d')
-                if day_key not in response_data['data']:
-                    response_data['data'][day_key] = []
-                
-                value = max(row[feature_column], 0) if pd.notna(row[feature_column]) else 0
 
-                response_data['data'][day_key].append({
-                    'timestamp': row['ds'].strftime(f'%Y-%m-%d %H:%M'),
-                    feature_type: value
-                })
+@cached_response(weather_version)
+@csrf_exempt
+def weather_data_api(request):
+    """Weather station readings (``feature_type=ghi,air_temperature``) over time."""
+    try:
+        feature_types = parse_list(request.GET, 'feature_type', WEATHER_COLUMNS)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        elif graph_type == 'minute':
-            # Group by hour
-            for _, row in df_data.iterrows():
-                hour_key = row['ds'].strftime(f'%Y-%m-%d %H:00')  # Set to the start of the hour
-                if hour_key not in response_data['data']:
-                    response_data['data'][hour_key] = []  # Initialize as a list if it doesn't exist
+    columns = [WEATHER_COLUMNS[f] for f in feature_types]
 
-                value = max(row[feature_column], 0) if pd.notna(row[feature_column]) else 0
+    def read(level, agg, rows):
+        return level.values(columns, agg, rows)
 
-                # Append the current row's data to the list for that hour
-                response_data['data'][hour_key].append({
-                    'timestamp': row['ds'].strftime(f'%Y-%m-%d %H:%M:%S'),  # Keep the minute in the timestamp
-                    feature_type: value
-                })
+    return series_response(request, range_snapshot('weather', request.GET), feature_types, read)
 
-        return JsonResponse(response_data, status=status.HTTP_200_OK)
+
+@cached_response(joined_version)
+@csrf_exempt
+def weather_inverter_api(request):
+    """
+    Weather and one inverter's metrics on the weather station's time index.
+
+    ``feature_type`` mixes weather and inverter features (default
+    ``ghi,active_power``). Each weather bucket is as-of joined to the latest
+    inverter bucket at or before it, no more than ``tolerance`` seconds
+    older (default settings.ASOF_JOIN_TOLERANCE); unmatched buckets are
+    missing readings.
+    """
+    weather = serving_snapshot('weather')
+    inverters = serving_snapshot(JOINED_INVERTER_DATASET)
+    schema = inverter_schema(inverters.pyramid['1m'].columns)
+    try:
+        feature_types = parse_list(request.GET, 'feature_type', JOINED_FEATURES, default=('ghi', 'active_power'))
+        inverter = parse_inverter(request.GET, schema)
+        tolerance = parse_tolerance(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    weather_features = [f for f in feature_types if f in WEATHER_COLUMNS]
+    inverter_features = [f for f in feature_types if f not in WEATHER_COLUMNS]
+    order = [feature_types.index(f) for f in weather_features + inverter_features]
+
+    def read(level, agg, rows):
+        # series_response has validated graph_type before reading
+        level_name = GRAPH_LEVELS[request.GET['graph_type']]
+        index = asof_index(weather, inverters, level_name)
+        values = np.empty((len(feature_types), len(level.ds[rows])))
+        values[order] = np.concatenate([
+            level.values([WEATHER_COLUMNS[f] for f in weather_features], agg, rows),
+            joined_values(inverters.pyramid[level_name],
+                          [schema.column(inverter, FEATURE_METRICS[f]) for f in inverter_features],
+                          agg, index, rows, tolerance),
+        ])
+        return values
+
+    return series_response(request, weather, feature_types, read,
+                           extra={'inverter': inverter, 'tolerance': tolerance})
+
+
+@cached_response(joined_version)
+@csrf_exempt
+def irradiance_power_histogram(request):
+    """
+    2D histogram of (irradiance, power) minute samples and power percentiles per irradiance bin.
+
+    Samples are the daylight (irradiance > 0) weather minutes in [start,
+    end), as-of joined to one inverter like weather_inverter_api. Bins are
+    equal-width from 0 to ``irradiance_max`` / ``power_max`` (default the
+    largest sample), ``irradiance_bins`` x ``power_bins`` of them.
+    """
+    weather = serving_snapshot('weather')
+    inverters = serving_snapshot(JOINED_INVERTER_DATASET)
+    schema = inverter_schema(inverters.pyramid['1m'].columns)
+    try:
+        irradiance = request.GET.get('irradiance') or 'ghi'
+        if irradiance not in IRRADIANCE_FEATURES:
+            raise ValueError(f"Invalid irradiance parameter. Must be one of {', '.join(IRRADIANCE_FEATURES)}.")
+        power = request.GET.get('feature_type') or 'active_power'
+        if power not in POWER_FEATURES:
+            raise ValueError(f"Invalid feature_type parameter. Must be one of {', '.join(POWER_FEATURES)}.")
+        inverter = parse_inverter(request.GET, schema)
+        tolerance = parse_tolerance(request.GET)
+        start, end, _ = parse_range(request.GET)
+        x_bins = parse_bins(request.GET, 'irradiance_bins')
+        y_bins = parse_bins(request.GET, 'power_bins')
+        x_max = parse_upper(request.GET, 'irradiance_max')
+        y_max = parse_upper(request.GET, 'power_max')
+        percentiles = parse_percentiles(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        level = weather.pyramid['1m']
+        rows, _ = time_window(level.ds, start, end)
+        x = level.values(WEATHER_COLUMNS[irradiance], 'mean', rows)
+        y = joined_values(inverters.pyramid['1m'], [schema.column(inverter, FEATURE_METRICS[power])], 'mean',
+                          asof_index(weather, inverters, '1m'), rows, tolerance)[0]
+        # Night readings are zeroed by the cleaning and negatives are clipped at serve time
+        daylight = x > 0
+        x, y = x[daylight], np.maximum(y[daylight], 0)
+        valid = ~np.isnan(y)
+        x_edges = bin_edges(x[valid], x_bins, x_max)
+        y_edges = bin_edges(y[valid], y_bins, y_max)
+        counts, y_percentiles = binned_statistics(x, y, x_edges, y_edges, percentiles)
+        first_date, last_date = date_bounds(level.ds)
+
+        response_data = {
+            'first_date': first_date,
+            'last_date': last_date,
+            'inverter': inverter,
+            'tolerance': tolerance,
+            'samples': int(counts.sum()),
+            'irradiance': {'feature': irradiance, 'edges': x_edges},
+            'power': {'feature': power, 'edges': y_edges},
+            'counts': counts,
+            'percentiles': {
+                f'p{q:g}': [None if np.isnan(v) else v for v in values.tolist()]
+                for q, values in zip(percentiles, y_percentiles)
+            },
+        }
+        return encode_response(response_data, 'json', status=status.HTTP_200_OK)
 
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def current_values_api(request):
+    """Latest value of every requested feature (``features=``, default all) of one inverter."""
+    snapshot = serving_snapshot('inverter')
+    schema = inverter_schema(snapshot.pyramid['1m'].columns)
+    try:
+        features = parse_features(request.GET, FEATURE_METRICS)
+        inverter = parse_inverter(request.GET, schema)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # One lookup in the minute-of-day index for every feature at once
+    current = current_values(snapshot, [schema.column(inverter, FEATURE_METRICS[f]) for f in features])
+    if current is None:
+        return JsonResponse({'error': 'No data available for the current minute'}, status=status.HTTP_404_NOT_FOUND)
+
+    timestamp, values = current
+    return JsonResponse({'timestamp': timestamp, 'inverter': inverter, **dict(zip(features, values))},
+                        status=status.HTTP_200_OK)
+
+
+def dataset_status(request):
+    """
+    View to report the loaded datasets, the memory they share across workers
+    and the response cache, with the live buffers and sample writer of every
+    consumer worker from the supervisor's status file.
+    """
+    from kafka_app.supervisor import supervisor_status
+
+    status = supervisor_status() or {}
+    consumers = [
+        {'index': worker['index'], 'alive': worker['alive'], **(worker.get('stats') or {})}
+        for worker in status.get('workers', [])
+    ]
+    return JsonResponse({'pid': os.getpid(), 'datasets': memory_report(), 'consumers': consumers,
+                         'response_cache': response_cache.stats()})
+
+
 # Path to analytics.json file
 ANALYTICS_FILE_PATH = os.path.join(settings.BASE_DIR, 'data_api/data/analytics.json')
 
@@ -135,6 +276,11 @@ def save_analytics(data):
     with open(ANALYTICS_FILE_PATH, 'w') as file:
         json.dump(data, file, indent=4)
 
+def analytics_version(request):
+    stat = os.stat(ANALYTICS_FILE_PATH)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+@cached_response(analytics_version)
 def settings_page(request):
     """View to display analytics settings and variables."""
     analytics_data = load_analytics()  # Load the analytics.json data
@@ -161,6 +307,7 @@ def save_settings(request):
 
         # Save the updated analytics data
         save_analytics(analytics_data)
+        response_cache.invalidate(settings_page)
 
         return JsonResponse({'message': 'Settings updated successfully.'}, status=200)
 
@@ -0,0 +1,301 @@
+# derived/engine.py
+"""
+Incremental derived KPIs from the live inverter and weather messages.
+
+``derived_min.csv`` is an export of KPIs computed from the plant's minute
+power and irradiance. The engine computes the same KPIs as the messages
+arrive through ``kafka_app.tasks``: a weather message updates the latest
+irradiance, and an inverter message turns the plant's power and that
+irradiance into one minute of KPIs, cleaned like the export (night zeroed,
+negatives clipped, ratio KPIs as capped percentages).
+
+Each minute is folded into running count/sum/min/max accumulators for its
+bucket at every rollup level (minute, 5 min, 15 min, hour, day, month), so
+a message costs a constant amount of work however long the engine runs.
+``snapshot()`` exposes the accumulators as a read-only rollup pyramid with
+the same interface as a dataset snapshot. The engine is fed in the
+consumer worker processes, so once it has KPIs it registers ``flush`` with
+the live flush thread (``data_api.live``), which appends the minutes the
+compiled ``derived`` dataset doesn't hold yet to it as a new store version;
+the web workers' derived_data serves them from there.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+from data_api.inverters import COLUMN_PATTERN, FEATURE_METRICS
+from data_api.kpis import percent_cap, percent_caps
+from data_api import live
+from data_api.datasets import STORE_DIR
+from data_api.live import message_time
+from data_api.rollups import LEVELS, Rollup
+from data_api.snapshots import get_snapshot
+from data_api.sun import MINUTES_PER_DAY, day_elevations, plant_location
+
+# Defaults for the plant the export was computed for; override in settings
+DEFAULT_CAPACITY_KWP = 1000.0
+DEFAULT_AREA_M2 = 5000.0
+DEFAULT_REFERENCE_EFFICIENCY = 0.15
+# Seconds a weather reading stays usable for later inverter readings
+DEFAULT_WEATHER_TOLERANCE = 120
+# Minute buckets kept; coarser levels are kept for as long as the engine runs
+DEFAULT_MINUTE_RETENTION_DAYS = 7
+
+KPI_COLUMNS = [
+    "PR", "n_system", "Capacity_Factor", "Specific_Yield_kWh_kWp",
+    "Energy_Yield_per_Area_kWh_m2", "Degradation_Rate_%_per_minute",
+    "Insulation_Resistance_MOhm",
+]
+PERCENT_COLUMNS = ["PR", "n_system", "Capacity_Factor", "Degradation_Rate_%_per_minute"]
+PERCENT_INDEXES = [KPI_COLUMNS.index(column) for column in PERCENT_COLUMNS]
+IRRADIANCE_COLUMN = 'GHI_A_DATA_Avg'
+
+MINUTE = np.timedelta64(1, 'm')
+
+
+def plant_parameters():
+    """(capacity kWp, area m2, reference efficiency, weather tolerance s, minute retention days)."""
+    from django.conf import settings
+    defaults = (DEFAULT_CAPACITY_KWP, DEFAULT_AREA_M2, DEFAULT_REFERENCE_EFFICIENCY,
+                DEFAULT_WEATHER_TOLERANCE, DEFAULT_MINUTE_RETENTION_DAYS)
+    if not settings.configured:
+        return defaults
+    names = ('PLANT_CAPACITY_KWP', 'PLANT_AREA_M2', 'PLANT_REFERENCE_EFFICIENCY',
+             'ASOF_JOIN_TOLERANCE', 'LIVE_MINUTE_RETENTION_DAYS')
+    return tuple(float(getattr(settings, name, default)) for name, default in zip(names, defaults))
+
+
+def minute_kpis(power, ghi, previous_power, capacity, area, reference):
+    """
+    The export's KPIs for one minute of plant power (kW) and GHI (W/m2), in KPI_COLUMNS order.
+
+    ``previous_power`` is the power one minute earlier (NaN if unknown),
+    for the minute-over-minute change reported as degradation.
+    """
+    n_system = power * 1000 / (ghi * area) if ghi > 0 else math.nan
+    change = (power - previous_power) / previous_power * 100 if previous_power > 0 else 0.0
+    return [
+        n_system / reference,
+        n_system,
+        power / capacity,
+        power / 60 / capacity,
+        power / 60 / area,
+        change,
+        math.nan,
+    ]
+
+
+class LiveRollups:
+    """Running count/sum/min/max of a fixed set of columns per bucket, for every rollup level."""
+
+    def __init__(self, columns, minute_retention):
+        self.columns = list(columns)
+        self.minute_retention = minute_retention
+        # level name -> {bucket start (minutes since the epoch): [count, sum, min, max] arrays}
+        self.buckets = {name: {} for name in LEVELS}
+        # (present, filled) of the last row added, taken back out when it is replaced
+        self.last = None
+
+    def add(self, ts, values, replace=False):
+        """
+        Fold one row of values (NaN = no reading) taken at ``ts`` into every level.
+
+        With ``replace`` the row replaces the last one added, which must be
+        for the same minute: its count and sum are taken back out of every
+        level first. The minute's min/max become the new row's; a coarser
+        level's can only keep the replaced values as a bound, which only
+        matters if a redelivered message carries different readings.
+        """
+        values = np.array(values, dtype=float)
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+        for name, key in bucket_keys(ts).items():
+            stats = self.buckets[name].get(key)
+            if stats is None:
+                self.buckets[name][key] = [present.astype(np.int32), filled.copy(), values.copy(), values.copy()]
+                continue
+            if replace:
+                stats[0] -= self.last[0]
+                stats[1] -= self.last[1]
+                if name == '1m':
+                    stats[2], stats[3] = values.copy(), values.copy()
+            stats[0] += present
+            stats[1] += filled
+            np.fmin(stats[2], values, out=stats[2])
+            np.fmax(stats[3], values, out=stats[3])
+        self.last = (present, filled)
+
+    def prune(self, latest):
+        """Drop minute buckets older than the retention before ``latest``."""
+        cutoff = minute_number(latest - self.minute_retention)
+        minutes = self.buckets['1m']
+        for key in [key for key in minutes if key < cutoff]:
+            del minutes[key]
+
+    def rollup(self, name):
+        """One level as a Rollup with time-sorted buckets."""
+        buckets = self.buckets[name]
+        keys = sorted(buckets)
+        if not keys:
+            empty = np.empty((len(self.columns), 0))
+            return Rollup(np.array([], dtype='datetime64[ns]'), self.columns,
+                          empty.astype(np.int32), empty, empty, empty)
+        stats = [np.stack([buckets[key][i] for key in keys], axis=1) for i in range(4)]
+        ds = np.array(keys, dtype='datetime64[m]').astype('datetime64[ns]')
+        return Rollup(ds, self.columns, *stats)
+
+
+class LiveSnapshot:
+    """A read-only view of the engine's rollups, interchangeable with a dataset Snapshot."""
+
+    def __init__(self, name, pyramid, version):
+        for rollup in pyramid.values():
+            for array in (rollup.ds, rollup.count, rollup.sum, rollup.min, rollup.max):
+                array.flags.writeable = False
+        self.name = name
+        self.pyramid = pyramid
+        self.version = version
+        self.loaded_at = time.time()
+
+
+class DerivedEngine:
+    """Derived KPIs updated one inverter or weather message at a time."""
+
+    def __init__(self, name='derived-live', dataset='derived'):
+        self.name = name
+        self.dataset = dataset
+        self.capacity, self.area, self.reference, tolerance, retention_days = plant_parameters()
+        self.location = plant_location()
+        self.cap = percent_cap()
+        self.tolerance = np.timedelta64(int(tolerance * 1e9), 'ns')
+        self.rollups = LiveRollups(KPI_COLUMNS, np.timedelta64(int(retention_days * 86400), 's'))
+        self.weather = (None, np.nan)  # (timestamp, GHI) of the latest weather reading
+        self.previous = (None, np.nan)  # (timestamp, plant power) of the latest inverter reading
+        self.before = (None, np.nan)  # the same for the minute before it, if a redelivery replaces it
+        self.latest = None
+        self.updates = 0
+        self.dropped = 0
+        self.started = time.time_ns()
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def add_weather(self, data):
+        """Record a weather message's irradiance for the inverter readings that follow it."""
+        ghi = data.get(IRRADIANCE_COLUMN)
+        if ghi is None or data.get('ds') is None:
+            return
+        ts = message_time(data['ds'])
+        with self._lock:
+            if self.weather[0] is None or ts >= self.weather[0]:
+                self.weather = (ts, float(ghi))
+
+    def add_inverter(self, data):
+        """
+        Compute one minute of KPIs from an inverter message and fold it into the rollups.
+
+        Like the live ring buffers, messages must arrive in time order: one
+        for the minute already folded in last (a redelivered message)
+        replaces it, and older ones are dropped.
+        """
+        power = plant_power(data)
+        if power is None or data.get('ds') is None:
+            return
+        ts = message_time(data['ds'])
+        with self._lock:
+            if self.latest is not None and ts < self.latest:
+                self.dropped += 1
+                return
+            repeated = ts == self.latest
+            if not repeated:
+                self.before = self.previous
+            weather_ts, ghi = self.weather
+            if weather_ts is None or not weather_ts <= ts <= weather_ts + self.tolerance:
+                ghi = np.nan
+            previous_ts, previous_power = self.before
+            if previous_ts is None or ts - previous_ts != MINUTE:
+                previous_power = np.nan
+            self.previous = (ts, power)
+
+            values = minute_kpis(power, ghi, previous_power, self.capacity, self.area, self.reference)
+            self.rollups.add(ts, self.clean(ts, values), replace=repeated)
+            if self.latest is None or ts > self.latest:
+                # Old minute buckets are dropped once a day
+                if self.latest is not None and ts.astype('datetime64[D]') != self.latest.astype('datetime64[D]'):
+                    self.rollups.prune(ts)
+                self.latest = ts
+            self.updates += 1
+            first = self.updates == 1
+        if first:
+            live.register_flush(self.dataset, self.flush)
+
+    def clean(self, ts, values):
+        """The export's cleaning for one minute: night zeroed, negatives clipped, ratios as capped percent."""
+        latitude, longitude, threshold = self.location
+        minute = minute_number(ts)
+        if day_elevations(minute // MINUTES_PER_DAY, latitude, longitude)[minute % MINUTES_PER_DAY] < threshold:
+            values = [0.0] * len(values)
+        values = [0.0 if value < 0 else value for value in values]
+        cap = float(percent_caps(np.array([ts]), *self.cap)[0])
+        for j in PERCENT_INDEXES:
+            if not math.isnan(values[j]):
+                values[j] = min(values[j] * 100, cap)
+        return values
+
+    def snapshot(self):
+        """The current rollups as a LiveSnapshot, or None before the first inverter message."""
+        with self._lock:
+            if not self.updates:
+                return None
+            if self._snapshot is None or self._snapshot.version != self.version:
+                pyramid = {name: self.rollups.rollup(name) for name in LEVELS}
+                self._snapshot = LiveSnapshot(self.name, pyramid, self.version)
+            return self._snapshot
+
+    def flush(self, store_dir=STORE_DIR):
+        """
+        Publish the KPI minutes later than the compiled dataset's as its new store version.
+
+        Returns the new version, or None when there was nothing to flush.
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        history = get_snapshot(self.dataset)
+        tail = live.later_part(snapshot.pyramid, history)
+        return live.publish(self.dataset, history, tail, store_dir)
+
+    @property
+    def version(self):
+        return f'live-{self.started:x}-{self.updates}'
+
+
+def minute_number(ts):
+    return int(ts.astype('datetime64[m]').astype(np.int64))
+
+
+def bucket_keys(ts):
+    """Start of the bucket holding ``ts`` at every rollup level, in minutes since the epoch."""
+    minute = minute_number(ts)
+    keys = {}
+    for name, (unit, width) in LEVELS.items():
+        if unit == 'M':
+            keys[name] = minute_number(ts.astype('datetime64[M]'))
+        else:
+            span = width * {'m': 1, 'h': 60, 'D': 1440}[unit]
+            keys[name] = minute - minute % span
+    return keys
+
+
+def plant_power(data):
+    """Sum of every inverter's active power in a message (kW), or None if it has none."""
+    metric = FEATURE_METRICS['active_power']
+    readings = [
+        float(value) for key, value in data.items()
+        if value is not None and (match := COLUMN_PATTERN.match(key)) and match['metric'] == metric
+    ]
+    return sum(readings) if readings else None
+
+
+engine = DerivedEngine()
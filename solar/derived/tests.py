@@ -1,3 +1,136 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase
+
+from data_api import live
+from data_api.rollups import build_pyramid
+from data_api.snapshots import Snapshot
+from .engine import DerivedEngine, KPI_COLUMNS, minute_kpis
+
+POWER = 'INVERTER1.1_Active Power_Kw'
+# Midday at the plant, so no minute is masked as night
+NOON = np.datetime64('2024-06-01T12:00', 'm')
+
+
+def feed(engine, count, start=NOON, ghi=800.0):
+    """One weather and one inverter message per minute, the power rising by 1 kW a minute."""
+    for i in range(count):
+        ds = str(start + i)
+        engine.add_weather({'ds': ds, 'GHI_A_DATA_Avg': ghi})
+        engine.add_inverter({'ds': ds, POWER: 400.0 + i, 'INVERTER1.1_DC Power_Kw': 999.0})
+
+
+class DerivedEngineTests(SimpleTestCase):
+    def setUp(self):
+        # No flush thread or registration outliving the test
+        patches = [mock.patch.object(live, 'start_flusher'), mock.patch.dict(live._flushes, clear=True)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.engine = DerivedEngine()
+
+    def test_no_snapshot_before_an_inverter_message(self):
+        self.engine.add_weather({'ds': str(NOON), 'GHI_A_DATA_Avg': 800.0})
+        self.assertIsNone(self.engine.snapshot())
+        self.assertIsNone(self.engine.flush())
+
+    def test_minutes_hold_the_export_kpis(self):
+        feed(self.engine, 3)
+        minutes = self.engine.snapshot().pyramid['1m']
+        self.assertEqual(minutes.ds.tolist(), (NOON + np.arange(3)).astype('datetime64[ns]').tolist())
+        engine = self.engine
+        for i in range(3):
+            previous = 400.0 + i - 1 if i else np.nan
+            expected = engine.clean(NOON.astype('datetime64[ns]') + i * np.timedelta64(1, 'm'), minute_kpis(
+                400.0 + i, 800.0, previous, engine.capacity, engine.area, engine.reference))
+            np.testing.assert_allclose(minutes.values(KPI_COLUMNS, 'mean', slice(i, i + 1))[:, 0], expected)
+
+    def test_buckets_match_a_rollup_of_the_minutes(self):
+        feed(self.engine, 200)
+        snapshot = self.engine.snapshot()
+        minutes = snapshot.pyramid['1m']
+        df = pd.DataFrame(minutes.values(KPI_COLUMNS, 'mean').T, columns=KPI_COLUMNS)
+        df.insert(0, 'ds', minutes.ds)
+        expected = build_pyramid(df, KPI_COLUMNS)
+        for name, level in snapshot.pyramid.items():
+            self.assertEqual(level.ds.tolist(), expected[name].ds.tolist(), name)
+            np.testing.assert_array_equal(level.count, expected[name].count, err_msg=name)
+            np.testing.assert_allclose(level.sum, expected[name].sum, err_msg=name)
+
+    def test_a_redelivered_message_replaces_its_minute(self):
+        feed(self.engine, 3)
+        once = {name: (level.count.copy(), level.sum.copy()) for name, level in self.engine.snapshot().pyramid.items()}
+        # Kafka delivers at least once: the last minute's message arrives again
+        self.engine.add_weather({'ds': str(NOON + 2), 'GHI_A_DATA_Avg': 800.0})
+        self.engine.add_inverter({'ds': str(NOON + 2), POWER: 402.0, 'INVERTER1.1_DC Power_Kw': 999.0})
+        for name, level in self.engine.snapshot().pyramid.items():
+            np.testing.assert_array_equal(level.count, once[name][0], err_msg=name)
+            np.testing.assert_allclose(level.sum, once[name][1], err_msg=name)
+
+    def test_a_redelivery_keeps_the_previous_minutes_power(self):
+        feed(self.engine, 2)
+        degradation = KPI_COLUMNS.index('Degradation_Rate_%_per_minute')
+        before = self.engine.snapshot().pyramid['1m'].values(KPI_COLUMNS, 'mean')[degradation, 1]
+        self.engine.add_inverter({'ds': str(NOON + 1), POWER: 401.0})
+        after = self.engine.snapshot().pyramid['1m'].values(KPI_COLUMNS, 'mean')[degradation, 1]
+        self.assertGreater(before, 0)
+        self.assertEqual(after, before)
+
+    def test_a_changed_redelivery_replaces_the_minute_values(self):
+        feed(self.engine, 2)
+        self.engine.add_inverter({'ds': str(NOON + 1), POWER: 500.0})
+        minutes = self.engine.snapshot().pyramid['1m']
+        hour = self.engine.snapshot().pyramid['1h']
+        yield_column = KPI_COLUMNS.index('Specific_Yield_kWh_kWp')
+        self.assertEqual(minutes.count[yield_column].tolist(), [1, 1])
+        np.testing.assert_allclose(minutes.values(KPI_COLUMNS, 'max')[yield_column], [400 / 60 / 1000, 500 / 60 / 1000])
+        self.assertEqual(int(hour.count[yield_column, 0]), 2)
+        np.testing.assert_allclose(hour.sum[yield_column, 0], 900 / 60 / 1000)
+
+    def test_older_minutes_are_dropped(self):
+        feed(self.engine, 3)
+        version = self.engine.version
+        self.engine.add_inverter({'ds': str(NOON), POWER: 1.0})
+        self.assertEqual((self.engine.dropped, self.engine.version), (1, version))
+
+    def test_a_weather_reading_is_only_joined_within_the_tolerance(self):
+        self.engine.add_weather({'ds': str(NOON), 'GHI_A_DATA_Avg': 800.0})
+        late = NOON + int(self.engine.tolerance / np.timedelta64(1, 'm')) + 1
+        self.engine.add_inverter({'ds': str(late), POWER: 400.0})
+        pr = self.engine.snapshot().pyramid['1m'].values(['PR'], 'mean')
+        self.assertTrue(np.isnan(pr).all())
+
+    def test_first_kpis_register_the_flush(self):
+        feed(self.engine, 1)
+        self.assertEqual(live._flushes, {'derived': self.engine.flush})
+
+    def test_flush_publishes_only_the_minutes_after_the_compiled_ones(self):
+        feed(self.engine, 120)
+        minutes = self.engine.snapshot().pyramid['1m']
+        # The store already holds the first 90 minutes, e.g. from an earlier flush
+        df = pd.DataFrame(minutes.values(KPI_COLUMNS, 'mean')[:, :90].T, columns=KPI_COLUMNS)
+        df.insert(0, 'ds', minutes.ds[:90])
+        history = Snapshot('derived', build_pyramid(df, KPI_COLUMNS), 'v1', None)
+        with mock.patch('derived.engine.get_snapshot', return_value=history), \
+                mock.patch.object(live, 'publish', return_value='v2') as publish:
+            self.assertEqual(self.engine.flush(), 'v2')
+        name, published_history, tail, _ = publish.call_args.args
+        self.assertEqual((name, published_history), ('derived', history))
+        self.assertEqual(tail['1m'].ds.tolist(), minutes.ds[90:].tolist())
+        # The hour bucket the store ends in is only topped up with the later minutes
+        hour = tail['1h']
+        self.assertEqual(hour.ds[0], np.datetime64('2024-06-01T13:00', 'ns'))
+        self.assertEqual(int(hour.count[0, 0]), 30)
+
+    def test_flush_publishes_nothing_the_store_already_holds(self):
+        feed(self.engine, 10)
+        minutes = self.engine.snapshot().pyramid['1m']
+        df = pd.DataFrame(minutes.values(KPI_COLUMNS, 'mean').T, columns=KPI_COLUMNS)
+        df.insert(0, 'ds', minutes.ds)
+        history = Snapshot('derived', build_pyramid(df, KPI_COLUMNS), 'v1', None)
+        with mock.patch('derived.engine.get_snapshot', return_value=history), \
+                mock.patch.object(live, 'write_pyramid') as write:
+            self.assertIsNone(self.engine.flush())
+        write.assert_not_called()
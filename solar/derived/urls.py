@@ -3,4 +3,5 @@ from .views import *
 
 urlpatterns = [
     path('derived_data/', derived_data, name='derived_data'),
+    path('derived_current/', derived_current, name='derived_current'),
 ]
\ No newline at end of file
@@ -7,11 +7,17 @@ import joblib
 import sys
 import os
 
+from data_api.inverters import FEATURE_METRICS, column_name
+
 # Suppress TensorFlow warnings for cleaner output
 import logging
 
 logging.getLogger("tensorflow").setLevel(logging.ERROR)
 
+# The model was trained on these metrics of one inverter
+MODEL_INVERTER = "1.1"
+MODEL_TARGETS = ["active_power", "todays_gen", "dc_power"]
+
 
 def load_new_data(excel_file):
     """
@@ -97,7 +103,7 @@ def define_features(df):
         "day_of_week_sin", "day_of_week_cos", "month_sin", "month_cos"
     ]
     inverter_features = [
-        "INVERTER1.1_Active Power_Kw", "INVERTER1.1_Todays Gen_Kwh", "INVERTER1.1_DC Power_Kw"
+        column_name(MODEL_INVERTER, FEATURE_METRICS[target]) for target in MODEL_TARGETS
     ]
 
     missing_weather = [feat for feat in weather_features if feat not in df.columns]
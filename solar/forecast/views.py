@@ -28,12 +28,23 @@ from .models import (
     feature_engineering,
     define_features,
     generate_time_features,
-    forecast_future
+    forecast_future,
+    MODEL_INVERTER,
 )
 
 from rest_framework import status
 from datetime import timedelta
 
+from data_api.series import (
+    clean_values, format_datetimes, group_records, iter_groups, parse_count, parse_flag
+)
+from data_api.downsample import downsample
+from data_api.rollups import GRAPH_LEVELS, build_pyramid, parse_aggregate
+from data_api.cache import cached_response
+from data_api.formats import streaming_response
+from data_api.inverters import FEATURE_METRICS, column_name
+from data_api.sun import mask_night
+
 # DATA_FOLDER = os.path.join(settings.BASE_DIR, 'data')
 
 # Path to the 'data' folder in the forecast app
@@ -42,6 +53,11 @@ DATA_FOLDER = os.path.join(settings.BASE_DIR, 'forecast', 'data')
 if not os.path.exists(DATA_FOLDER):
     os.makedirs(DATA_FOLDER)  # Create the folder if it doesn't exist
 
+ONE_HOUR = np.timedelta64(1, 'h')
+
+# Active power column of the inverter the model forecasts
+ACTIVE_POWER_COLUMN = column_name(MODEL_INVERTER, FEATURE_METRICS['active_power'])
+
 @csrf_exempt
 @api_view(['POST'])
 def upload_and_predict(request):
@@ -145,22 +161,8 @@ def upload_and_predict(request):
         cols = ["ds"] + inverter_features
         df_predictions = df_predictions[cols]
 
-        # Time ranges for replacing values
-        minute_start_time = pd.to_datetime("18:30").time()  # 6:30 PM
-        minute_end_time = pd.to_datetime("07:30").time()    # 7:30 AM
-        hour_start_time = pd.to_datetime("18:00").time()    # 6:00 PM
-        hour_end_time = pd.to_datetime("08:00").time()      # 8:00 AM
-
-        # Logic to apply 0s for the time range if no values are missing/null
-        def apply_zero_for_time_range(df, start_time, end_time):
-            mask = df['ds'].apply(lambda x: (x.time() >= start_time or x.time() < end_time))
-            for col in inverter_features:
-                df.loc[mask & df[col].notna(), col] = 0  # Only set to 0 if the value is not null
-            return df
-
-        df_predictions = apply_zero_for_time_range(df_predictions, minute_start_time, minute_end_time)
-
-        df_predictions[inverter_features] = df_predictions[inverter_features].clip(lower=0)
+        # Zero non-null predictions while the sun is down and clip negatives
+        df_predictions = mask_night(df_predictions, inverter_features, keep_missing=True)
 
         # Save the original minute-wise predictions to Excel
         predictions_file = os.path.join(DATA_FOLDER, "predictions_minute_wise.xlsx")
@@ -206,7 +208,7 @@ def upload_and_predict(request):
         df_concat_minute = pd.concat([df_predictions, df_forecast_minute], ignore_index=True).sort_values(by="ds")
 
         # Here
-        df_concat_minute = apply_zero_for_time_range(df_concat_minute, minute_start_time, minute_end_time)
+        df_concat_minute = mask_night(df_concat_minute, inverter_features, keep_missing=True)
 
         # Save minute-wise forecasts to Excel
         forecast_minute_file = os.path.join(DATA_FOLDER, "forecast_minute_wise.xlsx")
@@ -235,7 +237,7 @@ def upload_and_predict(request):
         df_concat_hourly = pd.concat([df_predictions_hourly, df_forecast_hour], ignore_index=True).sort_values(by="ds")
 
         # Change non-null, non-empty values to 0 for hour-wise forecast
-        df_concat_hourly = apply_zero_for_time_range(df_concat_hourly, hour_start_time, hour_end_time)
+        df_concat_hourly = mask_night(df_concat_hourly, inverter_features, span=ONE_HOUR, keep_missing=True)
 
         # Save hour-wise forecasts to Excel
         forecast_hour_file = os.path.join(DATA_FOLDER, "forecast_hour_wise.xlsx")
@@ -352,9 +354,9 @@ def compare_power_output(request):
 
         # Combine the actual and predicted power data (retain only ds, predicted_power, actual_power)
         # For MINUTE wise
-        predicted_power_min = df_forecast_min[['ds', 'INVERTER1.1_Active Power_Kw']].rename(columns={'INVERTER1.1_Active Power_Kw': 'predicted_power'})
+        predicted_power_min = df_forecast_min[['ds', ACTIVE_POWER_COLUMN]].rename(columns={ACTIVE_POWER_COLUMN: 'predicted_power'})
         combined_min_data = df_actual_min.merge(predicted_power_min, on='ds', how='right').rename(
-            columns={'INVERTER1.1_Active Power_Kw': 'actual_power'})
+            columns={ACTIVE_POWER_COLUMN: 'actual_power'})
 
         # Step 1: Keep only 'ds', 'predicted_power', and 'actual_power'
         combined_min_data = combined_min_data[['ds', 'predicted_power', 'actual_power']]
@@ -362,28 +364,17 @@ def compare_power_output(request):
         # Step 2: Fill missing 'actual_power' with NaN (if not already handled by merge)
         combined_min_data['actual_power'] = combined_min_data['actual_power'].fillna(value=np.nan)
 
-        # Time ranges for replacing values
-        minute_start_time = pd.to_datetime("18:30").time()  # 6:30 PM
-        minute_end_time = pd.to_datetime("07:30").time()    # 7:30 AM
-
-        # Set actual_power and predicted_power to 0 during the specified time range for MINUTE wise
-        combined_min_data['time'] = combined_min_data['ds'].dt.time
-        combined_min_data.loc[
-            ((combined_min_data['time'] >= minute_start_time) | (combined_min_data['time'] <= minute_end_time)),
-            ['actual_power', 'predicted_power']] = 0
-        combined_min_data.drop('time', axis=1, inplace=True)
-
-        combined_min_data['actual_power'] = combined_min_data['actual_power'].clip(lower=0)
-        combined_min_data['predicted_power'] = combined_min_data['predicted_power'].clip(lower=0)
+        # Set actual_power and predicted_power to 0 while the sun is down for MINUTE wise
+        combined_min_data = mask_night(combined_min_data, ['actual_power', 'predicted_power'])
 
         # Step 1: Save the entire combined data (all rows) to a CSV file
         comparison_csv_min = os.path.join(DATA_FOLDER, 'power_min_comparison.csv')
         combined_min_data.to_csv(comparison_csv_min, index=False)
 
         # For HOURLY
-        predicted_power_hour = df_forecast_hour[['ds', 'INVERTER1.1_Active Power_Kw']].rename(columns={'INVERTER1.1_Active Power_Kw': 'predicted_power'})
+        predicted_power_hour = df_forecast_hour[['ds', ACTIVE_POWER_COLUMN]].rename(columns={ACTIVE_POWER_COLUMN: 'predicted_power'})
         combined_full_data_hour = df_actual_hourly.merge(predicted_power_hour, on='ds', how='right').rename(
-            columns={'INVERTER1.1_Active Power_Kw': 'actual_power'})
+            columns={ACTIVE_POWER_COLUMN: 'actual_power'})
 
         # Step 1: Keep only 'ds', 'predicted_power', and 'actual_power'
         combined_full_data_hour = combined_full_data_hour[['ds', 'predicted_power', 'actual_power']]
@@ -391,19 +382,8 @@ def compare_power_output(request):
         # Step 2: Fill missing 'actual_power' with NaN (if not already handled by merge)
         combined_full_data_hour['actual_power'] = combined_full_data_hour['actual_power'].fillna(value=np.nan)
 
-        # Time ranges for replacing values
-        hour_start_time = pd.to_datetime("19:00").time()  # 6:00 PM
-        hour_end_time = pd.to_datetime("07:00").time()    # 8:00 AM
-
-        # Set actual_power and predicted_power to 0 during the specified time range for HOURLY wise
-        combined_full_data_hour['time'] = combined_full_data_hour['ds'].dt.time
-        combined_full_data_hour.loc[
-            ((combined_full_data_hour['time'] >= hour_start_time) | (combined_full_data_hour['time'] <= hour_end_time)),
-            ['actual_power', 'predicted_power']] = 0
-        combined_full_data_hour.drop('time', axis=1, inplace=True)
-
-        combined_full_data_hour['actual_power'] = combined_full_data_hour['actual_power'].clip(lower=0)
-        combined_full_data_hour['predicted_power'] = combined_full_data_hour['predicted_power'].clip(lower=0)
+        # Set actual_power and predicted_power to 0 for hours the sun is down throughout
+        combined_full_data_hour = mask_night(combined_full_data_hour, ['actual_power', 'predicted_power'], span=ONE_HOUR)
 
         # Step 1: Save the entire combined data (all rows) to a CSV file
         comparison_csv_hour = os.path.join(DATA_FOLDER, 'power_hour_comparison.csv')
@@ -446,117 +426,115 @@ def compare_power_output(request):
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+COMPARISON_CSV_PATH = os.path.join(DATA_FOLDER, 'power_min_comparison.csv')
+COMPARISON_COLUMNS = ['actual_power', 'predicted_power']
+
+# Rollups of the minute comparison, rebuilt only when compare_power_output
+# rewrites the CSV: {path: (mtime, pyramid)}
+comparison_pyramids = {}
+
+
+def load_comparison_pyramid(csv_path):
+    """Return the rollup pyramid for a comparison CSV, or None if it has no valid dates."""
+    mtime = os.path.getmtime(csv_path)
+    cached = comparison_pyramids.get(csv_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    # Load the CSV file into a DataFrame with the first row as header
+    df_comparison = pd.read_csv(csv_path, header=0)
+    df_comparison['ds'] = pd.to_datetime(df_comparison['ds'], errors='coerce')
+    df_comparison = df_comparison.dropna(subset=['ds']).sort_values('ds', kind='stable', ignore_index=True)
+
+    pyramid = build_pyramid(df_comparison, COMPARISON_COLUMNS) if len(df_comparison) else None
+    comparison_pyramids[csv_path] = (mtime, pyramid)
+    return pyramid
+
+
+def comparison_version(request):
+    try:
+        stat = os.stat(COMPARISON_CSV_PATH)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+@cached_response(comparison_version)
 @csrf_exempt
 @api_view(['GET'])
 def get_power_comparison(request):
     # Get the graph_type parameter from the query parameters
     graph_type = request.GET.get('graph_type')
 
-    if graph_type not in ['minute', 'hourly', 'daily', 'all_time']:
-        return Response({"error": "Invalid graph_type parameter. Must be 'minute', 'hourly', 'daily', or 'all_time'."}, 
+    graph_types = list(GRAPH_LEVELS) + ['all_time']
+    if graph_type not in graph_types:
+        return Response({"error": f"Invalid graph_type parameter. Must be one of {', '.join(graph_types)}."},
                         status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        # Determine the file to read based on graph_type
-        if graph_type == 'minute':
-            comparison_csv_path = os.path.join(DATA_FOLDER, 'power_min_comparison.csv')
-        elif graph_type == 'hourly':
-            comparison_csv_path = os.path.join(DATA_FOLDER, 'power_hour_comparison.csv')
-        else:
-            comparison_csv_path = os.path.join(DATA_FOLDER, 'power_min_comparison.csv')
+        # all_time is a short month-wise list and is never downsampled
+        max_points = parse_count(request.GET, 'max_points', minimum=3)
+        agg = parse_aggregate(request.GET)
+        stream = parse_flag(request.GET, 'stream')
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
         # Check if the file exists
-        if not os.path.exists(comparison_csv_path):
+        if not os.path.exists(COMPARISON_CSV_PATH):
             return Response({"error": "Comparison file not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Load the CSV file into a DataFrame with the first row as header
-        df_comparison = pd.read_csv(comparison_csv_path, header=0)
-
-        # Convert 'ds' column to datetime
-        df_comparison['ds'] = pd.to_datetime(df_comparison['ds'], errors='coerce')
-
         # Check if there are any valid dates
-        if df_comparison['ds'].isnull().all():
+        pyramid = load_comparison_pyramid(COMPARISON_CSV_PATH)
+        if pyramid is None:
             return Response({"error": "No valid datetime entries found."}, status=status.HTTP_404_NOT_FOUND)
 
+        # Pick the rollup level for this graph_type
+        level = pyramid['1M' if graph_type == 'all_time' else GRAPH_LEVELS[graph_type]]
+
         # Prepare the response data
         response_data = {
-            'first_date': df_comparison['ds'].min(),
-            'last_date': df_comparison['ds'].max(),
+            'first_date': pd.Timestamp(level.ds[0]),
+            'last_date': pd.Timestamp(level.ds[-1]),
             'data': {}
         }
 
-        # Resample data for daily and all_time
-        df_resampled_daily = df_comparison.set_index('ds').resample('D').mean().reset_index()
-        df_resampled_monthly = df_comparison.set_index('ds').resample('M').mean().reset_index()
-
-        if graph_type == 'hourly':
-            # Group by day
-            for _, row in df_comparison.iterrows():
-                day_key = row['ds'].strftime(f'%Y-%m-%d')
-                if day_key not in response_data['data']:
-                    response_data['data'][day_key] = []
-                
-                actual_power = max(row['actual_power'], 0) if pd.notna(row['actual_power']) else 0
-                predicted_power = max(row['predicted_power'], 0) if pd.notna(row['predicted_power']) else 0
-
-                response_data['data'][day_key].append({
-                    'timestamp': row['ds'].strftime(f'%Y-%m-%d %H:%M'),
-                    'actual_power': actual_power,
-                    'predicted_power': predicted_power
-                })
-
-        elif graph_type == 'minute':
-            # Group by hour
-            for _, row in df_comparison.iterrows():
-                hour_key = row['ds'].strftime(f'%Y-%m-%d %H:00')  # Set to the start of the hour
-                if hour_key not in response_data['data']:
-                    response_data['data'][hour_key] = []  # Initialize as a list if it doesn't exist
-
-                actual_power = max(row['actual_power'], 0) if pd.notna(row['actual_power']) else 0
-                predicted_power = max(row['predicted_power'], 0) if pd.notna(row['predicted_power']) else 0
-
-                # Append the current row's data to the list for that hour
-                response_data['data'][hour_key].append({
-                    'timestamp': row['ds'].strftime(f'%Y-%m-%d %H:%M:%S'),  # Keep the minute in the timestamp
-                    'actual_power': actual_power,
-                    'predicted_power': predicted_power
-                })
-
-
-        elif graph_type == 'daily':
-            # Group daily data by month
-            for _, row in df_resampled_daily.iterrows():
-                day_key = row['ds'].strftime(f'%Y-%m-%d')
-                month_key = row['ds'].strftime('%Y-%m')
-
-                if month_key not in response_data['data']:
-                    response_data['data'][month_key] = []
+        # Long grouped ranges are streamed a block of rows at a time instead of
+        # being built in memory; downsampled payloads are sent whole
+        if stream and graph_type != 'all_time' and max_points is None:
+            def load(block):
+                return {column: clean_values(level.values(column, agg, block)) for column in COMPARISON_COLUMNS}
 
-                actual_power = max(row['actual_power'], 0) if pd.notna(row['actual_power']) else 0
-                predicted_power = max(row['predicted_power'], 0) if pd.notna(row['predicted_power']) else 0
+            del response_data['data']
+            return streaming_response(response_data, iter_groups(level.ds, slice(0, len(level)), load, graph_type))
 
-                response_data['data'][month_key].append({
-                    'actual_power': actual_power,
-                    'predicted_power': predicted_power,
-                    'timestamp': day_key
-                })
+        series = {column: clean_values(level.values(column, agg)) for column in COMPARISON_COLUMNS}
 
-        elif graph_type == 'all_time':
+        if graph_type == 'all_time':
             # Group all data month-wise
-            response_data['data'] = []
-            for _, row in df_resampled_monthly.iterrows():
-                month_key = row['ds'].strftime('%Y-%m')
-
-                actual_power = max(row['actual_power'], 0) if pd.notna(row['actual_power']) else 0
-                predicted_power = max(row['predicted_power'], 0) if pd.notna(row['predicted_power']) else 0
-
-                response_data['data'].append({
-                    'timestamp': row['ds'].strftime('%Y-%m'),
+            months = format_datetimes(level.ds, 'M').tolist()
+            response_data['data'] = [
+                {
+                    'timestamp': month,
                     'actual_power': actual_power,
                     'predicted_power': predicted_power,
-                    'month': month_key
-                })
+                    'month': month
+                }
+                for month, actual_power, predicted_power in zip(
+                    months, series['actual_power'], series['predicted_power'])
+            ]
+            return Response(response_data, status=status.HTTP_200_OK)
+
+        ds = level.ds
+
+        # Reduce long ranges to max_points with LTTB, keeping the chart shape
+        if max_points is not None:
+            positions, response_data['downsampling'] = downsample(ds, series, max_points)
+            ds = ds[positions]
+            series = {name: [values[i] for i in positions.tolist()] for name, values in series.items()}
+
+        # Group under the graph_type's hour/day/month/year key
+        response_data['data'] = group_records(ds, series, graph_type)
 
         return Response(response_data, status=status.HTTP_200_OK)
 
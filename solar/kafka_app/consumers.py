@@ -67,18 +67,7 @@ class AlertManager:
 
             # Write new alerts
             for analytic in out_of_range_analytics:
-                unique_id = str(uuid.uuid4())  # Generate a unique ID
-                row = [
-                    unique_id,  # Unique identifier
-                    datetime.now(), 
-                    data.get('ds'), 
-                    analytic['title'], 
-                    analytic['description']
-                ] + [
-                    f"{var}: {details['actual_value']} (expected {details['expected_range']['min']} - {details['expected_range']['max']})" 
-                    for var, details in analytic['out_of_range_variables'].items()
-                ]
-                writer.writerow(row)  # Write new alert
+                writer.writerow(AlertManager.alert_row(data, analytic))  # Write new alert
 
 
 
@@ -87,17 +76,80 @@ class AlertManager:
         print(f"Sending WebSocket alert for: {out_of_range_analytics}")  # Debugging statement
         channel_layer = get_channel_layer()
         for analytic in out_of_range_analytics:
-            message = {
-                "type": "alert",
-                "timestamp": data['ds'],
-                "title": analytic['title'],
-                "description": analytic['description'],
-                "out_of_range_variables": analytic['out_of_range_variables']
-            }
+            message = AlertManager.alert_message(data, analytic)
             async_to_sync(channel_layer.group_send)(
                 "alerts_group", {"type": "send_alert", "message": message}
             )
 
+    @staticmethod
+    def alert_row(data, analytic):
+        """The alert_logs.csv row of one broken rule."""
+        unique_id = str(uuid.uuid4())  # Generate a unique ID
+        return [
+            unique_id,  # Unique identifier
+            datetime.now(),
+            data.get('ds'),
+            analytic['title'],
+            analytic['description']
+        ] + [
+            f"{var}: {details['actual_value']} (expected {details['expected_range']['min']} - {details['expected_range']['max']})"
+            for var, details in analytic['out_of_range_variables'].items()
+        ]
+
+    @staticmethod
+    def alert_message(data, analytic):
+        """The WebSocket alert of one broken rule."""
+        return {
+            "type": "alert",
+            "timestamp": data['ds'],
+            "title": analytic['title'],
+            "description": analytic['description'],
+            "out_of_range_variables": analytic['out_of_range_variables']
+        }
+
+    # Batch versions for the batched consumer loops: one pass over the
+    # rules, one rewrite of the log and one group_send per batch
+
+    @staticmethod
+    def check_batch(batch):
+        """(data, out_of_range_analytics) of every message in ``batch`` that breaks a selected rule."""
+        alerts = []
+        for data in batch:
+            out_of_range = AlertManager.check_out_of_range(data)
+            if out_of_range:
+                alerts.append((data, out_of_range))
+        return alerts
+
+    @staticmethod
+    def log_batch_to_csv(alerts):
+        """Append the rows of every ``(data, out_of_range_analytics)`` to the log in one rewrite, trimmed like log_to_csv."""
+        rows = []
+        if os.path.exists(CSV_LOG_FILE):
+            with open(CSV_LOG_FILE, mode='r') as file:
+                rows = list(csv.reader(file))
+        for data, out_of_range_analytics in alerts:
+            if len(rows) >= 50:
+                rows = rows[-49:]
+            rows.extend(AlertManager.alert_row(data, analytic) for analytic in out_of_range_analytics)
+        with open(CSV_LOG_FILE, mode='w', newline='') as file:
+            csv.writer(file).writerows(rows)
+
+    @staticmethod
+    def send_websocket_alerts(alerts, channel_layer=None):
+        """Send the alerts of every ``(data, out_of_range_analytics)`` to the alerts group in one message."""
+        async_to_sync((channel_layer or get_channel_layer()).group_send)(
+            "alerts_group", {"type": "send_alerts", "messages": AlertManager.alert_messages(alerts)}
+        )
+
+    @staticmethod
+    def alert_messages(alerts):
+        """The WebSocket alerts of every ``(data, out_of_range_analytics)``."""
+        return [
+            AlertManager.alert_message(data, analytic)
+            for data, out_of_range_analytics in alerts
+            for analytic in out_of_range_analytics
+        ]
+
 
 
 # Consumers
@@ -115,6 +167,11 @@ class KafkaConsumer(AsyncWebsocketConsumer):
     async def send_kafka_message(self, event):
         await self.send(text_data=json.dumps({'message': event['message']}))
 
+    async def send_kafka_messages(self, event):
+        # A micro-batch from the batched consumer; clients still get one frame per message
+        for message in event['messages']:
+            await self.send(text_data=json.dumps({'message': message}))
+
 
 class WeatherConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -130,6 +187,10 @@ class WeatherConsumer(AsyncWebsocketConsumer):
     async def send_weather_message(self, event):
         await self.send(text_data=json.dumps({'message': event['message']}))
 
+    async def send_weather_messages(self, event):
+        for message in event['messages']:
+            await self.send(text_data=json.dumps({'message': message}))
+
 
 class AlertConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -140,4 +201,8 @@ class AlertConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_discard("alerts_group", self.channel_name)
 
     async def send_alert(self, event):
-        await self.send(text_data=json.dumps(event['message']))
\ No newline at end of file
+        await self.send(text_data=json.dumps(event['message']))
+
+    async def send_alerts(self, event):
+        for message in event['messages']:
+            await self.send(text_data=json.dumps(message))
\ No newline at end of file
@@ -0,0 +1,36 @@
+# kafka_app/management/commands/run_consumers.py
+from django.core.management.base import BaseCommand, CommandError
+
+from kafka_app.supervisor import Supervisor, known_streams, supervisor_settings, update_control
+
+
+class Command(BaseCommand):
+    help = "Run the Kafka consumers in supervised worker processes until SIGTERM or Ctrl-C."
+
+    def add_arguments(self, parser):
+        parser.add_argument('streams', nargs='*', help="Streams to consume (default: every stream in KAFKA_TOPICS).")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Worker processes, each consuming every stream; 0 starts one per topic partition "
+                                 "(default: the largest of KAFKA_CONSUMER_PROCESSES).")
+        parser.add_argument('--from-control', action='store_true',
+                            help="Consume the streams already in the control file (how the HTTP endpoints start it).")
+
+    def handle(self, *args, **options):
+        streams = known_streams()
+        unknown = [stream for stream in options['streams'] if stream not in streams]
+        if unknown:
+            raise CommandError(f"Unknown stream(s): {', '.join(unknown)}")
+        if options['processes'] is not None and options['processes'] < 0:
+            raise CommandError("--processes must be at least 0.")
+
+        if not options['from_control']:
+            defaults = supervisor_settings()[1]
+            streams = options['streams'] or streams
+            update_control({
+                stream: defaults[stream] if options['processes'] is None else options['processes']
+                for stream in streams
+            }, replace=True)
+        try:
+            Supervisor().run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,135 @@
+# kafka_app/pipeline.py
+"""
+Asyncio consumer runner: every stream on one event loop and one channel layer.
+
+The batched loop in ``tasks`` is synchronous, so every ``group_send`` goes
+through ``async_to_sync``, a thread hop and a fresh event loop per call.
+Here the channel layer is awaited directly from a single loop:
+
+- the consumer (one for every stream, see ``tasks``) is polled in an
+  executor thread, which also decodes and splits the batch by topic and
+  puts it on a bounded ``asyncio.Queue``, so polling runs ahead of
+  processing by at most KAFKA_QUEUE_BATCHES batches;
+- the loop takes the batches in order and, for each stream in one,
+  concurrently checks the alert rules and sends the messages and their
+  alerts to the WebSocket groups, with at most KAFKA_ASYNC_CONCURRENCY
+  ``group_send`` calls in flight;
+- meanwhile one store thread feeds the live buffers, the derived engine
+  and the sample writer (and the alert log), which are synchronous and must
+  see the messages in order; the next batch starts once the previous one is
+  stored and sent.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.layers import get_channel_layer
+
+from .consumers import AlertManager
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_QUEUE_BATCHES = 4
+
+
+def pipeline_settings():
+    """(group_send calls in flight, decoded batches queued) from settings, or the defaults."""
+    from django.conf import settings
+    return (
+        int(getattr(settings, 'KAFKA_ASYNC_CONCURRENCY', DEFAULT_CONCURRENCY)),
+        int(getattr(settings, 'KAFKA_QUEUE_BATCHES', DEFAULT_QUEUE_BATCHES)),
+    )
+
+
+def store_batch(store, batch, alerts):
+    """Run on the store thread: log the batch's alerts, then feed it to the stream's store function."""
+    if alerts:
+        AlertManager.log_batch_to_csv(alerts)
+    store(batch)
+
+
+async def poll_batches(consumer, queue, stop, executor, batch_size, linger):
+    """Put the consumer's decoded batches, per topic, on ``queue`` until ``stop`` is set, then a None."""
+    from .tasks import decode_by_topic
+
+    loop = asyncio.get_running_loop()
+    poll = lambda: decode_by_topic(consumer.consume(num_messages=batch_size, timeout=linger))  # noqa: E731
+    try:
+        while not stop.is_set():
+            batches = await loop.run_in_executor(executor, poll)
+            if batches:
+                # Waits while the queue is full: processing pushes back on polling
+                await queue.put(batches)
+    finally:
+        await queue.put(None)
+
+
+async def send(channel_layer, semaphore, group, event_type, messages, chunk_size):
+    """Send ``messages`` to ``group`` in order, ``chunk_size`` per group_send."""
+    for lo in range(0, len(messages), chunk_size):
+        async with semaphore:
+            await channel_layer.group_send(group, {'type': event_type, 'messages': messages[lo:lo + chunk_size]})
+
+
+async def process_batch(stream, batch, channel_layer, semaphore, store_executor, chunk_size):
+    """Store one stream's batch on the store thread while its messages and alerts are sent."""
+    loop = asyncio.get_running_loop()
+    alerts = AlertManager.check_batch(batch)
+    jobs = [
+        loop.run_in_executor(store_executor, store_batch, stream.store, batch, alerts),
+        send(channel_layer, semaphore, stream.group, stream.event_type, batch, chunk_size),
+    ]
+    if alerts:
+        jobs.append(send(channel_layer, semaphore, 'alerts_group', 'send_alerts',
+                         AlertManager.alert_messages(alerts), chunk_size))
+    await asyncio.gather(*jobs)
+
+
+async def consume_streams(names=None, stop=None, consumer=None):
+    """
+    Run the named streams (default: all) on the current loop until ``stop`` is set.
+
+    ``consumer`` is a subscribed consumer to read from instead of the
+    source KAFKA_MESSAGE_SOURCE names; it is closed on the way out.
+    """
+    from data_api import samples
+    from .sources import open_source
+    from .tasks import batch_settings, stream_topics
+
+    topics = stream_topics(names)
+    stop = stop or threading.Event()
+    if consumer is None:
+        consumer = open_source(topics)
+    batch_size, linger, chunk_size = batch_settings()
+    concurrency, queue_batches = pipeline_settings()
+    channel_layer = get_channel_layer()
+    semaphore = asyncio.Semaphore(concurrency)
+    queue = asyncio.Queue(maxsize=queue_batches)
+    loop = asyncio.get_running_loop()
+    poll_executor = ThreadPoolExecutor(1, thread_name_prefix='poll')
+    store_executor = ThreadPoolExecutor(1, thread_name_prefix='store')
+    poller = asyncio.create_task(poll_batches(consumer, queue, stop, poll_executor, batch_size, linger))
+    try:
+        while (batches := await queue.get()) is not None:
+            await asyncio.gather(*(
+                process_batch(topics[topic], batch, channel_layer, semaphore, store_executor, chunk_size)
+                for topic, batch in batches.items()
+            ))
+    finally:
+        # Let the poller see ``stop`` (or an error here) and finish its last consume
+        stop.set()
+        while not poller.done():
+            if queue.empty():
+                await asyncio.sleep(0.01)
+            else:
+                queue.get_nowait()
+        poll_executor.shutdown()
+        # The store thread owns the sample writer's database connection
+        await loop.run_in_executor(store_executor, samples.writer.flush)
+        store_executor.shutdown()
+        consumer.close()
+
+
+def run_async_consumers(names=None, stop=None):
+    """Consume the named streams (default: all) on one event loop and channel layer until ``stop`` is set."""
+    print(f"Starting the asyncio consumer for {', '.join(names or ['every stream'])}...")
+    asyncio.run(consume_streams(names, stop))
@@ -0,0 +1,215 @@
+# kafka_app/sources.py
+"""
+Where the consumer loops read their messages from.
+
+A message source is anything with the part of confluent_kafka's Consumer
+the loops use: ``subscribe(topics)``, ``consume(num_messages, timeout)``
+returning messages with ``topic()``, ``value()``, ``offset()``, ``error()``
+and ``timestamp()``, and ``close()``. Sources are registered by name with
+``register_source``; ``open_source`` builds the one KAFKA_MESSAGE_SOURCE
+names:
+
+- 'kafka' (the default): a Consumer on the brokers and group in settings;
+- 'replay': the minute CSV exports replayed in-process as JSON messages,
+  KAFKA_REPLAY_SPEED times faster than real time (0 for as fast as they
+  are consumed), to run and load-test the streaming path without a
+  cluster. A stream replaying several exports plays them one after the
+  other, each starting the minute after the previous one ends.
+"""
+import json
+import time
+from operator import itemgetter
+
+import pandas as pd
+
+from data_api.series import IST
+
+DEFAULT_SOURCE = 'kafka'
+DEFAULT_REPLAY_SPEED = 60.0
+
+# Datasets replayed in turn on the topic of each stream
+REPLAY_DATASETS = {'inverter': ['inverter_min', 'inverter'], 'weather': ['weather']}
+# 'ds' layout of the replayed messages, that of inverter_min.csv and Weather_min.csv
+REPLAY_TIME_FORMAT = '%m/%d/%y %H:%M'
+
+MINUTE = 60 * 10**9  # in nanoseconds
+
+# confluent_kafka.TIMESTAMP_CREATE_TIME: the timestamp was set by the producer
+TIMESTAMP_CREATE_TIME = 1
+
+# source name -> factory(topics) returning an unsubscribed source
+SOURCES = {}
+
+
+def register_source(name):
+    """Register the decorated ``factory(topics)`` as message source ``name``."""
+    def decorator(factory):
+        SOURCES[name] = factory
+        return factory
+    return decorator
+
+
+def source_settings():
+    """(message source name, replay speed-up) from settings, or the defaults."""
+    from django.conf import settings
+    return (
+        getattr(settings, 'KAFKA_MESSAGE_SOURCE', DEFAULT_SOURCE),
+        float(getattr(settings, 'KAFKA_REPLAY_SPEED', DEFAULT_REPLAY_SPEED)),
+    )
+
+
+def open_source(topics, name=None):
+    """Source ``name`` (default: KAFKA_MESSAGE_SOURCE) subscribed to ``topics``, a topic -> Stream mapping."""
+    name = name or source_settings()[0]
+    if name not in SOURCES:
+        raise ValueError(f"Unknown message source {name!r}; registered: {', '.join(SOURCES)}")
+    source = SOURCES[name](topics)
+    source.subscribe(list(topics))
+    return source
+
+
+@register_source('kafka')
+def kafka_source(topics):
+    from .tasks import Consumer, consumer_config
+    return Consumer(consumer_config())
+
+
+@register_source('replay')
+def replay_source(topics):
+    return ReplaySource(replay_messages(topics), speed=source_settings()[1])
+
+
+def replay_messages(topics):
+    """
+    (minute, topic, payload) of every row replayed on ``topics``, a topic -> Stream mapping, in time order.
+
+    ``minute`` is the row's time in datetime64[ns] nanoseconds and
+    ``payload`` its JSON encoding without the 'ds', which the replay stamps
+    when it creates the message. The exports of a stream are chained: each
+    one's minutes are moved to start one minute after the previous export's
+    last, so none is replayed twice over the same minutes and no gap
+    between the exports' dates is waited out.
+    """
+    from data_api.datasets import DATASETS
+
+    messages = []
+    for topic, stream in topics.items():
+        follows = None
+        for dataset in REPLAY_DATASETS.get(stream.name, []):
+            df = pd.read_csv(DATASETS[dataset]['source'], dtype={'ds': str})
+            minutes = pd.to_datetime(df.pop('ds'), format='mixed').to_numpy('datetime64[ns]').astype('int64')
+            if follows is not None and len(minutes):
+                minutes += follows + MINUTE - minutes.min()
+            if len(minutes):
+                follows = int(minutes.max())
+            payloads = (json.dumps(record).encode() for record in df.to_dict('records'))
+            messages.extend(zip(minutes.tolist(), [topic] * len(df), payloads))
+    # Stable: rows of the same minute keep their topic and file order
+    messages.sort(key=itemgetter(0))
+    return messages
+
+
+class ReplayMessage:
+    """One replayed message, read like a confluent_kafka Message."""
+
+    __slots__ = ('_topic', '_value', '_offset', '_created')
+
+    def __init__(self, topic, value, offset, created):
+        self._topic = topic
+        self._value = value
+        self._offset = offset
+        self._created = created
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return None
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, int(self._created * 1000)
+
+
+class ReplaySource:
+    """
+    Replays ``messages`` (see replay_messages) through a Kafka consumer's ``consume``.
+
+    The replay starts at the first ``consume`` and creates each message
+    ``speed`` times faster than its minute follows the first one, or, with
+    a speed of 0, as soon as it is asked for. A message's 'ds' is its minute
+    moved by as much as the first minute is before the IST minute the
+    replay starts at, so the readings arrive as new ones rather than as the
+    history the datasets already hold. Its timestamp is its creation time, and
+    ``on_create(topic, created)`` (if given) is called as it is created.
+
+    Like Kafka's, ``consume`` returns once it has ``num_messages`` messages
+    or ``timeout`` seconds have passed; after the last message it only waits
+    out the timeout.
+    """
+
+    def __init__(self, messages, speed=DEFAULT_REPLAY_SPEED, on_create=None):
+        self.messages = messages
+        self.speed = speed
+        self.on_create = on_create
+        self.position = 0
+        self.offsets = {}
+        self.started = None
+        self.shift = 0
+
+    def subscribe(self, topics):
+        self.messages = [message for message in self.messages if message[1] in topics]
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.messages)
+
+    def due(self, minute):
+        """Wall-clock time the message of ``minute`` is created at."""
+        return self.started + (minute - self.messages[0][0]) / 1e9 / self.speed
+
+    def create(self, created):
+        minute, topic, payload = self.messages[self.position]
+        self.position += 1
+        offset = self.offsets.get(topic, 0)
+        self.offsets[topic] = offset + 1
+        ds = pd.Timestamp(minute + self.shift).strftime(REPLAY_TIME_FORMAT)
+        if self.on_create is not None:
+            self.on_create(topic, created)
+        return ReplayMessage(topic, b'{"ds": "%s", %s' % (ds.encode(), payload[1:]), offset, created)
+
+    def consume(self, num_messages=1, timeout=-1):
+        now = time.time()
+        if self.started is None:
+            self.started = now
+            if self.messages:
+                # The datasets' clock is naive IST, whatever the host's zone
+                started = pd.Timestamp.now(tz=IST).tz_localize(None).floor('min')
+                self.shift = started.value - self.messages[0][0]
+        deadline = now + timeout if timeout >= 0 else None
+        batch = []
+        while len(batch) < num_messages:
+            if self.exhausted:
+                if deadline is not None and not batch:
+                    time.sleep(max(deadline - time.time(), 0))
+                break
+            if self.speed <= 0:
+                batch.append(self.create(time.time()))
+                continue
+            due = self.due(self.messages[self.position][0])
+            wait = due - time.time()
+            if deadline is not None and due > deadline:
+                time.sleep(max(deadline - time.time(), 0))
+                break
+            if wait > 0:
+                time.sleep(wait)
+            batch.append(self.create(due))
+        return batch
+
+    def close(self):
+        pass
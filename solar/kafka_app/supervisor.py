@@ -0,0 +1,393 @@
+# kafka_app/supervisor.py
+"""
+Supervised Kafka consumer processes.
+
+``manage.py run_consumers`` runs a supervisor that keeps a pool of worker
+processes alive. Each worker runs one consumer subscribed to the topics of
+every enabled stream (inverter, weather, see ``tasks``), all in the same
+consumer group, so Kafka spreads the partitions over the workers. The pool
+has as many workers as the largest process count asked for a stream; 0
+means one per partition of the largest topic. A worker that exits or crashes is restarted after a
+backoff that doubles on every quick failure. SIGTERM or SIGINT stops the
+workers gracefully (each finishes its current message, writes its queued
+samples and closes its consumer, committing offsets) and then the
+supervisor.
+
+The supervisor and the web workers share two small JSON files in
+KAFKA_RUN_DIR: ``control.json`` holds the process count wanted per stream
+and ``status.json`` the supervisor's report, rewritten every tick. Each
+worker rewrites ``worker-<index>.json`` with its live buffers and sample
+writer every tick too, and the supervisor copies it into its report, since
+the web workers' own buffers and writer never see a message. The
+HTTP endpoints only read the status and edit the control file (starting a
+supervisor first if none is running), so they return immediately; the
+supervisor reconciles its workers with the control file on its next tick.
+
+Workers are forked from the supervisor, so readings they buffer in memory
+(``data_api.live``) reach the web workers through the flushes to the
+compiled store and the sample tables.
+"""
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RUN_DIR = os.path.join(BASE_DIR, 'kafka_app', 'run')
+DEFAULT_PROCESSES = {'inverter': 1, 'weather': 1}
+DEFAULT_STOP_TIMEOUT = 30.0
+# Seconds between reconciliations
+TICK = 1.0
+# Restart backoff: doubled on every exit within MIN_UPTIME of a start
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+MIN_UPTIME = 60.0
+
+
+def known_streams():
+    """The streams with a topic in KAFKA_TOPICS."""
+    from django.conf import settings
+    return list(getattr(settings, 'KAFKA_TOPICS', DEFAULT_PROCESSES))
+
+
+def supervisor_settings():
+    """(run directory, processes per stream, seconds to wait for workers to stop) from settings, or the defaults."""
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_RUN_DIR, dict(DEFAULT_PROCESSES), DEFAULT_STOP_TIMEOUT
+    return (
+        str(getattr(settings, 'KAFKA_RUN_DIR', DEFAULT_RUN_DIR)),
+        {**dict.fromkeys(known_streams(), 1), **getattr(settings, 'KAFKA_CONSUMER_PROCESSES', {})},
+        float(getattr(settings, 'KAFKA_STOP_TIMEOUT', DEFAULT_STOP_TIMEOUT)),
+    )
+
+
+def run_path(name, run_dir=None):
+    return os.path.join(run_dir or supervisor_settings()[0], name)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Replace ``path`` atomically, so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def control_lock(run_dir=None):
+    """Hold an exclusive cross-process lock on the control file."""
+    path = run_path('control.lock', run_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def read_control(run_dir=None):
+    """Stream -> wanted process count (0 = one per partition); streams absent are stopped."""
+    return read_json(run_path('control.json', run_dir), {})
+
+
+def update_control(changes, run_dir=None, replace=False):
+    """Merge ``changes`` (stream -> process count, None to stop) into the control file, or replace it; returns it."""
+    with control_lock(run_dir):
+        control = {} if replace else read_control(run_dir)
+        for stream, processes in changes.items():
+            if processes is None:
+                control.pop(stream, None)
+            else:
+                control[stream] = int(processes)
+        write_json(run_path('control.json', run_dir), control)
+    return control
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def supervisor_status(run_dir=None):
+    """The running supervisor's last report, or None if no supervisor is running."""
+    status = read_json(run_path('status.json', run_dir))
+    if not status or not pid_alive(status.get('pid', 0)) or status.get('state') == 'stopped':
+        return None
+    return status
+
+
+def spawn_supervisor():
+    """Start ``manage.py run_consumers`` detached from this process; it takes its streams from the control file."""
+    run_dir = supervisor_settings()[0]
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, 'supervisor.log'), 'ab') as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, 'manage.py'), 'run_consumers', '--from-control'],
+            cwd=BASE_DIR, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    return process.pid
+
+
+def ensure_stream(stream, processes=None):
+    """Ask for ``stream`` to be consumed, starting a supervisor if none is running; returns the status."""
+    if processes is None:
+        processes = supervisor_settings()[1][stream]
+    update_control({stream: processes})
+    status = supervisor_status()
+    if status is None:
+        return {'state': 'starting', 'pid': spawn_supervisor(), 'control': read_control()}
+    return status
+
+
+def stop_stream(stream):
+    """Ask the running supervisor to stop consuming ``stream``."""
+    update_control({stream: None})
+    return supervisor_status()
+
+
+def stop_supervisor():
+    """SIGTERM the running supervisor; returns its pid, or None if none was running."""
+    status = supervisor_status()
+    if status is None:
+        return None
+    os.kill(status['pid'], signal.SIGTERM)
+    return status['pid']
+
+
+def worker_stats():
+    """This worker's live buffers and sample writer, for the supervisor's report."""
+    from data_api import live, samples
+    return {'pid': os.getpid(), 'updated': time.time(), 'live': live.buffer_report(),
+            'samples': samples.writer.report()}
+
+
+def report_stats(path, stop):
+    """Rewrite the worker's stats file every tick until ``stop`` is set."""
+    while not stop.wait(TICK):
+        try:
+            write_json(path, worker_stats())
+        except OSError as e:
+            print(f"Error writing {path}: {e}", flush=True)
+
+
+def worker_main(streams, index, run_dir=None):
+    """Entry point of a worker process: consume the streams until SIGTERM."""
+    from django.conf import settings
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    # A terminal's Ctrl-C reaches the whole process group; let the supervisor handle it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f"[consumer#{index}] worker {os.getpid()} started for {', '.join(streams)}", flush=True)
+    from data_api import live
+    stats_path = run_path(f'worker-{index}.json', run_dir)
+    threading.Thread(target=report_stats, args=(stats_path, stop), name='worker-stats', daemon=True).start()
+    try:
+        if getattr(settings, 'KAFKA_ASYNC_CONSUMERS', False):
+            from .pipeline import run_async_consumers
+            run_async_consumers(list(streams), stop)
+        else:
+            from .tasks import run_consumer
+            run_consumer(list(streams), stop)
+    finally:
+        stop.set()
+        # The flush thread is a daemon: publish what it hasn't yet before exiting
+        live.flush_all()
+        write_json(stats_path, worker_stats())
+
+
+class Worker:
+    """One supervised consumer process and its restart history."""
+
+    def __init__(self, streams, index):
+        self.streams = streams
+        self.index = index
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.backoff = MIN_BACKOFF
+        self.restart_at = 0.0
+        self.last_exit = None
+
+    def start(self, context, run_dir=None):
+        from django.db import connections
+
+        # Never share a database connection with the child
+        connections.close_all()
+        self.process = context.Process(
+            target=worker_main, args=(self.streams, self.index, run_dir),
+            name=f'consumer-{self.index}', daemon=False,
+        )
+        self.process.start()
+        self.started = time.time()
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def reap(self, now):
+        """Record an exited process and schedule its restart; returns True if it had exited."""
+        if self.process is None or self.process.is_alive():
+            return False
+        self.process.join()
+        self.last_exit = {'code': self.process.exitcode, 'at': now}
+        # Back off harder on every crash shortly after a start; reset after a good run
+        self.backoff = MIN_BACKOFF if now - self.started >= MIN_UPTIME else min(self.backoff * 2, MAX_BACKOFF)
+        self.restart_at = now + self.backoff
+        self.process = None
+        return True
+
+    def report(self, run_dir=None):
+        return {
+            'index': self.index,
+            'streams': list(self.streams),
+            'pid': self.process.pid if self.alive() else None,
+            'alive': self.alive(),
+            'started': self.started,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            # Its latest stats file; an exited worker's last one
+            'stats': read_json(run_path(f'worker-{self.index}.json', run_dir)),
+        }
+
+
+class Supervisor:
+    """Keeps the pool of workers the control file asks for running, restarting crashed ones."""
+
+    def __init__(self, run_dir=None, stop_timeout=None):
+        default_dir, _, default_timeout = supervisor_settings()
+        self.run_dir = run_dir or default_dir
+        self.stop_timeout = default_timeout if stop_timeout is None else stop_timeout
+        self.context = multiprocessing.get_context('fork')
+        self.workers = {}  # (streams, index) -> Worker
+        self.partitions = {}  # streams -> partition count of their largest topic, looked up once
+        self.stopping = False
+        self.started = time.time()
+
+    def wanted(self):
+        """(streams, index) of every worker the control file asks for."""
+        control = read_control(self.run_dir)
+        streams = tuple(stream for stream in known_streams() if stream in control)
+        if not streams:
+            return []
+        counts = [control[stream] for stream in streams]
+        processes = max(counts)
+        if min(counts) <= 0:
+            processes = max(processes, self.partition_count(streams))
+        return [(streams, index) for index in range(processes)]
+
+    def partition_count(self, streams):
+        from .sources import source_settings
+        if source_settings()[0] != 'kafka':
+            # Every process reads all of a local source, so one is enough
+            return 1
+        if streams not in self.partitions:
+            from .tasks import partition_count, stream_topics
+            topics = list(stream_topics(list(streams)))
+            try:
+                self.partitions[streams] = max(partition_count(topics), 1)
+            except Exception as e:
+                # Metadata unavailable: run one worker, look again next tick
+                print(f"Error reading the partitions of {', '.join(topics)}: {e}", flush=True)
+                return 1
+        return self.partitions[streams]
+
+    def reconcile(self):
+        """Start, restart and stop workers to match the control file."""
+        now = time.time()
+        wanted = set(self.wanted())
+        for key in wanted - set(self.workers):
+            self.workers[key] = Worker(*key)
+        for key, worker in list(self.workers.items()):
+            if key not in wanted:
+                self.stop_workers([worker])
+                del self.workers[key]
+                continue
+            if worker.reap(now):
+                print(f"[consumer#{worker.index}] exited with code {worker.last_exit['code']}, "
+                      f"restarting in {worker.backoff:.0f}s", flush=True)
+            if worker.process is None and now >= worker.restart_at:
+                if worker.started is not None:
+                    worker.restarts += 1
+                worker.start(self.context, self.run_dir)
+
+    def stop_workers(self, workers):
+        """SIGTERM the workers, wait up to the stop timeout, then kill those still running."""
+        workers = [worker for worker in workers if worker.alive()]
+        for worker in workers:
+            worker.process.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        for worker in workers:
+            worker.process.join(max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                print(f"[consumer#{worker.index}] didn't stop in {self.stop_timeout:.0f}s, killing it", flush=True)
+                worker.process.kill()
+                worker.process.join()
+
+    def write_status(self, state):
+        workers = [worker.report(self.run_dir) for _, worker in sorted(self.workers.items())]
+        write_json(run_path('status.json', self.run_dir), {
+            'pid': os.getpid(),
+            'state': state,
+            'started': self.started,
+            'updated': time.time(),
+            'control': read_control(self.run_dir),
+            'workers': workers,
+        })
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        """Supervise until SIGTERM/SIGINT, then stop every worker."""
+        os.makedirs(self.run_dir, exist_ok=True)
+        # Held for the supervisor's lifetime (and its workers', which inherit it)
+        lock_file = open(run_path('supervisor.lock', self.run_dir), 'w')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise RuntimeError("Another consumer supervisor (or its workers) is already running.")
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        print(f"Consumer supervisor {os.getpid()} started", flush=True)
+        try:
+            while not self.stopping:
+                self.reconcile()
+                self.write_status('running')
+                time.sleep(TICK)
+            self.write_status('stopping')
+        finally:
+            self.stop_workers(list(self.workers.values()))
+            self.write_status('stopped')
+            lock_file.close()
+            print(f"Consumer supervisor {os.getpid()} stopped", flush=True)
@@ -1,132 +1,232 @@
 # kafka_app/tasks.py
-
+"""
+The Kafka consumer: one connection and one poll loop for every stream.
+
+A stream is registered with ``register_stream`` on the function that
+stores a batch of its messages (live buffers, derived KPIs, samples),
+together with the WebSocket group and event type its messages are
+published under; its topic is its entry in KAFKA_TOPICS. ``run_consumer``
+subscribes a single consumer to the topics of the streams asked for and
+hands each consumed batch to them by topic, so a new stream is a
+registration and a KAFKA_TOPICS entry rather than another consumer loop.
+Broker, group and topics come from settings, which read them from the
+environment, and so does the source of the messages (see ``sources``):
+the cluster, or a local replay of the CSV exports.
+"""
 import json
 from confluent_kafka import Consumer, KafkaException
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from .consumers import AlertManager
-
-def process_message(data):
-    """Send the processed Kafka message to the WebSocket group."""
-    print(f"Processing message: {data}")
-    # Send the processed message to the WebSocket group
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        'kafka_group',  # Ensure this matches the group name in the WebSocket consumer
-        {
-            'type': 'send_kafka_message',  # This should match the method in the WebSocket consumer
-            'message': data
-        }
-    )
-
-def process_weather_message(data):
-    """Send the processed Kafka message to the WebSocket group."""
-    print(f"Processing message: {data}")
-    # Send the processed message to the WebSocket group
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        'weather_group',  # Ensure this matches the group name in the WebSocket consumer
-        {
-            'type': 'send_weather_message',  # This should match the method in the WebSocket consumer
-            'message': data
-        }
-    )
-
-def run_kafka_consumer():
-    """Kafka Consumer for processing inverter data."""
-    print("Starting the Kafka consumer task...")
-
-    # Kafka consumer configuration
-    consumer_config = {
-        'bootstrap.servers': 'b-2.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092,b-1.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092',
-        'group.id': 'my-consumer-group-2',
-        'auto.offset.reset': 'earliest',
-        'security.protocol': 'PLAINTEXT',
-        'max.poll.interval.ms': 900000
+from .sources import open_source
+from data_api import live, samples
+from derived.engine import engine as derived_engine
+
+try:
+    import orjson
+except ImportError:  # decoded with json
+    orjson = None
+
+DEFAULT_BOOTSTRAP_SERVERS = 'b-2.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092,b-1.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092'
+DEFAULT_GROUP_ID = 'my-consumer-group-2'
+DEFAULT_TOPICS = {'inverter': 'inverter-topic-1', 'weather': 'weather-topic-1'}
+DEFAULT_CONSUMER_CONFIG = {
+    'auto.offset.reset': 'earliest',
+    'security.protocol': 'PLAINTEXT',
+    'max.poll.interval.ms': 900000
+}
+
+# Messages per consume() call, seconds consume() waits to fill a batch, and
+# messages per group_send of a batch to the WebSocket groups
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_LINGER = 0.5
+DEFAULT_PUBLISH_BATCH_SIZE = 100
+
+
+class Stream:
+    """A registered stream: where its messages are published and how a batch of them is stored."""
+
+    def __init__(self, name, group, event_type, store):
+        self.name = name
+        self.group = group
+        self.event_type = event_type
+        self.store = store
+
+
+# stream name -> Stream, in registration order
+STREAMS = {}
+
+
+def register_stream(name, group, event_type):
+    """Register the decorated ``store(batch)`` function as the handler of stream ``name``."""
+    def decorator(store):
+        STREAMS[name] = Stream(name, group, event_type, store)
+        return store
+    return decorator
+
+
+def consumer_config():
+    """The consumer configuration from settings: KAFKA_CONSUMER_CONFIG plus the brokers and group."""
+    from django.conf import settings
+    return {
+        **getattr(settings, 'KAFKA_CONSUMER_CONFIG', DEFAULT_CONSUMER_CONFIG),
+        'bootstrap.servers': getattr(settings, 'KAFKA_BOOTSTRAP_SERVERS', DEFAULT_BOOTSTRAP_SERVERS),
+        'group.id': getattr(settings, 'KAFKA_CONSUMER_GROUP', DEFAULT_GROUP_ID),
     }
 
-    consumer = Consumer(consumer_config)
-    topic = 'inverter-topic-1'
-    consumer.subscribe([topic])
-
-    print(f'Subscribed to Kafka topic: {topic}')
 
-    try:
-        while True:
-            # Polling messages from Kafka
-            msg = consumer.poll(1.0)
-            if msg is None:
-                # No message received
-                continue
-            if msg.error():
-                print(f"Consumer error: {msg.error()}")
-            else:
-                # Successfully received a message
-                data = json.loads(msg.value().decode('utf-8'))
-                print(f"Received message: {data}")
-
-                # Check for out-of-range values
-                out_of_range = AlertManager.check_out_of_range(data)
-                if out_of_range:
-                    # Log to CSV and send WebSocket alert if values are out of range
-                    AlertManager.log_to_csv(data, out_of_range)
-                    AlertManager.send_websocket_alert(out_of_range, data)
-
-                # Process the message to send to WebSocket group
-                process_message(data)
+def stream_topics(names=None):
+    """Topic -> registered Stream for the named streams (default: every stream in KAFKA_TOPICS)."""
+    from django.conf import settings
+    topics = getattr(settings, 'KAFKA_TOPICS', DEFAULT_TOPICS)
+    names = list(topics) if names is None else names
+    unknown = [name for name in names if name not in topics or name not in STREAMS]
+    if unknown:
+        raise ValueError(f"No topic or handler registered for stream(s): {', '.join(unknown)}")
+    return {topics[name]: STREAMS[name] for name in names}
 
-    except KeyboardInterrupt:
-        print("Consumer stopped by user")
 
+def partition_count(topics, timeout=10.0):
+    """The largest partition count among ``topics``, from the cluster's metadata."""
+    consumer = Consumer(consumer_config())
+    try:
+        metadata = consumer.list_topics(timeout=timeout).topics
+        return max(len(metadata[topic].partitions) for topic in topics)
     finally:
         consumer.close()
 
 
-# Weather Data Consumer Task
-def run_weather_consumer():
-    """Kafka Consumer for processing weather data."""
-    print("Starting the Weather Kafka consumer task...")
-
-    consumer_config = {
-        'bootstrap.servers': 'b-2.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092,b-1.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092',
-        'group.id': 'weather-consumer-group',
-        'auto.offset.reset': 'earliest',
-        'security.protocol': 'PLAINTEXT',
-        'max.poll.interval.ms': 900000
-    }
+def batch_settings():
+    """(messages per consume, seconds to wait filling a batch, messages per group_send) from settings, or the defaults."""
+    from django.conf import settings
+    return (
+        int(getattr(settings, 'KAFKA_BATCH_SIZE', DEFAULT_BATCH_SIZE)),
+        float(getattr(settings, 'KAFKA_BATCH_LINGER', DEFAULT_BATCH_LINGER)),
+        int(getattr(settings, 'KAFKA_PUBLISH_BATCH_SIZE', DEFAULT_PUBLISH_BATCH_SIZE)),
+    )
 
-    consumer = Consumer(consumer_config)
-    topic = 'weather-topic-1'
-    consumer.subscribe([topic])
 
-    print(f'Subscribed to Kafka topic: {topic}')
+def decode(value):
+    """One message payload; falls back to json for what orjson rejects (NaN readings)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(value)
+
+
+def decode_by_topic(messages):
+    """The payloads of a consumed batch per topic, in order; errors and undecodable messages are logged and skipped."""
+    batches = {}
+    for msg in messages:
+        if msg.error():
+            print(f"Consumer error: {msg.error()}")
+            continue
+        try:
+            batches.setdefault(msg.topic(), []).append(decode(msg.value()))
+        except ValueError as e:
+            print(f"Skipping undecodable message at {msg.topic()} offset {msg.offset()}: {e}")
+    return batches
+
+
+def publish(channel_layer, group, event_type, messages, chunk_size=None):
+    """Send ``messages`` to a WebSocket group in micro-batches of ``chunk_size``, one group_send each."""
+    chunk_size = chunk_size or batch_settings()[2]
+    group_send = async_to_sync(channel_layer.group_send)
+    for lo in range(0, len(messages), chunk_size):
+        group_send(group, {'type': event_type, 'messages': messages[lo:lo + chunk_size]})
+
+
+def process_alerts(batch, channel_layer):
+    """Log and send the alerts of every message in ``batch`` that is out of range."""
+    alerts = AlertManager.check_batch(batch)
+    if alerts:
+        AlertManager.log_batch_to_csv(alerts)
+        AlertManager.send_websocket_alerts(alerts, channel_layer)
+
+
+@register_stream('inverter', group='kafka_group', event_type='send_kafka_messages')
+def store_inverter_batch(batch):
+    """Live buffers, derived KPIs and samples for a batch of inverter messages, in message order."""
+    for data in batch:
+        # Buffer the reading for the data views and update the live derived KPIs
+        live.append('inverter', data)
+        derived_engine.add_inverter(data)
+        # Queue the readings for the next batched write to the database
+        samples.record_inverter(data)
+
+
+@register_stream('weather', group='weather_group', event_type='send_weather_messages')
+def store_weather_batch(batch):
+    """Live buffers, irradiance for the derived KPIs and samples for a batch of weather messages."""
+    for data in batch:
+        live.append('weather', data)
+        derived_engine.add_weather(data)
+        samples.record_weather(data)
+
+
+def process_batch(stream, batch, channel_layer):
+    """Alerts, WebSocket updates and storage for a batch of one stream's messages."""
+    process_alerts(batch, channel_layer)
+    publish(channel_layer, stream.group, stream.event_type, batch)
+    stream.store(batch)
+
+
+def consume_batches(consumer, topics, stop=None, batch_size=None, linger=None):
+    """
+    Consume up to ``batch_size`` messages at a time and hand them to their topic's stream.
+
+    ``topics`` maps each subscribed topic to its Stream. ``consume`` returns
+    once the batch is full or ``linger`` seconds have passed, so busy topics
+    are read in large batches and quiet ones still within ``linger`` of a
+    message arriving. Runs until ``stop`` is set; returns the number of
+    messages processed.
+    """
+    default_size, default_linger, _ = batch_settings()
+    batch_size = batch_size or default_size
+    linger = default_linger if linger is None else linger
+    channel_layer = get_channel_layer()
+    processed = 0
+    while stop is None or not stop.is_set():
+        messages = consumer.consume(num_messages=batch_size, timeout=linger)
+        if not messages:
+            continue
+        for topic, batch in decode_by_topic(messages).items():
+            process_batch(topics[topic], batch, channel_layer)
+            processed += len(batch)
+    return processed
+
+
+def run_consumer(names=None, stop=None, consumer=None):
+    """
+    Consume the named streams (default: all) with one consumer until ``stop`` is set.
+
+    ``consumer`` is a subscribed consumer to read from instead of the
+    source KAFKA_MESSAGE_SOURCE names; it is closed on the way out.
+    """
+    topics = stream_topics(names)
+    print(f"Starting the Kafka consumer for {', '.join(stream.name for stream in topics.values())}...")
+    if consumer is None:
+        consumer = open_source(topics)
+        print(f"Subscribed to Kafka topics: {', '.join(topics)}")
 
     try:
-        while True:
-            # Polling messages from Kafka
-            msg = consumer.poll(1.0)
-            if msg is None:
-                # No message received
-                continue
-            if msg.error():
-                print(f"Consumer error: {msg.error()}")
-            else:
-                # Successfully received a message
-                data = json.loads(msg.value().decode('utf-8'))
-                print(f"Received weather message: {data}")
-
-                # Check for out-of-range values for weather
-                out_of_range = AlertManager.check_out_of_range(data)
-                if out_of_range:
-                    # Log to CSV and send WebSocket alert if values are out of range
-                    AlertManager.log_to_csv(data, out_of_range)
-                    AlertManager.send_websocket_alert(out_of_range, data)
-
-                # Process the message to send to WebSocket group
-                process_weather_message(data)
+        consume_batches(consumer, topics, stop)
 
     except KeyboardInterrupt:
-        print("Weather consumer stopped by user")
+        print("Consumer stopped by user")
 
     finally:
-        consumer.close()
\ No newline at end of file
+        samples.writer.flush()
+        consumer.close()
+
+
+def run_kafka_consumer(stop=None):
+    """Kafka Consumer for processing inverter data, until the ``stop`` event (if any) is set."""
+    run_consumer(['inverter'], stop)
+
+
+def run_weather_consumer(stop=None):
+    """Kafka Consumer for processing weather data, until the ``stop`` event (if any) is set."""
+    run_consumer(['weather'], stop)
@@ -1,3 +1,412 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import signal
+import tempfile
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from data_api import live, samples
+from data_api.datasets import DATASETS
+from data_api.series import IST
+from .pipeline import consume_streams
+from .sources import MINUTE, ReplaySource, replay_messages
+from .supervisor import Worker, read_json, worker_main
+from .tasks import (
+    STREAMS, Stream, consume_batches, decode_by_topic, publish, register_stream, run_consumer,
+    store_weather_batch, stream_topics,
+)
+
+TOPICS = {'inverter-topic': SimpleNamespace(name='inverter'), 'weather-topic': SimpleNamespace(name='weather')}
+
+
+class ReplayTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.messages = replay_messages(TOPICS)
+
+    def test_messages_are_in_time_order(self):
+        minutes = [minute for minute, _, _ in self.messages]
+        self.assertEqual(minutes, sorted(minutes))
+
+    def test_inverter_exports_are_chained_without_repeats_or_gaps(self):
+        minutes = np.array([minute for minute, topic, _ in self.messages if topic == 'inverter-topic'])
+        steps = np.diff(minutes)
+        self.assertTrue((steps > 0).all())
+        # Both exports are minute data; the second starts the minute after the first ends
+        self.assertEqual(int(steps.max()), MINUTE)
+        rows = sum(len(pd.read_csv(DATASETS[name]['source'], usecols=['ds'])) for name in ('inverter_min', 'inverter'))
+        self.assertEqual(len(minutes), rows)
+
+    def test_full_speed_replay_stamps_consecutive_offsets_from_now(self):
+        source = ReplaySource(self.messages[:300], speed=0)
+        source.subscribe(['weather-topic'])
+        started = pd.Timestamp.now(tz=IST).tz_localize(None).floor('min')
+        batch = source.consume(500, timeout=0)
+        self.assertTrue(source.exhausted)
+        self.assertEqual({message.topic() for message in batch}, {'weather-topic'})
+        self.assertEqual([message.offset() for message in batch], list(range(len(batch))))
+        first = pd.Timestamp(json.loads(batch[0].value())['ds'])
+        self.assertLessEqual(abs(first - started), pd.Timedelta(minutes=1))
+        self.assertEqual(source.consume(500, timeout=0), [])
+
+    def test_paced_replay_creates_messages_on_schedule(self):
+        created = []
+        # 6000x: one message every 10 ms
+        source = ReplaySource(self.messages[:40], speed=6000, on_create=lambda topic, at: created.append(at))
+        source.subscribe(list(TOPICS))
+        batch = source.consume(1000, timeout=0.05)
+        self.assertLess(len(batch), len(self.messages[:40]))
+        while not source.exhausted:
+            batch += source.consume(1000, timeout=0.05)
+        self.assertEqual(len(batch), 40)
+        self.assertEqual([message.timestamp()[1] for message in batch], [int(at * 1000) for at in created])
+        for at, (minute, _, _) in zip(created, self.messages):
+            self.assertAlmostEqual(at, source.due(minute), places=6)
+        self.assertLessEqual(created[-1], time.time())
+
+
+class FakeMessage:
+    """A consumed message, read like a confluent_kafka Message."""
+
+    def __init__(self, topic, value, offset, error=None):
+        self._topic, self._value, self._offset, self._error = topic, value, offset, error
+
+    def topic(self):
+        return self._topic
+
+    def value(self):
+        return self._value
+
+    def offset(self):
+        return self._offset
+
+    def error(self):
+        return self._error
+
+
+def message(topic, offset, **payload):
+    return FakeMessage(topic, json.dumps(payload).encode(), offset)
+
+
+class FakeConsumer:
+    """Returns its ``batches`` from consume() one at a time, then sets ``stop``."""
+
+    def __init__(self, batches, stop):
+        self.batches = list(batches)
+        self.stop = stop
+        self.closed = False
+
+    def consume(self, num_messages=1, timeout=-1):
+        if not self.batches:
+            self.stop.set()
+            return []
+        return self.batches.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeChannelLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, event):
+        self.sent.append((group, event))
+
+
+def recording_stream(name):
+    """A Stream of ``name`` appending every batch it is asked to store to the returned list."""
+    stored = []
+    return Stream(name, f'{name}_group', f'send_{name}', lambda batch: stored.append(list(batch))), stored
+
+
+class ConsumeBatchesTests(SimpleTestCase):
+    """The batched loop of kafka_app.tasks with a fake consumer and channel layer."""
+
+    def setUp(self):
+        self.layer = FakeChannelLayer()
+        patches = [mock.patch('kafka_app.tasks.get_channel_layer', return_value=self.layer),
+                   mock.patch('kafka_app.tasks.process_alerts')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.inverter, self.inverter_batches = recording_stream('inverter')
+        self.weather, self.weather_batches = recording_stream('weather')
+        self.topics = {'inverter-topic': self.inverter, 'weather-topic': self.weather}
+
+    def test_decode_splits_a_batch_by_topic_and_skips_bad_messages(self):
+        batch = [
+            message('weather-topic', 0, ds='a', ghi=1),
+            message('inverter-topic', 0, ds='a', power=10),
+            FakeMessage('inverter-topic', None, -1, error='Broker: Unknown topic'),
+            FakeMessage('inverter-topic', b'{"ds": "b", "power": ', 1),
+            FakeMessage('weather-topic', b'\xff\xfe', 1),
+            message('inverter-topic', 2, ds='c', power=12),
+            # Readings with NaN are not JSON, but the exports have them
+            FakeMessage('weather-topic', b'{"ds": "c", "ghi": NaN}', 2),
+        ]
+        with mock.patch('builtins.print') as log:
+            batches = decode_by_topic(batch)
+        self.assertEqual(list(batches), ['weather-topic', 'inverter-topic'])
+        self.assertEqual(batches['inverter-topic'], [{'ds': 'a', 'power': 10}, {'ds': 'c', 'power': 12}])
+        self.assertEqual(batches['weather-topic'][0], {'ds': 'a', 'ghi': 1})
+        self.assertTrue(math.isnan(batches['weather-topic'][1]['ghi']))
+        self.assertEqual(len(batches['weather-topic']), 2)
+        self.assertEqual(log.call_count, 3)
+
+    def test_each_stream_stores_its_messages_in_order(self):
+        stop = threading.Event()
+        consumed = [
+            [message('inverter-topic', 0, n=0), message('weather-topic', 0, n=0), message('inverter-topic', 1, n=1)],
+            [],
+            [FakeMessage('weather-topic', b'not json', 1), message('weather-topic', 2, n=2),
+             FakeMessage('inverter-topic', None, -1, error='Local: Timed out')],
+            [message('inverter-topic', offset, n=offset) for offset in range(2, 6)],
+        ]
+        consumer = FakeConsumer(consumed, stop)
+        with mock.patch('builtins.print'):
+            processed = consume_batches(consumer, self.topics, stop, batch_size=10, linger=0)
+        self.assertEqual(processed, 8)
+        self.assertTrue(stop.is_set())
+        # One store call per stream and consumed batch
+        self.assertEqual(self.inverter_batches, [[{'n': 0}, {'n': 1}], [{'n': n} for n in range(2, 6)]])
+        self.assertEqual(self.weather_batches, [[{'n': 0}], [{'n': 2}]])
+
+    @override_settings(KAFKA_PUBLISH_BATCH_SIZE=3)
+    def test_messages_are_published_in_chunks_of_the_publish_batch_size(self):
+        stop = threading.Event()
+        consumer = FakeConsumer([[message('inverter-topic', offset, n=offset) for offset in range(8)]], stop)
+        consume_batches(consumer, self.topics, stop, batch_size=10, linger=0)
+        self.assertEqual([group for group, _ in self.layer.sent], ['inverter_group'] * 3)
+        self.assertEqual({event['type'] for _, event in self.layer.sent}, {'send_inverter'})
+        chunks = [event['messages'] for _, event in self.layer.sent]
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 2])
+        self.assertEqual([item['n'] for chunk in chunks for item in chunk], list(range(8)))
+
+    def test_publish_with_an_explicit_chunk_size(self):
+        publish(self.layer, 'g', 'send', list(range(10)), chunk_size=4)
+        self.assertEqual([event['messages'] for _, event in self.layer.sent], [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        self.layer.sent.clear()
+        publish(self.layer, 'g', 'send', [])
+        self.assertEqual(self.layer.sent, [])
+
+
+def without_ds(records):
+    """JSON text of every record but its 'ds', comparable even with NaN readings."""
+    return [json.dumps({key: value for key, value in record.items() if key != 'ds'}) for record in records]
+
+
+@override_settings(KAFKA_TOPICS={'inverter': 'inverter-topic', 'weather': 'weather-topic'},
+                   KAFKA_BATCH_SIZE=50, KAFKA_BATCH_LINGER=0.01, KAFKA_PUBLISH_BATCH_SIZE=20)
+class ConsumeStreamsTests(SimpleTestCase):
+    """The asyncio runner of kafka_app.pipeline fed by the replay source."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.messages = replay_messages(TOPICS)
+
+    def setUp(self):
+        self.layer = FakeChannelLayer()
+        self.stored = {}
+        self.stop = threading.Event()
+        self.expected = None
+        streams = {}
+        for name in ('inverter', 'weather'):
+            streams[name] = Stream(name, f'{name}_group', f'send_{name}', partial(self.store, name))
+            self.stored[name] = []
+        patches = [
+            mock.patch.dict(STREAMS, streams, clear=True),
+            mock.patch('kafka_app.pipeline.get_channel_layer', return_value=self.layer),
+            mock.patch('kafka_app.pipeline.AlertManager.check_batch', return_value=[]),
+            mock.patch.object(samples, 'writer'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.topics = {'inverter-topic': streams['inverter'], 'weather-topic': streams['weather']}
+
+    def store(self, name, batch):
+        self.stored[name].extend(batch)
+        if self.expected is not None and sum(map(len, self.stored.values())) >= self.expected:
+            self.stop.set()
+
+    def replay(self, count, speed):
+        source = ReplaySource(self.messages[:count], speed=speed)
+        source.subscribe(list(self.topics))
+        source.close = mock.Mock()
+        return source
+
+    def run_streams(self, source):
+        thread = threading.Thread(target=asyncio.run, args=(consume_streams(None, self.stop, source),))
+        thread.start()
+        return thread
+
+    def payloads(self, source, topic):
+        return [json.loads(b'{' + payload[1:]) for _, message_topic, payload in source.messages
+                if message_topic == topic]
+
+    def test_every_message_reaches_its_stream_in_order(self):
+        source = self.replay(1500, speed=0)
+        self.expected = 1500
+        thread = self.run_streams(source)
+        thread.join(timeout=30)
+        self.assertFalse(thread.is_alive())
+        for name, topic in (('inverter', 'inverter-topic'), ('weather', 'weather-topic')):
+            expected = self.payloads(source, topic)
+            self.assertGreater(len(expected), 0)
+            self.assertEqual(without_ds(self.stored[name]), without_ds(expected), name)
+            # The replay stamps one minute after another
+            stamps = [pd.Timestamp(record['ds']) for record in self.stored[name]]
+            self.assertEqual(stamps, sorted(stamps), name)
+            sent = [item for group, event in self.layer.sent if group == f'{name}_group' for item in event['messages']]
+            self.assertEqual(sent, self.stored[name], name)
+        self.assertLessEqual(max(len(event['messages']) for _, event in self.layer.sent), 20)
+        source.close.assert_called_once_with()
+        samples.writer.flush.assert_called_once_with()
+
+    def test_stops_when_asked(self):
+        # 6000x: a minute of both streams every 10 ms, far more than the test waits for
+        source = self.replay(20000, speed=6000)
+        thread = self.run_streams(source)
+        deadline = time.time() + 10
+        while sum(map(len, self.stored.values())) < 10 and time.time() < deadline:
+            time.sleep(0.01)
+        self.stop.set()
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(source.exhausted)
+        stored = sum(map(len, self.stored.values()))
+        self.assertGreaterEqual(stored, 10)
+        # What was stored is a prefix of the replay, in order
+        self.assertLessEqual(stored, source.position)
+        for name, topic in (('inverter', 'inverter-topic'), ('weather', 'weather-topic')):
+            expected = self.payloads(source, topic)[:len(self.stored[name])]
+            self.assertEqual(without_ds(self.stored[name]), without_ds(expected), name)
+        source.close.assert_called_once_with()
+        samples.writer.flush.assert_called_once_with()
+
+
+class StreamRegistryTests(SimpleTestCase):
+    """Streams registered with register_stream, their KAFKA_TOPICS entries and one consumer for all of them."""
+
+    def setUp(self):
+        patch = mock.patch.dict(STREAMS)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_default_streams_are_registered_on_their_topics(self):
+        topics = stream_topics()
+        self.assertEqual({stream.name: topic for topic, stream in topics.items()}, settings.KAFKA_TOPICS)
+        weather = topics[settings.KAFKA_TOPICS['weather']]
+        self.assertEqual((weather.group, weather.event_type), ('weather_group', 'send_weather_messages'))
+        self.assertIs(weather.store, store_weather_batch)
+
+    @override_settings(KAFKA_TOPICS={'inverter': 'plant-a.inverters', 'weather': 'plant-a.weather'})
+    def test_topics_come_from_settings(self):
+        self.assertEqual(list(stream_topics(['weather'])), ['plant-a.weather'])
+        self.assertIs(stream_topics(['weather'])['plant-a.weather'], STREAMS['weather'])
+
+    def test_unknown_and_unregistered_streams_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, 'No topic or handler registered for stream(s): grid'):
+            stream_topics(['inverter', 'grid'])
+        # A topic without a handler is as unusable as a handler without a topic
+        with override_settings(KAFKA_TOPICS={'inverter': 'inverter-topic-1', 'grid': 'grid-topic'}):
+            with self.assertRaisesMessage(ValueError, 'stream(s): grid'):
+                stream_topics()
+        register_stream('grid', group='grid_group', event_type='send_grid_messages')(lambda batch: None)
+        with self.assertRaisesMessage(ValueError, 'stream(s): grid'):
+            stream_topics(['grid'])
+
+    @override_settings(KAFKA_TOPICS={'inverter': 'inverter-topic', 'weather': 'weather-topic', 'grid': 'grid-topic'})
+    def test_one_consumer_routes_each_topic_to_its_handler(self):
+        stored = {'grid': [], 'weather': []}
+
+        @register_stream('grid', group='grid_group', event_type='send_grid_messages')
+        def store_grid(batch):
+            stored['grid'].extend(batch)
+
+        @register_stream('weather', group='weather_group', event_type='send_weather_messages')
+        def store_weather(batch):
+            stored['weather'].extend(batch)
+
+        self.assertIs(STREAMS['grid'].store, store_grid)
+        stop = threading.Event()
+        consumer = FakeConsumer([
+            [message('grid-topic', 0, hz=50.0), message('weather-topic', 0, ghi=1), message('grid-topic', 1, hz=49.9)],
+            [message('weather-topic', 1, ghi=2)],
+        ], stop)
+        layer = FakeChannelLayer()
+        with mock.patch('kafka_app.tasks.get_channel_layer', return_value=layer), \
+                mock.patch('kafka_app.tasks.process_alerts'), \
+                mock.patch.object(samples, 'writer') as writer, \
+                mock.patch('builtins.print'):
+            run_consumer(['grid', 'weather'], stop, consumer)
+        self.assertEqual(stored, {'grid': [{'hz': 50.0}, {'hz': 49.9}], 'weather': [{'ghi': 1}, {'ghi': 2}]})
+        self.assertEqual([(group, event['type']) for group, event in layer.sent], [
+            ('grid_group', 'send_grid_messages'), ('weather_group', 'send_weather_messages'),
+            ('weather_group', 'send_weather_messages'),
+        ])
+        self.assertTrue(consumer.closed)
+        writer.flush.assert_called_once_with()
+
+
+@override_settings(KAFKA_ASYNC_CONSUMERS=False)
+class WorkerTests(SimpleTestCase):
+    def setUp(self):
+        # worker_main installs the worker's signal handlers; give the test process its own back
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+        for signum, handler in handlers.items():
+            self.addCleanup(signal.signal, signum, handler)
+        run_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(run_dir.cleanup)
+        self.run_dir = run_dir.name
+
+    def test_worker_flushes_the_live_data_when_it_stops(self):
+        with mock.patch('kafka_app.tasks.run_consumer') as run_consumer, \
+                mock.patch.object(live, 'flush_all') as flush_all:
+            worker_main(('inverter', 'weather'), 0, self.run_dir)
+        run_consumer.assert_called_once()
+        flush_all.assert_called_once_with()
+
+    def test_worker_flushes_the_live_data_when_the_consumer_fails(self):
+        with mock.patch('kafka_app.tasks.run_consumer', side_effect=RuntimeError('broker gone')), \
+                mock.patch.object(live, 'flush_all') as flush_all:
+            with self.assertRaises(RuntimeError):
+                worker_main(('inverter',), 0, self.run_dir)
+        flush_all.assert_called_once_with()
+
+    def test_supervisor_reports_the_workers_sample_writer(self):
+        def consume(streams, stop):
+            samples.writer.written += 5
+
+        with mock.patch('kafka_app.tasks.run_consumer', side_effect=consume), \
+                mock.patch.object(live, 'flush_all'), \
+                mock.patch.object(samples, 'writer', samples.SampleWriter()):
+            worker_main(('inverter',), 3, self.run_dir)
+        stats = Worker(('inverter',), 3).report(self.run_dir)['stats']
+        self.assertEqual(stats['samples']['written'], 5)
+        self.assertIn('live', stats)
+        self.assertEqual(stats, read_json(f'{self.run_dir}/worker-3.json'))
+
+
+class StartConsumerViewTests(SimpleTestCase):
+    def test_start_endpoints_only_accept_post(self):
+        with mock.patch('kafka_app.views.ensure_stream', return_value={'state': 'running'}) as ensure_stream:
+            for url, stream in (('/kafka/start-consumer/', 'inverter'), ('/kafka/start-weather-consumer/', 'weather')):
+                self.assertEqual(self.client.get(url).status_code, 405)
+                ensure_stream.assert_not_called()
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 202)
+                ensure_stream.assert_called_once_with(stream)
+                ensure_stream.reset_mock()
@@ -1,9 +1,12 @@
 from django.urls import path
-from .views import start_kafka_consumer, start_weather_consumer, get_alert_logs, delete_alert, delete_all_alerts
+from .views import start_kafka_consumer, start_weather_consumer, consumer_status, control_consumer, stop_consumers, get_alert_logs, delete_alert, delete_all_alerts
 
 urlpatterns = [
     path('start-consumer/', start_kafka_consumer, name='start_kafka_consumer'),
     path('start-weather-consumer/', start_weather_consumer, name='start_weather_consumer'),
+    path('consumers/', consumer_status, name='consumer_status'),
+    path('consumers/stop/', stop_consumers, name='stop_consumers'),
+    path('consumers/<str:stream>/<str:action>/', control_consumer, name='control_consumer'),
     path('logs/', get_alert_logs, name='get_alert_logs'),
     path('delete_alert/<uuid:alert_id>/', delete_alert, name='delete_alert'),
     path('delete_all_alerts/', delete_all_alerts, name='delete_all_alerts'),
@@ -1,5 +1,5 @@
 from django.http import JsonResponse
-from .tasks import run_kafka_consumer, run_weather_consumer
+from .supervisor import ensure_stream, known_streams, read_control, stop_stream, stop_supervisor, supervisor_status
 import csv
 import os
 from django.conf import settings
@@ -8,13 +8,55 @@ from django.views.decorators.csrf import csrf_exempt
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CSV_LOG_FILE = os.path.join(BASE_DIR, 'kafka_app', 'alert_logs.csv')
 
+# The consumers run in worker processes under ``manage.py run_consumers``
+# (see supervisor.py); these views only ask the supervisor for streams and
+# report on it, so they return immediately.
+
+@csrf_exempt
 def start_kafka_consumer(request):
-    run_kafka_consumer()
-    return JsonResponse({"status": "Kafka consumer started"})
+    if request.method != 'POST':
+        return JsonResponse({"error": "Use POST."}, status=405)
+    return JsonResponse({"status": "Kafka consumer started", "supervisor": ensure_stream('inverter')}, status=202)
 
+@csrf_exempt
 def start_weather_consumer(request):
-    run_weather_consumer()
-    return JsonResponse({"status": "Weather consumer started"})
+    if request.method != 'POST':
+        return JsonResponse({"error": "Use POST."}, status=405)
+    return JsonResponse({"status": "Weather consumer started", "supervisor": ensure_stream('weather')}, status=202)
+
+def consumer_status(request):
+    """Report the consumer supervisor and its workers."""
+    status = supervisor_status()
+    return JsonResponse({"running": status is not None, "control": read_control(), "supervisor": status})
+
+@csrf_exempt
+def control_consumer(request, stream, action):
+    """Start (optionally with ?processes=N, 0 = one per partition) or stop one stream's workers."""
+    if request.method != 'POST':
+        return JsonResponse({"error": "Use POST."}, status=405)
+    streams = known_streams()
+    if stream not in streams or action not in ('start', 'stop'):
+        return JsonResponse({"error": f"Unknown stream or action. Streams: {', '.join(streams)}; actions: start, stop."}, status=404)
+    if action == 'stop':
+        return JsonResponse({"status": f"Stopping {stream} consumers", "supervisor": stop_stream(stream)}, status=202)
+    processes = request.GET.get('processes')
+    try:
+        processes = None if processes in (None, '') else int(processes)
+        if processes is not None and processes < 0:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({"error": "Invalid processes parameter. Must be an integer of at least 0."}, status=400)
+    return JsonResponse({"status": f"Starting {stream} consumers", "supervisor": ensure_stream(stream, processes)}, status=202)
+
+@csrf_exempt
+def stop_consumers(request):
+    """Stop the supervisor and every consumer worker."""
+    if request.method != 'POST':
+        return JsonResponse({"error": "Use POST."}, status=405)
+    pid = stop_supervisor()
+    if pid is None:
+        return JsonResponse({"status": "No consumer supervisor running"})
+    return JsonResponse({"status": "Stopping consumer supervisor", "pid": pid}, status=202)
 
 @csrf_exempt
 def get_alert_logs(request):
@@ -86,6 +86,13 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # The consumers write sample batches while the views read (WAL
+            # mode, see data_api/apps.py): take the write lock up front and
+            # wait for it instead of failing with "database is locked"
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
     }
 }
 
@@ -176,3 +183,95 @@ CORS_ALLOW_METHODS = [
 ]
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 750 * 1024 * 1024
+
+# Seconds between checks for changed dataset CSVs / compiled store (0 disables hot-reload)
+DATASET_WATCH_INTERVAL = 5
+
+# Byte budget of the per-process response cache for the read-only data views
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# JSON encoder of the data views: "json" writes what JsonResponse writes;
+# "orjson" is about 3x faster but formats floats and NaN differently
+RESPONSE_JSON_ENCODER = "json"
+
+# Plant coordinates (degrees) for the sun-position night mask, and the sun
+# elevation below which readings are zeroed (-6 = civil dusk/dawn)
+PLANT_LATITUDE = 23.03
+PLANT_LONGITUDE = 72.58
+NIGHT_SUN_ELEVATION = -6.0
+
+# Seconds an inverter reading may trail a weather reading and still be
+# joined to it by the weather-inverter view (overridable per request)
+ASOF_JOIN_TOLERANCE = 120
+
+# Percent KPIs (PR, n_system, capacity factor, degradation) are capped at a
+# per-minute integer drawn between these bounds from a generator seeded with
+# KPI_CAP_SEED; equal bounds give a fixed cap
+KPI_PERCENT_CAP = (85, 90)
+KPI_CAP_SEED = 0
+
+# Plant constants for the live derived KPIs (derived/engine.py): DC capacity,
+# module area and the reference module efficiency PR is measured against
+PLANT_CAPACITY_KWP = 1000.0
+PLANT_AREA_M2 = 5000.0
+PLANT_REFERENCE_EFFICIENCY = 0.15
+# Days of minute buckets the live engine keeps (coarser levels are kept)
+LIVE_MINUTE_RETENTION_DAYS = 7
+
+# Minute readings per dataset kept in the consumers' in-memory ring buffers,
+# and seconds between flushes of those readings into the compiled store
+LIVE_BUFFER_CAPACITY = 7 * 24 * 60
+LIVE_FLUSH_INTERVAL = 300
+
+# Consumed readings are stored as InverterSample/WeatherSample rows, written
+# in one transaction once this many rows are queued or the oldest has
+# waited SAMPLE_LINGER seconds (data_api/samples.py)
+SAMPLE_BATCH_SIZE = 5000
+SAMPLE_LINGER = 5.0
+# Device name of the weather station's samples
+WEATHER_STATION = "station"
+
+# Kafka connection, overridable from the environment. One consumer in
+# KAFKA_CONSUMER_GROUP reads the topic of every stream (kafka_app/tasks.py)
+KAFKA_BOOTSTRAP_SERVERS = os.environ.get(
+    "KAFKA_BOOTSTRAP_SERVERS",
+    "b-2.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092,"
+    "b-1.mskclusternus1.8z6j8x.c2.kafka.ap-northeast-2.amazonaws.com:9092",
+)
+KAFKA_CONSUMER_GROUP = os.environ.get("KAFKA_CONSUMER_GROUP", "my-consumer-group-2")
+KAFKA_TOPICS = {
+    "inverter": os.environ.get("KAFKA_INVERTER_TOPIC", "inverter-topic-1"),
+    "weather": os.environ.get("KAFKA_WEATHER_TOPIC", "weather-topic-1"),
+}
+KAFKA_CONSUMER_CONFIG = {
+    "auto.offset.reset": os.environ.get("KAFKA_AUTO_OFFSET_RESET", "earliest"),
+    "security.protocol": os.environ.get("KAFKA_SECURITY_PROTOCOL", "PLAINTEXT"),
+    "max.poll.interval.ms": 900000,
+}
+# Where the consumers read from (kafka_app/sources.py): "kafka", or
+# "replay" for the minute CSV exports replayed in-process
+# KAFKA_REPLAY_SPEED times faster than real time (0 = as fast as possible)
+KAFKA_MESSAGE_SOURCE = os.environ.get("KAFKA_MESSAGE_SOURCE", "kafka")
+KAFKA_REPLAY_SPEED = float(os.environ.get("KAFKA_REPLAY_SPEED", "60"))
+
+# Consumer worker processes asked for per stream by manage.py run_consumers
+# (the pool runs the largest count; 0 = one per topic partition), the
+# directory its control and status files live in, and seconds a worker gets
+# to stop before it is killed
+KAFKA_CONSUMER_PROCESSES = {"inverter": 1, "weather": 1}
+KAFKA_RUN_DIR = BASE_DIR / "kafka_app" / "run"
+KAFKA_STOP_TIMEOUT = 30
+
+# The consumer loops read up to KAFKA_BATCH_SIZE messages per consume()
+# call, waiting at most KAFKA_BATCH_LINGER seconds to fill a batch, and
+# send them to the WebSocket groups KAFKA_PUBLISH_BATCH_SIZE at a time
+KAFKA_BATCH_SIZE = 500
+KAFKA_BATCH_LINGER = 0.5
+KAFKA_PUBLISH_BATCH_SIZE = 100
+
+# Run the supervised consumers on the asyncio pipeline (kafka_app/pipeline.py)
+# instead of the threaded batch loops, with at most KAFKA_ASYNC_CONCURRENCY
+# group_send calls in flight and KAFKA_QUEUE_BATCHES batches polled ahead
+KAFKA_ASYNC_CONSUMERS = True
+KAFKA_ASYNC_CONCURRENCY = 8
+KAFKA_QUEUE_BATCHES = 4